@@ -0,0 +1,292 @@
+"""
+Drive every route in results/urls.py in-process against a seeded election
+and record latency percentiles, queries per request and peak memory.
+
+    python benchmarks/bench_endpoints.py [--districts 20 --stations 20] [--requests 50]
+                                         [--output run.json] [--compare previous.json]
+
+The dataset comes from ``manage.py seed_election``; the JSON output keeps
+the dataset size and git revision so runs can be compared over time.
+Write routes (upload, verify, claim, agent creation…) get fresh input on
+every request, so each call does real work.
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import warnings
+
+from common import BACKEND, setup_django
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def png(seed):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 96), ((seed * 7) % 256, (seed * 13) % 256, (seed // 256) % 256)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def build_routes(admin, agent):
+    """``{pattern: (method, user, request factory)}``; factories return ``(url, data, format)``."""
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from results import moderation, resumable
+    from results.models import DRForm, PollingStation, RegionTally
+
+    station = PollingStation.objects.filter(station_id__startswith='SYN-').order_by('id').first()
+    district = RegionTally.objects.filter(level=RegionTally.DISTRICT).values_list('name', flat=True).first()
+    constituency = RegionTally.objects.filter(level=RegionTally.CONSTITUENCY).values_list('name', flat=True).first()
+    pending = iter(DRForm.objects.filter(verified=False).order_by('id').values_list('id', flat=True))
+    # Once the pending forms run out, keep verifying (already verified) ones
+    fallback = DRForm.objects.order_by('id').values_list('id', flat=True).first()
+    station_form = DRForm.objects.filter(polling_station=station).values_list('id', flat=True).first()
+    refresh = str(RefreshToken.for_user(admin))
+    counter = itertools.count()
+
+    def get(url):
+        return lambda: (url, None, None)
+
+    def upload():
+        data = png(next(counter))
+        return '/api/drforms/upload/', {
+            'polling_station': station.station_id, 'totals': '{"NUP": 10, "NRM": 7}',
+            'sha256_hash': hashlib.sha256(data).hexdigest(),
+            'image': _file('form.png', data),
+        }, 'multipart'
+
+    def sync_batch():
+        data, manifest = {}, []
+        for _ in range(5):
+            n = next(counter)
+            data[f'scan{n}.png'] = _file(f'scan{n}.png', png(n))
+            manifest.append({'key': f'bench-{n}', 'polling_station': station.station_id,
+                             'file': f'scan{n}.png', 'totals': {'NUP': n, 'NRM': 1}})
+        data['manifest'] = json.dumps(manifest)
+        return '/api/drforms/sync/', data, 'multipart'
+
+    def resumable_upload():
+        # Creating the session is setup; the timed PATCH sends the whole scan and creates the form
+        data = png(next(counter))
+        session = resumable.create_session(agent, len(data), {'polling_station': station.station_id})
+        return f'/api/drforms/uploads/{session.pk}/', data, 'offset'
+
+    def new_agent():
+        n = next(counter)
+        return {'full_name': f'Bench Agent {n}', 'phone': '0700000000', 'email': f'bench{n}@example.com',
+                'district': station.district, 'constituency': station.constituency, 'polling_station': station.name}
+
+    def claim_then_release():
+        # The claim is setup, not part of the timed request
+        pks, _ = moderation.claim_forms(agent, 20)
+        return '/api/moderation/release/', {'ids': pks}, 'json'
+
+    return {
+        'token/': ('POST', None, lambda: ('/api/token/', {'username': 'bench-admin', 'password': 'bench'}, 'json')),
+        'token/refresh/': ('POST', None, lambda: ('/api/token/refresh/', {'refresh': refresh}, 'json')),
+        'agents/create/': ('POST', admin, lambda: ('/api/agents/create/', new_agent(), 'json')),
+        'agents/bulk/': ('POST', admin, lambda: ('/api/agents/bulk/', {'agents': [
+            dict(new_agent(), polling_station=station.station_id) for _ in range(5)
+        ]}, 'json')),
+        'user/': ('GET', admin, get('/api/user/')),
+        'api/pollingstations/': ('GET', admin, get('/api/api/pollingstations/')),
+        'drforms/': ('GET', admin, get('/api/drforms/')),
+        'pollingstations/': ('GET', admin, get('/api/pollingstations/')),
+        'drforms/upload/': ('POST', agent, upload),
+        'drforms/sync/': ('POST', agent, sync_batch),
+        'drforms/uploads/': ('POST', agent, lambda: ('/api/drforms/uploads/', {
+            'length': 4096, 'polling_station': station.station_id}, 'json')),
+        'drforms/uploads/<uuid:pk>/': ('PATCH', agent, resumable_upload),
+        'pending/': ('GET', admin, get('/api/pending/')),
+        'drforms/<int:pk>/verify/': ('POST', admin, lambda: (f'/api/drforms/{next(pending, fallback)}/verify/', None, 'json')),
+        'drforms/verify/': ('POST', admin, lambda: ('/api/drforms/verify/', {'ids': list(itertools.islice(pending, 20)) or [fallback]}, 'json')),
+        'moderation/claim/': ('POST', admin, lambda: ('/api/moderation/claim/', {'limit': 20}, 'json')),
+        'moderation/release/': ('POST', agent, claim_then_release),
+        'moderation/stats/': ('GET', admin, get('/api/moderation/stats/')),
+        'conflicts/': ('GET', admin, get('/api/conflicts/')),
+        'conflicts/<str:station_id>/resolve/': ('POST', admin, lambda: (
+            f'/api/conflicts/{station.station_id}/resolve/', {'canonical': station_form}, 'json')),
+        'verified/': ('GET', admin, get('/api/verified/')),
+        'drforms/public/': ('GET', None, get('/api/drforms/public/')),
+        'public_feed/': ('GET', None, get('/api/public_feed/')),
+        'users/': ('GET', admin, get('/api/users/')),
+        'reports/': ('GET', admin, get('/api/reports/')),
+        'agents/register/': ('POST', admin, lambda: ('/api/agents/register/', {
+            'username': f'self{next(counter)}', 'password': 'pw', 'polling_station': station.pk}, 'json')),
+        'agents/': ('GET', admin, get('/api/agents/')),
+        'polling_stations/': ('GET', admin, get('/api/polling_stations/')),
+        'nup/news/': ('GET', None, get('/api/nup/news/')),
+        'results/summary/': ('GET', None, get('/api/results/summary/')),
+        'results/national/': ('GET', None, get('/api/results/national/')),
+        'results/district/<str:name>/': ('GET', None, get(f'/api/results/district/{district}/')),
+        'results/constituency/<str:name>/': ('GET', None, get(f'/api/results/constituency/{constituency}/')),
+        'results/station/<str:station_id>/': ('GET', None, get(f'/api/results/station/{station.station_id}/')),
+        'results/tree/': ('GET', None, get('/api/results/tree/')),
+        'results/live/': ('GET', None, get('/api/results/live/')),
+        'results/export/': ('GET', None, get('/api/results/export/?format=ndjson')),
+        '_metrics': ('GET', None, get('/api/_metrics')),
+    }
+
+
+def _file(name, data):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    return SimpleUploadedFile(name, data, 'image/png')
+
+
+def drive(client, method, factory):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    url, data, fmt = factory()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        if method == 'GET':
+            response = client.get(url)
+        elif method == 'PATCH':
+            response = client.generic('PATCH', url, data, content_type='application/offset+octet-stream',
+                                      HTTP_UPLOAD_OFFSET='0')
+        else:
+            response = client.post(url, data, format=fmt)
+        if response.streaming:
+            # Time (and measure memory over) the whole body, not just the headers
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+    return response.status_code, elapsed, len(queries)
+
+
+def run(requests, warmup):
+    from django.conf import settings
+    from django.db import reset_queries
+    from rest_framework.test import APIClient
+    from results import urls
+    from results.models import User
+
+    admin = User.objects.create_user(username='bench-admin', password='bench', is_staff=True)
+    # Also staff, so the release route can be driven with leases of its own
+    agent = User.objects.filter(is_agent=True).first()
+    User.objects.filter(pk=agent.pk).update(is_staff=True)
+    agent.refresh_from_db()
+    routes = build_routes(admin, agent)
+    # The scrape endpoint is refused without a token outside DEBUG
+    settings.METRICS_TOKEN = settings.METRICS_TOKEN or 'bench'
+
+    report = {}
+    for pattern in urls.urlpatterns:
+        route = str(pattern.pattern)
+        if route not in routes:
+            print(f"{route:38} not driven (add it to build_routes)")
+            continue
+        method, user, factory = routes[route]
+        # Record a failing route's 500 instead of aborting the run
+        client = APIClient(raise_request_exception=False)
+        if user:
+            client.force_authenticate(user)
+        if route == '_metrics':
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {settings.METRICS_TOKEN}')
+
+        for _ in range(warmup):
+            drive(client, method, factory)
+        timings, query_counts, statuses = [], [], set()
+        for _ in range(requests):
+            reset_queries()
+            status, elapsed, count = drive(client, method, factory)
+            timings.append(elapsed)
+            query_counts.append(count)
+            statuses.add(status)
+
+        tracemalloc.start()
+        drive(client, method, factory)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings.sort()
+        report[route] = {
+            'method': method,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'queries': statistics.median(query_counts),
+            'max_queries': max(query_counts),
+            'peak_kb': round(peak / 1024, 1),
+        }
+        row = report[route]
+        print(f"{method:5} {route:38} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f} ms "
+              f"{row['queries']:5g} q {row['peak_kb']:9.1f} KiB  {row['status']}")
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)['routes']
+    print(f"\nchange in p50 / p95 / queries vs {previous_path}:")
+    for route, row in report.items():
+        old = previous.get(route)
+        if not old:
+            continue
+        print(f"{route:38} {row['p50_ms'] - old['p50_ms']:+8.2f} {row['p95_ms'] - old['p95_ms']:+8.2f} ms "
+              f"{row['queries'] - old['queries']:+5g} q")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--districts', type=int, default=20)
+    parser.add_argument('--constituencies', type=int, default=3)
+    parser.add_argument('--stations', type=int, default=20, help="Per constituency.")
+    parser.add_argument('--forms', type=int, default=1, help="DR forms per station.")
+    parser.add_argument('--requests', type=int, default=50, help="Timed requests per route.")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON here.")
+    parser.add_argument('--compare', help="A previous --output file to diff against.")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # Expected 4xx/5xx and pagination warnings would drown the table
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    warnings.simplefilter('ignore')
+    dataset = {key: getattr(args, key) for key in ('districts', 'constituencies', 'stations', 'forms')}
+    call_command('seed_election', **dataset, stdout=io.StringIO())
+    print(f"{'':5} {'route':38} {'p50':>8} {'p95':>8} {'p99':>8}")
+    report = run(args.requests, args.warmup)
+
+    result = {
+        'revision': git_revision(),
+        'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'dataset': dataset,
+        'requests': args.requests,
+        'routes': report,
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(result, out, indent=2)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
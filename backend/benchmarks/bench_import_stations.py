@@ -0,0 +1,58 @@
+"""
+Time `manage.py import_stations` on a synthetic national register.
+
+Imports N stations into an empty scratch database, then re-imports the same
+file with 10% of the rows changed (the upsert path).
+
+    python benchmarks/bench_import_stations.py [--stations 50000] [--batch-size 2000]
+"""
+import argparse
+import csv
+import io
+import os
+import time
+
+from common import setup_django
+
+
+def write_register(path, count, changed_every=None):
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(['station_id', 'name', 'district', 'constituency', 'location'])
+        for n in range(count):
+            suffix = ' (moved)' if changed_every and n % changed_every == 0 else ''
+            writer.writerow([
+                f'PS-{n:06d}',
+                f'Polling Station {n}{suffix}',
+                f'District {n % 146}',
+                f'Constituency {n % 529}',
+                f'Parish {n % 7000}',
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stations', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = setup_django()
+    from django.core.management import call_command
+    from results.models import PollingStation
+
+    fresh = os.path.join(workdir, 'register.csv')
+    changed = os.path.join(workdir, 'register_changed.csv')
+    write_register(fresh, args.stations)
+    write_register(changed, args.stations, changed_every=10)
+
+    for label, path in (('initial import', fresh), ('re-import, 10% changed', changed)):
+        start = time.perf_counter()
+        call_command('import_stations', path, batch_size=args.batch_size, stdout=io.StringIO())
+        elapsed = time.perf_counter() - start
+        print(f"{label:24} {args.stations} rows in {elapsed:6.2f}s ({args.stations / elapsed:,.0f} rows/s)")
+
+    assert PollingStation.objects.count() == args.stations
+
+
+if __name__ == '__main__':
+    main()
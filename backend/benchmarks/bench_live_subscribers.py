@@ -0,0 +1,83 @@
+"""
+Load-test the live results hub with many idle SSE subscribers.
+
+Opens N ``hub.stream()`` readers in one event loop, reports the memory held
+per connected subscriber and how long one broadcast takes to reach them all.
+
+    python benchmarks/bench_live_subscribers.py [--subscribers 5000] [--broadcasts 20]
+"""
+import argparse
+import asyncio
+import gc
+import statistics
+import time
+import tracemalloc
+
+from common import setup_django
+
+
+async def run(subscribers, broadcasts):
+    from results import live
+
+    hub = live.LiveHub(poll_interval=None)
+    received = 0
+    all_seen = asyncio.Event()
+
+    async def reader(ready):
+        nonlocal received
+        stream = hub.stream()
+        await stream.__anext__()  # retry
+        await stream.__anext__()  # snapshot
+        ready.release()
+        async for _chunk in stream:
+            received += 1
+            if received == subscribers:
+                all_seen.set()
+
+    await hub.snapshot()
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    ready = asyncio.Semaphore(0)
+    tasks = [asyncio.create_task(reader(ready)) for _ in range(subscribers)]
+    for _ in range(subscribers):
+        await ready.acquire()
+    held = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    latencies = []
+    for n in range(broadcasts):
+        received = 0
+        all_seen.clear()
+        chunk = live.encode_event('tally', {'totals': {'NUP': n, 'NRM': n}, 'delta': {}})
+        start = time.perf_counter()
+        hub.broadcast(chunk)
+        await all_seen.wait()
+        latencies.append(time.perf_counter() - start)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert not hub.subscribers
+    return held, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--broadcasts', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    held, latencies = asyncio.run(run(args.subscribers, args.broadcasts))
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"subscribers            {args.subscribers}")
+    print(f"memory per subscriber  {held / args.subscribers / 1024:6.1f} KiB ({held / 2**20:.1f} MiB total)")
+    print(f"fan-out to all         median {statistics.median(latencies) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+EXPLAIN plans and latencies of the hot read queries, before and after the
+access-path indexes (migration 0010).
+
+Seeds N DR forms (default 500k, ~20% pending) into a scratch database at
+the current schema, drops the indexes 0010 added, runs every query, builds
+those indexes again and runs the queries once more.
+
+    python benchmarks/bench_query_plans.py [--forms 500000] [--stations 30000] [--agents 2000]
+                                           [--repeat 20] [--json plans.json]
+"""
+import argparse
+import importlib
+import json
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from common import setup_django
+
+ACCESS_PATH_MIGRATION = 'results.migrations.0010_access_path_indexes'
+
+
+def access_path_indexes():
+    """``[(model, index)]`` added by 0010 that the current models still declare."""
+    from django.apps import apps
+
+    migration = importlib.import_module(ACCESS_PATH_MIGRATION).Migration
+    found = []
+    for operation in migration.operations:
+        model = apps.get_model('results', operation.model_name)
+        for index in model._meta.indexes:
+            if index.name == operation.index.name:
+                found.append((model, index))
+    return found
+
+
+def seed(forms, stations, agents, batch=20000):
+    from django.utils import timezone
+    from results.models import Agent, DRForm, PollingStation, Result, User
+
+    rng = random.Random(42)
+    PollingStation.objects.bulk_create(
+        PollingStation(station_id=f'PS-{n:06d}', name=f'Station {n}', district=f'District {n % 146}',
+                       constituency=f'Constituency {n % 529}')
+        for n in range(stations)
+    )
+    station_ids = list(PollingStation.objects.values_list('id', flat=True))
+    users = User.objects.bulk_create(User(username=f'agent{n}') for n in range(agents))
+    Agent.objects.bulk_create(
+        Agent(user=user, full_name=user.username, phone='0700', email=f'{user.username}@example.com',
+              district=f'District {n % 146}', constituency='C',
+              polling_station_id=station_ids[n % len(station_ids)])
+        for n, user in enumerate(users)
+    )
+    Result.objects.bulk_create(
+        Result(polling_station_id=station, party=party, votes=rng.randrange(500))
+        for station in station_ids for party in ('NUP', 'NRM')
+    )
+
+    start = timezone.now() - timedelta(days=2)
+    with explicit_timestamps(DRForm):
+        for offset in range(0, forms, batch):
+            DRForm.objects.bulk_create(
+                DRForm(
+                    polling_station_id=station_ids[n % len(station_ids)], image=f'dr_forms/{n}.png',
+                    sha256_hash=f'{n:064x}', totals={'NUP': n % 400, 'NRM': n % 300},
+                    verified=rng.random() < 0.8, uploaded_by=users[n % len(users)],
+                    timestamp=start + timedelta(seconds=n * 0.3),
+                    created_at=start + timedelta(seconds=n * 0.3),
+                    updated_at=start + timedelta(seconds=n * 0.3),
+                )
+                for n in range(offset, min(forms, offset + batch))
+            )
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let bulk_create keep the given auto_now/auto_now_add values."""
+    fields = [f for f in model._meta.concrete_fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def queries():
+    """Query shapes taken from views.py, pagination.py, live.py and caching.py."""
+    from django.db.models import Max, Q
+    from results.models import Agent, DRForm, Result
+
+    feed = DRForm.objects.filter(verified=True).select_related('polling_station', 'verified_by')
+    pending = DRForm.objects.filter(verified=False).select_related('polling_station', 'uploaded_by', 'verified_by')
+    verified = DRForm.objects.filter(verified=True).count()
+    middle = DRForm.objects.filter(verified=True).order_by('-timestamp', '-id').values_list('timestamp', 'id')[
+        min(5000, verified // 2)
+    ]
+    newest = DRForm.objects.order_by('-updated_at').values_list('updated_at', 'id').first()
+    station = DRForm.objects.values_list('polling_station_id', flat=True).first()
+    digest = DRForm.objects.values_list('sha256_hash', flat=True).last()
+    return {
+        'public feed, first page': feed.order_by('-timestamp', '-id')[:21],
+        'public feed, keyset page': feed.filter(
+            Q(timestamp__lt=middle[0]) | Q(timestamp=middle[0], id__lt=middle[1])
+        ).order_by('-timestamp', '-id')[:21],
+        'pending queue, first page': pending.order_by('-timestamp', '-id')[:51],
+        'pending queue, count': DRForm.objects.filter(verified=False).only('id'),
+        'live results cursor': DRForm.objects.filter(verified=True).filter(
+            Q(updated_at__gt=newest[0] - timedelta(seconds=30))
+        ).order_by('updated_at', 'id')[:50],
+        'feed cache validator, newest': DRForm.objects.filter(verified=True).order_by(),
+        'feed cache validator, count': DRForm.objects.filter(verified=True).order_by(),
+        'verified forms of a station': DRForm.objects.filter(polling_station_id=station, verified=True),
+        'duplicate upload by hash': DRForm.objects.filter(sha256_hash=digest)[:1],
+        'station results by party': Result.objects.filter(polling_station_id=station, party='NUP'),
+        'agents in a district': Agent.objects.filter(district='District 7'),
+    }, {
+        'pending queue, count': lambda qs: qs.count(),
+        'feed cache validator, newest': lambda qs: qs.aggregate(latest=Max('updated_at')),
+        'feed cache validator, count': lambda qs: qs.count(),
+    }
+
+
+def explain(queryset, runner):
+    """Plan of the SQL that ``runner(queryset)`` actually executes."""
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    reset_queries()  # the DEBUG query log is bounded; start from empty
+    with CaptureQueriesContext(connection) as captured:
+        runner(queryset.all())
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + captured.captured_queries[-1]['sql'])
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def measure(repeat):
+    found, runners = queries()
+    report = {}
+    for label, queryset in found.items():
+        runner = runners.get(label, list)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            runner(queryset.all())
+            timings.append(time.perf_counter() - start)
+        report[label] = {
+            'plan': explain(queryset, runner),
+            'median_ms': statistics.median(timings) * 1000,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--forms', type=int, default=500000)
+    parser.add_argument('--stations', type=int, default=30000)
+    parser.add_argument('--agents', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='write plans and timings to this file')
+    args = parser.parse_args()
+
+    if min(args.forms, args.stations, args.agents) < 1:
+        parser.error("--forms, --stations and --agents must be at least 1")
+
+    setup_django()
+    from django.db import connection
+
+    start = time.perf_counter()
+    seed(args.forms, args.stations, args.agents)
+    indexes = access_path_indexes()
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f"seeded {args.forms} forms in {time.perf_counter() - start:.1f}s\n")
+
+    before = measure(args.repeat)
+    start = time.perf_counter()
+    with connection.schema_editor() as editor:
+        for model, index in indexes:
+            editor.add_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    print(f"built indexes in {time.perf_counter() - start:.1f}s\n")
+    after = measure(args.repeat)
+
+    for label in before:
+        print(f"{label}: {before[label]['median_ms']:8.2f} ms -> {after[label]['median_ms']:8.2f} ms")
+        print(f"    before: {' / '.join(before[label]['plan'])}")
+        print(f"    after:  {' / '.join(after[label]['plan'])}")
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump({'forms': args.forms, 'before': before, 'after': after}, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Upload throughput under write contention, with public feed reads running
+in parallel, for SQLite as tuned in settings plus WAL and persistent
+connections ("tuned": synchronous=NORMAL, mmap, IMMEDIATE transactions,
+busy timeout) against Django's stock SQLite setup ("stock").
+
+    python benchmarks/bench_sqlite_contention.py [--writers 4 --readers 4] [--seconds 10]
+
+Each profile gets a fresh seeded database; writers and readers are separate
+processes driving the API in-process, like gunicorn workers would.
+"""
+import argparse
+import hashlib
+import itertools
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from bench_endpoints import percentile, png
+from common import setup_django
+
+PROFILES = {
+    'stock': {
+        'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_TRANSACTION_MODE': 'DEFERRED', 'SQLITE_BUSY_TIMEOUT': '5', 'DB_CONN_MAX_AGE': '0',
+    },
+    'tuned': {'SQLITE_JOURNAL_MODE': 'WAL', 'DB_CONN_MAX_AGE': '60'},
+}
+TUNING_VARIABLES = sorted(set(PROFILES['stock']) | set(PROFILES['tuned']))
+
+
+def configure(profile, db_path, media_root, migrate=False):
+    for name in TUNING_VARIABLES:
+        os.environ.pop(name, None)
+    os.environ.update(PROFILES[profile])
+    os.environ['JOBS_EAGER'] = '0'
+    setup_django(db_path=db_path, media_root=media_root, migrate=migrate)
+    from django.conf import settings
+    # Query logging would grow with every request
+    settings.DEBUG = False
+
+
+def prepare(profile, db_path, media_root, stations):
+    configure(profile, db_path, media_root, migrate=True)
+    import io
+    from django.core.management import call_command
+    from results.models import DRForm
+
+    call_command('seed_election', districts=max(1, stations // 60), constituencies=3, stations=20,
+                 forms=1, stdout=io.StringIO())
+    DRForm.objects.update(verified=True)
+
+
+def worker(role, number, profile, db_path, media_root, start, deadline, results):
+    configure(profile, db_path, media_root)
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from rest_framework.test import APIClient
+    from results.models import PollingStation, User
+
+    client = APIClient(raise_request_exception=False)
+    agent = User.objects.filter(is_agent=True).order_by('id')[number % User.objects.filter(is_agent=True).count()]
+    client.force_authenticate(agent)
+    stations = list(PollingStation.objects.values_list('station_id', flat=True)[:200])
+    counter = itertools.count(number * 1_000_000)
+
+    def request():
+        if role == 'read':
+            return client.get('/api/drforms/public/')
+        n = next(counter)
+        data = png(n)
+        return client.post('/api/drforms/upload/', {
+            'polling_station': stations[n % len(stations)], 'totals': '{"NUP": 10, "NRM": 7}',
+            'sha256_hash': hashlib.sha256(data).hexdigest(), 'image': SimpleUploadedFile('form.png', data, 'image/png'),
+        }, format='multipart')
+
+    request()  # warm up (imports, connection) before the clock starts
+    start.wait()
+    timings, errors = [], 0
+    while time.time() < deadline.value:
+        began = time.perf_counter()
+        response = request()
+        timings.append(time.perf_counter() - began)
+        if response.status_code >= 400:
+            errors += 1
+    results.put((role, timings, errors))
+
+
+def run(profile, writers, readers, seconds, stations):
+    workdir = tempfile.mkdtemp(prefix=f'nup-contention-{profile}-')
+    db_path, media_root = os.path.join(workdir, 'bench.sqlite3'), os.path.join(workdir, 'media')
+    context = multiprocessing.get_context('spawn')
+    seed = context.Process(target=prepare, args=(profile, db_path, media_root, stations))
+    seed.start()
+    seed.join()
+
+    start, results = context.Event(), context.Queue()
+    deadline = context.Value('d', 0.0)
+    processes = [
+        context.Process(target=worker, args=(role, n, profile, db_path, media_root, start, deadline, results))
+        for role, count in (('write', writers), ('read', readers)) for n in range(count)
+    ]
+    for process in processes:
+        process.start()
+    # Let every process finish setting up before the timed window opens
+    time.sleep(3 + 0.5 * len(processes))
+    deadline.value = time.time() + seconds
+    start.set()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ('write', 'read'):
+        timings = sorted(t for r, ts, _ in collected if r == role for t in ts)
+        errors = sum(e for r, _, e in collected if r == role)
+        summary[role] = {
+            'per_second': len(timings) / seconds,
+            'p50_ms': statistics.median(timings) * 1000 if timings else 0,
+            'p95_ms': percentile(timings, 95) * 1000 if timings else 0,
+            'errors': errors,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4, help="Processes uploading DR forms.")
+    parser.add_argument('--readers', type=int, default=4, help="Processes reading the public feed.")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--stations', type=int, default=600, help="Seeded polling stations (roughly).")
+    parser.add_argument('--profiles', default='stock,tuned')
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:.0f}s per profile\n")
+    print(f"{'profile':8} {'uploads/s':>10} {'p50':>8} {'p95':>8} {'errors':>7}   {'reads/s':>8} {'p50':>8} {'p95':>8}")
+    for profile in args.profiles.split(','):
+        s = run(profile, args.writers, args.readers, args.seconds, args.stations)
+        w, r = s['write'], s['read']
+        print(f"{profile:8} {w['per_second']:10.1f} {w['p50_ms']:6.1f}ms {w['p95_ms']:6.1f}ms {w['errors']:7d}"
+              f"   {r['per_second']:8.1f} {r['p50_ms']:6.1f}ms {r['p95_ms']:6.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
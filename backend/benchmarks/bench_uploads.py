@@ -0,0 +1,114 @@
+"""
+Compare the default upload path with results.uploads.HashingUploadHandler.
+
+Each run parses a multipart body (a 10 MB image or a 50 MB video) from disk,
+hashes the file and saves it to storage, in a fresh subprocess so peak RSS
+is measured per run.
+
+    python benchmarks/bench_uploads.py [--runs 3]
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import setup_django
+
+BOUNDARY = 'benchboundary'
+MB = 1024 * 1024
+
+
+def build_body(path, field, filename, size):
+    with open(path, 'wb') as out:
+        out.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="polling_station"\r\n\r\nPS-1\r\n'.encode())
+        out.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+        )
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(MB, remaining))
+            out.write(chunk)
+            remaining -= len(chunk)
+        out.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+
+
+def run_once(mode, body_path, field, media_root):
+    setup_django(media_root=media_root, migrate=False)
+
+    from django.core.files.storage import FileSystemStorage
+    from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+    from django.http.multipartparser import MultiPartParser
+    from results.uploads import HashingUploadHandler, file_sha256
+
+    storage = FileSystemStorage(location=media_root)
+    size = os.path.getsize(body_path)
+    meta = {
+        'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+        'CONTENT_LENGTH': str(size),
+    }
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(body_path, 'rb') as stream:
+        if mode == 'streaming':
+            handlers = [HashingUploadHandler()]
+        else:
+            handlers = [MemoryFileUploadHandler(), TemporaryFileUploadHandler()]
+        _, files = MultiPartParser(meta, stream, handlers).parse()
+        uploaded = files[field]
+        if mode == 'streaming':
+            digest = file_sha256(uploaded)
+        else:
+            sha256 = hashlib.sha256()
+            for chunk in uploaded.chunks():
+                sha256.update(chunk)
+            digest = sha256.hexdigest()
+        storage.save(f'dr_forms/{mode}_{field}', uploaded)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': rss_after / 1024,
+        'rss_growth_mb': (rss_after - rss_before) / 1024,
+        'sha256': digest,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    cases = [('image', 'form.png', 10 * MB), ('video', 'clip.mp4', 50 * MB)]
+    with tempfile.TemporaryDirectory() as workdir:
+        for field, filename, size in cases:
+            body = os.path.join(workdir, f'{field}.body')
+            build_body(body, field, filename, size)
+            for mode in ('default', 'streaming'):
+                samples = []
+                for _ in range(args.runs):
+                    media_root = tempfile.mkdtemp(dir=workdir)
+                    out = subprocess.run(
+                        [sys.executable, __file__, '--child', mode, body, field, media_root],
+                        check=True, capture_output=True, text=True,
+                    ).stdout
+                    samples.append(json.loads(out.strip().splitlines()[-1]))
+                best = min(samples, key=lambda s: s['seconds'])
+                print(
+                    f"{field:5} {size // MB:3d}MB {mode:9}  "
+                    f"latency {best['seconds'] * 1000:8.1f} ms  "
+                    f"peak RSS {max(s['peak_rss_mb'] for s in samples):6.1f} MB  "
+                    f"(+{max(s['rss_growth_mb'] for s in samples):.1f} MB during upload)"
+                )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_once(*sys.argv[2:6])
+    else:
+        main()
@@ -0,0 +1,118 @@
+"""
+Vote sums from DRForm.totals JSON (parsed in Python) against SUM … GROUP BY
+over the typed Result rows (results.votes), on a seeded election.
+
+    python benchmarks/bench_vote_sums.py [--districts 40 --stations 50 --forms 2] [--repeat 5]
+
+Both sides must produce the same numbers; the script stops if they differ.
+"""
+import argparse
+import io
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from common import setup_django
+
+
+def json_national():
+    from results.models import DRForm
+    from results.tallies import parse_totals
+
+    totals = Counter()
+    for form_totals in DRForm.objects.values_list('totals', flat=True).iterator(chunk_size=2000):
+        totals.update(parse_totals(form_totals))
+    return dict(totals)
+
+
+def sql_national():
+    from results.models import Result
+    from results.votes import party_totals
+
+    return party_totals(Result.objects.filter(dr_form__isnull=False))
+
+
+def json_canonical():
+    from results.conflicts import canonical_snapshots
+
+    totals = Counter()
+    for counted in canonical_snapshots():
+        totals.update(counted['votes'])
+    return dict(totals)
+
+
+def sql_canonical():
+    from results.votes import party_totals
+
+    return party_totals()
+
+
+def json_districts():
+    from results.models import DRForm
+    from results.tallies import parse_totals
+
+    totals = defaultdict(Counter)
+    rows = DRForm.objects.values_list('polling_station__district', 'totals').iterator(chunk_size=2000)
+    for district, form_totals in rows:
+        totals[district].update(parse_totals(form_totals))
+    return {district: dict(votes) for district, votes in totals.items()}
+
+
+def sql_districts():
+    from django.db.models import Sum
+    from results.models import Result
+
+    totals = defaultdict(dict)
+    rows = (
+        Result.objects.filter(dr_form__isnull=False).order_by()
+        .values_list('polling_station__district', 'party').annotate(total=Sum('votes'))
+        .values_list('polling_station__district', 'party', 'total')
+    )
+    for district, party, votes in rows:
+        totals[district][party] = votes
+    return dict(totals)
+
+
+CASES = [
+    ('national, every form', json_national, sql_national),
+    ('national, canonical forms', json_canonical, sql_canonical),
+    ('per district', json_districts, sql_districts),
+]
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--districts', type=int, default=40)
+    parser.add_argument('--constituencies', type=int, default=3)
+    parser.add_argument('--stations', type=int, default=50, help="Per constituency.")
+    parser.add_argument('--forms', type=int, default=2, help="DR forms per station.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from results.models import DRForm, Result
+
+    call_command('seed_election', districts=args.districts, constituencies=args.constituencies,
+                 stations=args.stations, forms=args.forms, stdout=io.StringIO())
+    print(f"{DRForm.objects.count()} forms, {Result.objects.count()} Result rows\n")
+    print(f"{'':28} {'JSON':>10} {'SQL':>10}")
+    for name, json_path, sql_path in CASES:
+        json_ms, expected = timed(json_path, args.repeat)
+        sql_ms, got = timed(sql_path, args.repeat)
+        if got != expected:
+            raise SystemExit(f"{name}: SQL {got} != JSON {expected}")
+        print(f"{name:28} {json_ms:8.1f}ms {sql_ms:8.1f}ms  x{json_ms / sql_ms:.1f}")
+
+
+if __name__ == '__main__':
+    main()
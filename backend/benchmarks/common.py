@@ -0,0 +1,30 @@
+"""Shared setup for the benchmark scripts: Django against a scratch database."""
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_path=None, media_root=None, migrate=True):
+    """
+    Configure Django with a throwaway SQLite database (or ``db_path``) and
+    MEDIA_ROOT so benchmarks never touch the project's own data.
+    Returns the scratch directory.
+    """
+    sys.path.insert(0, BACKEND)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'election.settings')
+    workdir = tempfile.mkdtemp(prefix='nup-bench-')
+
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path or os.path.join(workdir, 'bench.sqlite3')
+    settings.MEDIA_ROOT = media_root or os.path.join(workdir, 'media')
+    settings.UPLOAD_STAGING_DIR = os.path.join(settings.MEDIA_ROOT, '.staging')
+    django.setup()
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return workdir
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'results.User'
 
 MIDDLEWARE = [
+    'results.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,12 +85,53 @@ WSGI_APPLICATION = 'election.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgresql / mysql with DB_NAME, DB_USER,
+# DB_PASSWORD, DB_HOST and DB_PORT, from the environment or .env.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+# Seconds a connection is reused across requests. The default 0 closes it
+# after each request; it must stay 0 under ASGI, where every request gets a
+# new thread (and a persistent connection would be left open in each).
+# Raise it for WSGI workers only.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
+if DB_ENGINE == 'sqlite':
+    # IMMEDIATE transactions take the write lock up front, so concurrent
+    # writers queue on busy_timeout instead of failing with "database is
+    # locked" when upgrading a read. WAL, which lets feed reads run alongside
+    # a writer, is a property of the database file: switch a deployment's
+    # database once with `manage.py set_journal_mode` (or SQLITE_JOURNAL_MODE).
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+                'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+                'init_command': ';'.join([
+                    *([f"PRAGMA journal_mode={os.environ['SQLITE_JOURNAL_MODE']}"]
+                      if os.environ.get('SQLITE_JOURNAL_MODE') else []),
+                    f"PRAGMA synchronous={os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+                    f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+                    "PRAGMA temp_store=MEMORY",
+                ]),
+            },
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('DB_NAME', 'election'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
 
 
 # Password validation
@@ -130,6 +173,37 @@ STATIC_URL = 'static/'
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads stream here while being hashed; keep it on the same filesystem as
+# MEDIA_ROOT so saving a DR form is a rename, not a copy.
+UPLOAD_STAGING_DIR = MEDIA_ROOT / '.staging'
+# Default processes for `manage.py build_derivatives`
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+
+# Processes used to hash passwords when provisioning agents in bulk (0 = inline)
+PROVISIONING_WORKERS = int(os.environ.get('PROVISIONING_WORKERS', os.cpu_count() or 1))
+
+# Post-upload work and tally updates run on the database job queue
+# (`manage.py run_workers`). JOBS_EAGER=1 runs them inline instead.
+JOBS_EAGER = os.environ.get('JOBS_EAGER', '0') == '1'
+
+# Seconds a process keeps its in-memory polling station directory
+# (results.directory) before reloading it to see other processes' changes.
+STATION_DIRECTORY_TTL = float(os.environ.get('STATION_DIRECTORY_TTL', 300))
+
+# Static JSON snapshots of the public results (results.publisher), rewritten
+# by the job queue as verified data changes; serve SNAPSHOT_ROOT directly.
+SNAPSHOTS_ENABLED = os.environ.get('SNAPSHOTS_ENABLED', '0') == '1'
+SNAPSHOT_ROOT = os.environ.get('SNAPSHOT_ROOT') or MEDIA_ROOT / 'snapshots'
+
+# Per-route request metrics, scraped from /api/_metrics (results.metrics).
+# Scrapes need "Authorization: Bearer <METRICS_TOKEN>"; without a token
+# the endpoint is only served with DEBUG on.
+# A SLOW_REQUEST_SAMPLE_RATE fraction of requests keep their SQL, which is
+# logged for those slower than SLOW_REQUEST_SECONDS.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE', '0'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
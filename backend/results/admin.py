@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PollingStation, DRForm, Agent, Report
+from .models import PollingStation, DRForm, Agent, Report, Job
 
 # Register your models here.
 
@@ -15,4 +15,10 @@ class DRFormAdmin(admin.ModelAdmin):
 @admin.register(Agent)
 class AgentAdmin(admin.ModelAdmin):
     list_display = ('full_name', 'district', 'constituency', 'polling_station', 'phone', 'email', 'created_at')
-    search_fields = ('full_name', 'district', 'constituency', 'polling_station')
\ No newline at end of file
+    search_fields = ('full_name', 'district', 'constituency', 'polling_station')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'leased_by', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('result', 'last_error', 'created_at', 'updated_at')
@@ -1,4 +1,3 @@
-import hashlib
 from rest_framework import generics, status
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
@@ -6,9 +5,10 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import DRForm
 from .serializers import DRFormUploadSerializer, DRFormPublicSerializer
 from .permissions import IsAgent
+from .uploads import StreamingUploadMixin, file_sha256
 from django.shortcuts import get_object_or_404
 
-class DRFormUploadView(generics.CreateAPIView):
+class DRFormUploadView(StreamingUploadMixin, generics.CreateAPIView):
     serializer_class = DRFormUploadSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = (IsAuthenticated, IsAgent)
@@ -20,15 +20,15 @@ class DRFormUploadView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         # Additional server-side hash verification
         serializer = self.get_serializer(data=request.data)
+        rejection = self.upload_rejection()
+        if rejection:
+            return rejection
         serializer.is_valid(raise_exception=True)
         image_file = request.FILES.get('image')
         provided_hash = serializer.validated_data.get('sha256_hash')
 
-        # compute server hash to verify integrity
-        sha256 = hashlib.sha256()
-        for chunk in image_file.chunks():
-            sha256.update(chunk)
-        computed_hash = sha256.hexdigest()
+        # server hash, taken by the upload handler while the file streamed in
+        computed_hash = file_sha256(image_file)
 
         if provided_hash and provided_hash != computed_hash:
             return Response({'detail': 'Hash mismatch'}, status=status.HTTP_400_BAD_REQUEST)
@@ -67,6 +67,6 @@ class PendingListView(generics.ListAPIView):
     def get_queryset(self):
         # Only staff/admins should access pending
         if self.request.user.is_staff:
-            return DRForm.objects.filter(verified=False)
+            return DRForm.objects.filter(verified=False).select_related('polling_station', 'verified_by')
         return DRForm.objects.none()
     
\ No newline at end of file
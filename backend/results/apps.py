@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class NupConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'results'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals, tasks  # noqa: F401
+        if settings.METRICS_ENABLED:
+            from .metrics import install_serializer_timing
+            install_serializer_timing()
@@ -0,0 +1,80 @@
+"""
+Conditional GET and shared-cache headers for the public read endpoints.
+
+Validators come from the newest timestamp and row count of each source
+table (two index-only queries each), so a matching ``If-None-Match`` or
+``If-Modified-Since`` gets a 304 before any serializer runs. Adding,
+changing or deleting a row moves the timestamp or the count. The sources
+of a view are every table its response shows data from (a feed lists the
+forms' stations and verifiers too). Writes that bypass ``save()`` on these
+tables must set the timestamp themselves.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+# Browsers revalidate after MAX_AGE; a CDN or reverse proxy may serve its
+# copy for SHARED_MAX_AGE, and a stale one while it revalidates.
+MAX_AGE = 5
+SHARED_MAX_AGE = 15
+STALE_WHILE_REVALIDATE = 30
+
+
+def table_state(sources):
+    """``(newest timestamp, total rows)`` over ``(queryset, field)`` pairs."""
+    latest, rows = None, 0
+    for queryset, field in sources:
+        queryset = queryset.order_by()
+        # Two queries on purpose: MAX() alone is an index seek and COUNT(*)
+        # alone an index-only scan; together the planner scans the table.
+        newest = queryset.aggregate(latest=Max(field))['latest']
+        rows += queryset.count()
+        if newest and (latest is None or newest > latest):
+            latest = newest
+    return latest, rows
+
+
+def public_cache(sources, max_age=MAX_AGE, shared_max_age=SHARED_MAX_AGE):
+    """
+    Decorate a GET view with ETag/Last-Modified validators and a public
+    ``Cache-Control``. ``sources(request, *args, **kwargs)`` returns the
+    ``(queryset, field)`` pairs the response is built from.
+    Works on ``@api_view`` functions and, via ``method_decorator``, on
+    class-based ``get`` methods.
+    """
+    def state(request, *args, **kwargs):
+        if not hasattr(request, '_public_cache_state'):
+            request._public_cache_state = table_state(sources(request, *args, **kwargs))
+        return request._public_cache_state
+
+    def etag(request, *args, **kwargs):
+        latest, rows = state(request, *args, **kwargs)
+        # The browsable API and JSON share a URL but not a body
+        media_type = getattr(request, 'accepted_media_type', '')
+        key = f"{latest.isoformat() if latest else '-'}|{rows}|{media_type}"
+        return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+    def last_modified(request, *args, **kwargs):
+        return state(request, *args, **kwargs)[0]
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(
+                    response, public=True, max_age=max_age, s_maxage=shared_max_age,
+                    stale_while_revalidate=STALE_WHILE_REVALIDATE,
+                )
+            return response
+
+        return wrapped
+
+    return decorator
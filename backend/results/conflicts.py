@@ -0,0 +1,208 @@
+"""
+Per-station grouping of DR forms, conflict flags and the canonical form.
+
+Several forms can exist for one polling station (re-uploads, a second
+agent, a corrected scan). ``StationFormGroup`` keeps, per station, how
+many forms there are, how many distinct totals and image hashes they
+carry, and which form is *canonical*: the only one the tallies count.
+
+Groups are refreshed by the ``apply_tallies`` job for just the stations a
+change touched, reading those stations' forms (drform_station_verified_idx)
+and never the whole table. The canonical form is chosen by
+``choose_canonical`` unless a moderator pinned one (``pin``); the group
+stores the snapshot it counted, and the tallies move by the difference
+between the old and the new canonical snapshot.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import tallies
+from .models import DRForm, PollingStation, StationFormGroup
+
+FormRow = namedtuple('FormRow', 'id station verified verified_at totals sha256_hash')
+FORM_COLUMNS = ('id', 'polling_station_id', 'verified', 'verified_at', 'totals', 'sha256_hash')
+
+
+def totals_key(totals):
+    """Totals compared for agreement: whole-number entries, zeros dropped."""
+    return tuple(sorted((party, votes) for party, votes in tallies.parse_totals(totals).items() if votes))
+
+
+def choose_canonical(rows):
+    """
+    Verified forms win over unverified ones. Among them, the totals backed
+    by the most distinct scans win, ties going to the totals seen first
+    (earliest verified, else earliest uploaded); the first form carrying
+    the winning totals is canonical.
+    """
+    pool = [row for row in rows if row.verified] or list(rows)
+    unset = timezone.now()
+    pool.sort(key=lambda row: (row.verified_at is None, row.verified_at or unset, row.id))
+    first, scans = {}, defaultdict(set)
+    for position, row in enumerate(pool):
+        key = totals_key(row.totals)
+        first.setdefault(key, (position, row))
+        scans[key].add(row.sha256_hash or row.id)
+    best = min(first, key=lambda key: (-len(scans[key]), first[key][0]))
+    return first[best][1]
+
+
+def summarize(rows, pinned_id=None):
+    """``(canonical, pinned, totals_variants, image_variants)`` for one station's forms."""
+    canonical = next((row for row in rows if row.id == pinned_id), None)
+    pinned = canonical is not None
+    if canonical is None:
+        canonical = choose_canonical(rows)
+    totals_variants = len({totals_key(row.totals) for row in rows})
+    image_variants = len({row.sha256_hash for row in rows if row.sha256_hash})
+    return canonical, pinned, totals_variants, image_variants
+
+
+def _rows_by_station(queryset):
+    grouped = defaultdict(list)
+    for values in queryset.order_by().values_list(*FORM_COLUMNS):
+        grouped[values[1]].append(FormRow(*values))
+    return grouped
+
+
+def _regions(station_ids=None):
+    """``{pk: (station_id, district, constituency)}`` of the stations (all by default)."""
+    stations = PollingStation.objects.all() if station_ids is None else PollingStation.objects.filter(pk__in=station_ids)
+    return {
+        pk: (station_id, district, constituency)
+        for pk, station_id, district, constituency
+        in stations.values_list('pk', 'station_id', 'district', 'constituency').iterator(chunk_size=2000)
+    }
+
+
+def _update(group, rows, now, region):
+    """Refresh ``group`` from its forms; returns the snapshot it now counts."""
+    canonical, pinned, totals_variants, image_variants = summarize(
+        rows, group.canonical_id if group.pinned else None
+    )
+    group.canonical_id = canonical.id
+    group.pinned = pinned
+    group.counted = tallies.make_snapshot(group.station_id, canonical.verified, canonical.totals, region)
+    group.forms = len(rows)
+    group.totals_variants = totals_variants
+    group.image_variants = image_variants
+    if totals_variants > 1 or image_variants > 1:
+        group.conflict_since = group.conflict_since or now
+    else:
+        group.conflict_since = None
+    return group.counted
+
+
+def refresh(station_ids, pin=None):
+    """
+    Regroup the forms of ``station_ids`` (optionally pinning the form
+    ``pin`` as canonical for its station). Returns the ``(before, after)``
+    counted snapshots that changed, for ``tallies.record_changes``.
+    """
+    station_ids = sorted(set(station_ids))
+    if not station_ids:
+        return []
+    existing = set(StationFormGroup.objects.filter(station_id__in=station_ids).values_list('station_id', flat=True))
+    StationFormGroup.objects.bulk_create(
+        [StationFormGroup(station_id=pk) for pk in station_ids if pk not in existing], ignore_conflicts=True
+    )
+
+    changes = []
+    now = timezone.now()
+    with transaction.atomic():
+        groups = StationFormGroup.objects.select_for_update().filter(station_id__in=station_ids).order_by('station_id')
+        forms = _rows_by_station(DRForm.objects.filter(polling_station_id__in=station_ids))
+        regions = _regions(station_ids)
+        for group in groups:
+            before = group.counted
+            rows = forms.get(group.station_id)
+            if not rows:
+                group.delete()
+                after = None
+            else:
+                if pin is not None and pin.polling_station_id == group.station_id:
+                    group.canonical_id, group.pinned = pin.pk, True
+                after = _update(group, rows, now, regions.get(group.station_id))
+                group.save()
+            if before != after:
+                changes.append((before, after))
+    return changes
+
+
+def moved(station_ids):
+    """The stations of ``station_ids`` counted under a region they are no longer in."""
+    regions = _regions(station_ids)
+    return [
+        pk for pk, counted in StationFormGroup.objects.filter(station_id__in=station_ids)
+        .values_list('station_id', 'counted')
+        if counted and counted.get('region') and tuple(counted['region']) != regions.get(pk)
+    ]
+
+
+def pin(form):
+    """Make ``form`` its station's canonical form and apply the tally change."""
+    with transaction.atomic():
+        tallies.record_changes(refresh([form.polling_station_id], pin=form))
+
+
+def _station_rows():
+    """Every form, one list per station, from a single ordered scan."""
+    rows = []
+    forms = DRForm.objects.order_by('polling_station_id', 'id').values_list(*FORM_COLUMNS).iterator(chunk_size=2000)
+    for values in forms:
+        row = FormRow(*values)
+        if rows and row.station != rows[0].station:
+            yield rows
+            rows = []
+        rows.append(row)
+    if rows:
+        yield rows
+
+
+def canonical_snapshots():
+    """
+    Yield the counted snapshot of every station from a full scan of the
+    forms (pins kept), without touching the stored groups.
+    """
+    pins = dict(StationFormGroup.objects.filter(pinned=True).values_list('station_id', 'canonical_id'))
+    for rows in _station_rows():
+        canonical = summarize(rows, pins.get(rows[0].station))[0]
+        yield tallies.make_snapshot(canonical.station, canonical.verified, canonical.totals)
+
+
+def rebuild():
+    """
+    Regroup every station from a full scan, without touching the tallies
+    (rebuild those afterwards). Returns the number of groups that changed.
+    """
+    now = timezone.now()
+    changed = 0
+    with transaction.atomic():
+        stored = {group.station_id: group for group in StationFormGroup.objects.select_for_update()}
+        regions = _regions()
+        fresh = []
+        for rows in _station_rows():
+            group = stored.pop(rows[0].station, None)
+            state = _state(group)
+            if group is None:
+                group = StationFormGroup(station_id=rows[0].station)
+                fresh.append(group)
+            _update(group, rows, now, regions.get(rows[0].station))
+            if state != _state(group):
+                changed += 1
+                if group.pk:
+                    group.save()
+        StationFormGroup.objects.bulk_create(fresh, batch_size=1000)
+        # Stations that have no forms left
+        changed += len(stored)
+        StationFormGroup.objects.filter(pk__in=[group.pk for group in stored.values()]).delete()
+    return changed
+
+
+def _state(group):
+    if group is None:
+        return None
+    return (group.canonical_id, group.pinned, group.counted, group.forms,
+            group.totals_variants, group.image_variants, group.conflict_since is not None)
@@ -0,0 +1,82 @@
+"""
+Smaller renditions of DR form scans for feeds.
+
+After an upload, the ``process_upload`` background job (results.tasks)
+resizes the original image into ``SIZES``; ``build_derivatives`` does the
+same for existing media in a process pool. Derivative names are derived from the content-addressed image name, so a
+scan shared by several forms is only processed once. Finished renditions
+are recorded in ``DRForm.derivatives`` as ``{size: name}``.
+"""
+import os
+import tempfile
+
+# name -> (longest edge in px, JPEG quality)
+SIZES = {
+    'thumb': (320, 70),
+    'feed': (1080, 80),
+}
+
+
+def derivative_name(image_name, size):
+    stem = os.path.splitext(image_name)[0]
+    return f"derived/{size}/{stem}.jpg"
+
+
+def render(source_path, outputs):
+    """
+    Write each ``{size: destination_path}`` rendition of ``source_path``.
+    Safe to run in a pool worker: it only touches Pillow and the filesystem.
+    """
+    from PIL import Image, ImageOps
+
+    written = {}
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+        for size, destination in outputs.items():
+            edge, quality = SIZES[size]
+            copy = image.copy()
+            copy.thumbnail((edge, edge))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destination), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as out:
+                copy.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+            os.replace(tmp, destination)
+            written[size] = destination
+    return written
+
+
+def pending_outputs(image_name, force=False):
+    """``({size: name}, {size: absolute path still to render})`` for an image."""
+    from .storage import get_drform_storage
+
+    storage = get_drform_storage()
+    names = {size: derivative_name(image_name, size) for size in SIZES}
+    todo = {
+        size: storage.path(name)
+        for size, name in names.items()
+        if force or not storage.exists(name)
+    }
+    return names, todo
+
+
+def record(form_id, names):
+    from django.utils import timezone
+
+    from .models import DRForm
+
+    DRForm.objects.filter(pk=form_id).update(derivatives=names, updated_at=timezone.now())
+
+
+def build(form, force=False):
+    """Render (inline) whatever derivatives ``form`` is missing and record them."""
+    from .storage import get_drform_storage
+
+    if not form.image:
+        return {}
+    names, todo = pending_outputs(form.image.name, force)
+    if todo:
+        render(get_drform_storage().path(form.image.name), todo)
+    if form.derivatives != names:
+        record(form.pk, names)
+        form.derivatives = names
+    return names
@@ -0,0 +1,232 @@
+"""
+Process-local directory of polling stations for resolving upload refs.
+
+Uploads name their station by pk, ``station_id`` or name. The directory
+loads every station once (a single query) and answers those lookups from
+memory: by pk, by ``station_id`` (exact, then ignoring case and spaces)
+and by *normalized* name (accents, case, punctuation, spacing and the
+usual abbreviations such as ``P/S`` folded away).
+
+The directory is dropped when a station is saved or deleted in this
+process (results.signals) or bulk-imported, and reloaded at most every
+``STATION_DIRECTORY_TTL`` seconds so changes made by other processes show
+up. A ref the directory does not know is looked up in the database, and
+only a name found nowhere is matched against the trigram index of station
+names: a close enough, unambiguous match is accepted (``FUZZY_THRESHOLD``).
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+
+from .models import PollingStation
+
+# Minimum trigram similarity (shared / all distinct trigrams) of a fuzzy match,
+# and how far ahead of the next best station it must be
+FUZZY_THRESHOLD = 0.6
+FUZZY_MARGIN = 0.1
+# Names scored per fuzzy lookup (at least those sharing its rarest trigram)
+MAX_CANDIDATES = 2000
+
+ABBREVIATIONS = {
+    'p/s': 'primary school', 'p.s': 'primary school', 'p.s.': 'primary school',
+    's/s': 'secondary school', 'sch': 'school', 'pri': 'primary',
+    'c/u': 'church of uganda', 's/c': 'sub county', 'hq': 'headquarters',
+    'hqs': 'headquarters', 'hqtrs': 'headquarters', 'tc': 'town council', 't/c': 'town council',
+}
+
+FIELDS = [field.attname for field in PollingStation._meta.concrete_fields]
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+class AmbiguousStation(Exception):
+    """A name matches more than one station; the station_id is needed."""
+
+
+def normalize(name):
+    """Casefolded ASCII words with abbreviations expanded: ``"Kira P/S "`` -> ``"kira primary school"``."""
+    text = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().casefold()
+    words = (ABBREVIATIONS.get(word, word) for word in text.split())
+    return ' '.join(_NON_ALNUM.sub(' ', ' '.join(words)).split())
+
+
+def code_key(station_id):
+    return ''.join(str(station_id).split()).upper()
+
+
+def trigrams(text):
+    """Word trigrams padded as in pg_trgm (two spaces before each word, one after)."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Directory:
+    """An immutable snapshot of every station and its lookup indexes."""
+
+    def __init__(self, rows, db):
+        self.db = db
+        self.loaded_at = time.monotonic()
+        self.rows = {}
+        self.by_code = {}
+        codes = defaultdict(list)
+        self.by_name = defaultdict(list)
+        for values in rows:
+            pk, station_id, name = values[0], values[1], values[2]
+            self.rows[pk] = values
+            self.by_code[station_id] = pk
+            codes[code_key(station_id)].append(pk)
+            self.by_name[normalize(name)].append(pk)
+        self.by_loose_code = {key: pks[0] for key, pks in codes.items() if len(pks) == 1}
+
+        self.names = list(self.by_name)
+        self.index = defaultdict(list)
+        for position, name in enumerate(self.names):
+            for gram in trigrams(name):
+                self.index[gram].append(position)
+
+    def station(self, pk):
+        return PollingStation.from_db(self.db, FIELDS, self.rows[pk])
+
+    def search(self, text, limit=5):
+        """``[(similarity, normalized name), …]`` best first."""
+        grams = trigrams(normalize(text))
+        if not grams:
+            return []
+        # The rarest trigrams pick the candidates; "primary", "school"… would pick them all
+        candidates = set()
+        for posting in sorted((self.index.get(gram, ()) for gram in grams), key=len):
+            if candidates and len(candidates) + len(posting) > MAX_CANDIDATES:
+                break
+            candidates.update(posting)
+        scored = []
+        for position in candidates:
+            other = trigrams(self.names[position])
+            shared = len(grams & other)
+            scored.append((shared / (len(grams) + len(other) - shared), self.names[position]))
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+    def find_name(self, name, fuzzy=False):
+        """The pk of the only station called ``name`` (normalized), else None."""
+        pks = self.by_name.get(normalize(name))
+        if pks is None and fuzzy:
+            best = self.search(name, limit=2)
+            if best and best[0][0] >= FUZZY_THRESHOLD:
+                if len(best) > 1 and best[0][0] - best[1][0] < FUZZY_MARGIN:
+                    raise AmbiguousStation(name)
+                pks = self.by_name[best[0][1]]
+        if pks and len(pks) > 1:
+            raise AmbiguousStation(name)
+        return pks[0] if pks else None
+
+    def find(self, ref, fuzzy=True):
+        """pk of the station ``ref`` names: a pk, a station_id or a name, in that order."""
+        ref = str(ref).strip()
+        if ref.isdigit() and int(ref) in self.rows:
+            return int(ref)
+        pk = self.by_code.get(ref) or self.by_loose_code.get(code_key(ref))
+        if pk is not None:
+            return pk
+        return self.find_name(ref, fuzzy=fuzzy)
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def invalidate():
+    """Drop the directory now and, inside a transaction, again once it commits."""
+    global _current
+    _current = None
+    if transaction.get_connection(router.db_for_write(PollingStation)).in_atomic_block:
+        transaction.on_commit(invalidate, using=router.db_for_write(PollingStation))
+
+
+def current():
+    """The loaded directory, (re)loading it when dropped or older than the TTL."""
+    global _current
+    directory = _current
+    if directory is not None and time.monotonic() - directory.loaded_at < settings.STATION_DIRECTORY_TTL:
+        return directory
+    with _lock:
+        if _current is directory or _current is None:
+            db = router.db_for_read(PollingStation)
+            _current = Directory(PollingStation.objects.using(db).values_list(*FIELDS).iterator(chunk_size=5000), db)
+        return _current
+
+
+def _from_database(refs):
+    """Exact lookups the directory missed (stations added by other processes)."""
+    refs = {ref for ref in refs if ref}
+    pks = [int(ref) for ref in refs if ref.isdigit()]
+    found = {}
+    for station in PollingStation.objects.filter(Q(pk__in=pks) | Q(station_id__in=refs) | Q(name__in=refs)):
+        for ref, rank in ((str(station.pk), 0), (station.station_id, 1), (station.name, 2)):
+            if ref in refs and (ref not in found or found[ref][0] > rank):
+                found[ref] = (rank, station)
+    return {ref: station for ref, (_, station) in found.items()}
+
+
+def resolve_many(refs, fuzzy=True):
+    """
+    ``{ref: PollingStation}`` for the refs that name a station (pk, then
+    station_id, then name). Ambiguous names are left out.
+    """
+    refs = {str(ref).strip() for ref in refs if ref not in (None, '')}
+    directory = current()
+    resolved, missing = {}, []
+    for ref in refs:
+        try:
+            pk = directory.find(ref, fuzzy=False)
+        except AmbiguousStation:
+            continue
+        if pk is None:
+            missing.append(ref)
+        else:
+            resolved[ref] = directory.station(pk)
+    if missing:
+        found = _from_database(missing)
+        if found:
+            # Newer than the directory; pick them up on the next lookup
+            invalidate()
+        resolved.update(found)
+        if fuzzy:
+            for ref in set(missing) - set(found):
+                try:
+                    pk = directory.find_name(ref, fuzzy=True)
+                except AmbiguousStation:
+                    continue
+                if pk is not None:
+                    resolved[ref] = directory.station(pk)
+    return resolved
+
+
+def resolve(ref, fuzzy=True):
+    """
+    The station ``ref`` names, or None. Raises AmbiguousStation when it is
+    a name shared by several stations (or close to several).
+    """
+    ref = str(ref).strip()
+    if not ref:
+        return None
+    directory = current()
+    pk = directory.find(ref, fuzzy=False)
+    if pk is not None:
+        return directory.station(pk)
+    found = _from_database([ref]).get(ref)
+    if found is not None:
+        invalidate()
+        return found
+    if fuzzy:
+        pk = directory.find_name(ref, fuzzy=True)
+        return directory.station(pk) if pk is not None else None
+    return None
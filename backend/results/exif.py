@@ -0,0 +1,40 @@
+"""Read the GPS position a phone camera stored in a DR form photo."""
+from PIL import Image, ExifTags
+
+GPS_IFD = 0x8825
+
+
+def _degrees(value):
+    d, m, s = (float(part) for part in value)
+    return d + m / 60 + s / 3600
+
+
+def extract_gps(path):
+    """
+    Return ``{'lat': …, 'lng': …}`` (plus ``alt`` when present) from the
+    image's EXIF GPS block, or None if it has none.
+    """
+    try:
+        with Image.open(path) as image:
+            gps = image.getexif().get_ifd(GPS_IFD)
+    except (OSError, ValueError):
+        return None
+    if not gps:
+        return None
+    tags = {ExifTags.GPSTAGS.get(key, key): value for key, value in gps.items()}
+    try:
+        lat = _degrees(tags['GPSLatitude'])
+        lng = _degrees(tags['GPSLongitude'])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if tags.get('GPSLatitudeRef') == 'S':
+        lat = -lat
+    if tags.get('GPSLongitudeRef') == 'W':
+        lng = -lng
+    position = {'lat': round(lat, 7), 'lng': round(lng, 7), 'source': 'exif'}
+    if 'GPSAltitude' in tags:
+        try:
+            position['alt'] = float(tags['GPSAltitude'])
+        except (TypeError, ValueError):
+            pass
+    return position
@@ -0,0 +1,283 @@
+"""
+Streaming bulk loaders for national-scale registries.
+
+Records are read lazily from CSV or NDJSON and written in batches, so a
+register of tens of thousands of rows costs a handful of queries per batch
+instead of several round trips per row.
+"""
+import csv
+import io
+import json
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import conflicts, directory, jobs
+from .models import Agent, PollingStation, User
+
+STATION_FIELDS = ('station_id', 'name', 'district', 'constituency', 'location')
+STATION_REQUIRED = ('station_id', 'name', 'district', 'constituency')
+
+
+def read_records(stream, fmt):
+    """
+    Yield ``(line_number, dict)`` from a text stream of CSV (with a header)
+    or NDJSON. Unparseable NDJSON lines are yielded as ``(line, None)``.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+
+def detect_format(path):
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def open_text(path):
+    if path == '-':
+        import sys
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def clean_station(record):
+    """Normalise one station record; returns ``(values, error)``."""
+    if not isinstance(record, dict):
+        return None, "not a JSON object"
+    values = {}
+    for field in STATION_FIELDS:
+        value = record.get(field)
+        values[field] = str(value).strip() if value is not None else ''
+    missing = [field for field in STATION_REQUIRED if not values[field]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    too_long = [
+        field for field in STATION_FIELDS
+        if len(values[field]) > PollingStation._meta.get_field(field).max_length
+    ]
+    if too_long:
+        return None, f"too long: {', '.join(too_long)}"
+    values['location'] = values['location'] or None
+    return values, None
+
+
+def _flush_stations(batch, stats):
+    existing = PollingStation.objects.in_bulk(batch.keys(), field_name='station_id')
+    to_create, to_update = [], []
+    now = timezone.now()
+    for station_id, values in batch.items():
+        station = existing.get(station_id)
+        if station is None:
+            to_create.append(PollingStation(**values))
+        elif any(getattr(station, field) != values[field] for field in STATION_FIELDS):
+            for field in STATION_FIELDS:
+                setattr(station, field, values[field])
+            station.updated_at = now
+            to_update.append(station)
+        else:
+            stats['unchanged'] += 1
+    with transaction.atomic():
+        PollingStation.objects.bulk_create(to_create)
+        PollingStation.objects.bulk_update(to_update, [f for f in STATION_FIELDS if f != 'station_id'] + ['updated_at'])
+        # Votes counted under a station's old district/constituency move with it
+        moved = conflicts.moved([station.pk for station in to_update])
+        if moved:
+            jobs.enqueue('apply_tallies', {'changes': [], 'moved': moved})
+    # Bulk writes send no signals
+    directory.invalidate()
+    stats['created'] += len(to_create)
+    stats['updated'] += len(to_update)
+
+
+def import_stations(records, batch_size=2000, on_batch=None, on_reject=None):
+    """
+    Upsert stations by ``station_id`` from ``(line, record)`` pairs.
+    Later rows win over earlier rows with the same ``station_id``.
+    Returns counts of created / updated / unchanged / rejected rows.
+    """
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0, 'read': 0}
+    batch = {}
+    for line, record in records:
+        stats['read'] += 1
+        values, error = clean_station(record)
+        if error:
+            stats['rejected'] += 1
+            if on_reject:
+                on_reject(line, record, error)
+            continue
+        batch[values['station_id']] = values
+        if len(batch) >= batch_size:
+            _flush_stations(batch, stats)
+            batch = {}
+            if on_batch:
+                on_batch(stats)
+    if batch:
+        _flush_stations(batch, stats)
+        if on_batch:
+            on_batch(stats)
+    return stats
+
+
+# -------------------------------
+# Agents
+# -------------------------------
+AGENT_REQUIRED = ('full_name', 'phone', 'email', 'district', 'constituency', 'polling_station')
+
+
+def generate_password():
+    return secrets.token_urlsafe(9)
+
+
+def hash_passwords(passwords, workers):
+    """PBKDF2-hash ``passwords`` across ``workers`` processes (0 = inline)."""
+    if not workers or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    # Spawned children inherit DJANGO_SETTINGS_MODULE and only need the hashers configured
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=django.setup) as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def _resolve_stations(refs):
+    """Map each reference (station_id, else exact name) to a station, in one query."""
+    found = PollingStation.objects.filter(Q(station_id__in=refs) | Q(name__in=refs))
+    by_id, by_name = {}, {}
+    for station in found:
+        by_id[station.station_id] = station
+        by_name.setdefault(station.name, []).append(station)
+    resolved = {}
+    for ref in refs:
+        if ref in by_id:
+            resolved[ref] = by_id[ref]
+        elif len(by_name.get(ref, ())) == 1:
+            resolved[ref] = by_name[ref][0]
+        elif ref in by_name:
+            resolved[ref] = "ambiguous station name; use the station_id"
+        else:
+            resolved[ref] = "polling station not found"
+    return resolved
+
+
+def _insert_agents(rows):
+    """Insert users + agents for ``rows``; returns rows that failed as ``(row, error)``."""
+    users = [
+        User(username=row['email'], email=row['email'], password=row['password_hash'], is_agent=True)
+        for row in rows
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        Agent.objects.bulk_create([
+            Agent(
+                user=user,
+                full_name=row['full_name'],
+                phone=row['phone'],
+                email=row['email'],
+                district=row['district'],
+                constituency=row['constituency'],
+                polling_station=row['station'],
+            )
+            for user, row in zip(users, rows)
+        ])
+
+
+def provision_agents(records, workers=0, batch_size=500):
+    """
+    Create agent accounts from ``(line, record)`` pairs in batches.
+
+    Each agent gets a unique generated password (hashed in a process pool).
+    Bad rows are reported and skipped; good rows are committed. Returns
+    ``(created, rejected)``: created rows carry the plain-text credentials,
+    rejected rows carry the reason.
+    """
+    created, rejected, pending = [], [], []
+    seen = set()
+
+    for line, record in records:
+        if not isinstance(record, dict):
+            rejected.append({'line': line, 'email': None, 'error': "not a JSON object"})
+            continue
+        row = {field: str(record.get(field) or '').strip() for field in AGENT_REQUIRED}
+        row['line'] = line
+        row['email'] = row['email'].lower()
+        missing = [field for field in AGENT_REQUIRED if not row[field]]
+        if missing:
+            rejected.append({'line': line, 'email': row['email'] or None, 'error': f"missing {', '.join(missing)}"})
+            continue
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            rejected.append({'line': line, 'email': row['email'], 'error': "invalid email"})
+            continue
+        if row['email'] in seen:
+            rejected.append({'line': line, 'email': row['email'], 'error': "duplicate email in upload"})
+            continue
+        seen.add(row['email'])
+        pending.append(row)
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        emails = [row['email'] for row in batch]
+        taken = set(User.objects.filter(username__in=emails).values_list('username', flat=True))
+        taken |= set(Agent.objects.filter(email__in=emails).values_list('email', flat=True))
+        stations = _resolve_stations({row['polling_station'] for row in batch})
+
+        ready = []
+        for row in batch:
+            station = stations[row['polling_station']]
+            if row['email'] in taken:
+                rejected.append({'line': row['line'], 'email': row['email'], 'error': "user with this email already exists"})
+            elif isinstance(station, str):
+                rejected.append({'line': row['line'], 'email': row['email'], 'error': station})
+            else:
+                row['station'] = station
+                row['password'] = generate_password()
+                ready.append(row)
+
+        for row, hashed in zip(ready, hash_passwords([row['password'] for row in ready], workers)):
+            row['password_hash'] = hashed
+
+        try:
+            _insert_agents(ready)
+            inserted = ready
+        except IntegrityError:
+            # Something raced us; fall back to row by row to isolate the offenders
+            inserted = []
+            for row in ready:
+                try:
+                    _insert_agents([row])
+                    inserted.append(row)
+                except IntegrityError as exc:
+                    rejected.append({'line': row['line'], 'email': row['email'], 'error': str(exc)})
+
+        created.extend(
+            {
+                'line': row['line'],
+                'full_name': row['full_name'],
+                'polling_station': row['station'].station_id,
+                'username': row['email'],
+                'password': row['password'],
+            }
+            for row in inserted
+        )
+
+    rejected.sort(key=lambda item: item['line'])
+    return created, rejected
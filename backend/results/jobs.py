@@ -0,0 +1,142 @@
+"""
+A small job queue on top of the project database (no broker required).
+
+``enqueue()`` inserts a ``Job`` row in the caller's transaction, so a job
+exists exactly when the change that caused it commits. Workers
+(``manage.py run_workers``) claim due jobs under a lease (results.leasing),
+run the registered handler and mark the job done in the same transaction
+as the handler's writes: a job whose lease was lost is rolled back rather
+than applied twice. Failures are retried with exponential backoff up to
+``max_attempts``.
+
+Handlers are registered with ``@task('kind')`` in results.tasks.
+Set ``JOBS_EAGER = True`` to run handlers inline instead (no workers).
+"""
+import logging
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import leasing
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300
+MAX_BACKOFF_SECONDS = 600
+
+_registry = {}
+
+
+class LeaseLost(Exception):
+    """The job was re-claimed by another worker while this one ran it."""
+
+
+def task(kind):
+    def register(func):
+        _registry[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, delay=None, max_attempts=5):
+    """Queue ``kind`` with a JSON ``payload``; runs it right away in eager mode."""
+    if kind not in _registry:
+        raise KeyError(f"Unknown job kind: {kind}")
+    payload = payload or {}
+    if settings.JOBS_EAGER:
+        _registry[kind](payload)
+        return None
+    run_after = timezone.now() + delay if delay else timezone.now()
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after, max_attempts=max_attempts)
+
+
+def claimable(now=None):
+    now = now or timezone.now()
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_after__lte=now)
+        | Q(status=Job.RUNNING, lease_expires_at__lt=now)
+    ).order_by('run_after', 'id')
+
+
+def claim(worker_id, limit=1, lease_seconds=LEASE_SECONDS):
+    """Lease up to ``limit`` due jobs to ``worker_id``; returns the Job rows."""
+    now = timezone.now()
+    token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    pks = leasing.claim(
+        claimable(now), limit, 'leased_by', token,
+        status=Job.RUNNING,
+        attempts=F('attempts') + 1,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+        updated_at=now,
+    )
+    return list(Job.objects.filter(pk__in=pks))
+
+
+def run(job):
+    """Execute one claimed job. Returns True if it completed."""
+    handler = _registry.get(job.kind)
+    try:
+        if handler is None:
+            raise KeyError(f"No handler registered for {job.kind}")
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("Lease expired too many times")
+        with transaction.atomic():
+            result = handler(job.payload)
+            finished = Job.objects.filter(pk=job.pk, leased_by=job.leased_by, status=Job.RUNNING).update(
+                status=Job.DONE, result=result, last_error='', lease_expires_at=None, updated_at=timezone.now()
+            )
+            if not finished:
+                raise LeaseLost(job.pk)
+        return True
+    except LeaseLost:
+        logger.warning("Job %s was re-claimed by another worker; result discarded", job.pk)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.kind, job.attempts)
+        retry = handler is not None and job.attempts < job.max_attempts
+        backoff = min(2 ** job.attempts * 5, MAX_BACKOFF_SECONDS)
+        Job.objects.filter(pk=job.pk, leased_by=job.leased_by).update(
+            status=Job.QUEUED if retry else Job.FAILED,
+            run_after=timezone.now() + timedelta(seconds=backoff),
+            lease_expires_at=None,
+            last_error=error[-4000:],
+            updated_at=timezone.now(),
+        )
+        return False
+
+
+def run_pending(worker_id='inline', batch=10):
+    """Run due jobs until none are left. Returns how many ran."""
+    count = 0
+    while True:
+        jobs = claim(worker_id, batch)
+        if not jobs:
+            return count
+        for job in jobs:
+            run(job)
+            count += 1
+
+
+def work(worker_id, stop_event=None, poll_interval=1.0, batch=10):
+    """Worker loop used by ``run_workers``: claim, run, sleep when idle."""
+    logger.info("Worker %s started", worker_id)
+    while stop_event is None or not stop_event.is_set():
+        close_old_connections()
+        jobs = claim(worker_id, batch)
+        for job in jobs:
+            run(job)
+        if not jobs:
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+    close_old_connections()
+    logger.info("Worker %s stopped", worker_id)
@@ -0,0 +1,41 @@
+"""
+Claiming rows under a time-limited lease, safely across concurrent workers.
+
+On backends with ``SELECT … FOR UPDATE SKIP LOCKED`` (PostgreSQL, MySQL 8)
+candidates are locked and assigned in one transaction and concurrent
+claimers skip each other's rows. SQLite has no row locks, so there the
+assignment is a compare-and-set ``UPDATE … WHERE pk IN (…) AND <still
+claimable>``: whichever claimer writes first wins, and each claimer reads
+back only the rows that now carry its own token.
+"""
+from django.db import connections, router, transaction
+
+
+def claim(queryset, limit, token_field, token, **updates):
+    """
+    Assign ``{token_field: token, **updates}`` to up to ``limit`` rows of
+    ``queryset`` (which must select only claimable rows, in claim order).
+    Returns the list of claimed primary keys.
+    """
+    model = queryset.model
+    db = router.db_for_write(model)
+    updates[token_field] = token
+
+    if connections[db].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=db):
+            pks = list(
+                queryset.using(db).select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit]
+            )
+            if pks:
+                model._default_manager.using(db).filter(pk__in=pks).update(**updates)
+            return pks
+
+    pks = list(queryset.using(db).values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    queryset.using(db).filter(pk__in=pks).update(**updates)
+    return list(
+        model._default_manager.using(db)
+        .filter(pk__in=pks, **{token_field: token})
+        .values_list('pk', flat=True)
+    )
@@ -0,0 +1,155 @@
+"""
+Live results over Server-Sent Events.
+
+One ``LiveHub`` per (ASGI) process polls the database for changes once per
+interval, however many viewers are connected, serializes each change once
+and fans the encoded bytes out to every subscriber. Subscribers hold a
+small bounded buffer: a viewer that stops reading loses its oldest queued
+events instead of growing memory. Polling, rather than in-process
+signals, means changes applied by the job workers in other processes are
+picked up too.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Max, Q
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_BUFFER = 16
+MAX_FORMS_PER_POLL = 50
+
+
+def encode_event(event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+def read_tallies():
+    """``(totals, updated_at)`` of the national tallies."""
+    from . import tallies
+    from .models import PartyTally
+
+    stamp = PartyTally.objects.aggregate(latest=Max('updated_at'))['latest']
+    totals = {row['party']: row['votes'] for row in tallies.summary()}
+    return totals, stamp
+
+
+def current_tally_event():
+    totals, stamp = read_tallies()
+    return encode_event('tally', {'totals': totals, 'delta': {}, 'updated_at': stamp})
+
+
+class Subscriber:
+    __slots__ = ('queue', 'dropped')
+
+    def __init__(self, buffer):
+        self.queue = asyncio.Queue(maxsize=buffer)
+        self.dropped = 0
+
+    def offer(self, chunk):
+        if self.queue.full():
+            # Slow reader: drop the oldest event rather than buffer without bound
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(chunk)
+
+
+class LiveHub:
+    def __init__(self, poll_interval=POLL_INTERVAL, buffer=SUBSCRIBER_BUFFER):
+        self.poll_interval = poll_interval
+        self.buffer = buffer
+        self.subscribers = set()
+        self._poller = None
+        self._tally = None
+        self._tally_stamp = None
+        self._form_cursor = None
+        self._tally_event = None
+
+    # -- subscribers ------------------------------------------------------
+    def subscribe(self):
+        subscriber = Subscriber(self.buffer)
+        self.subscribers.add(subscriber)
+        if self.poll_interval and (self._poller is None or self._poller.done()):
+            # Changes made while nobody was listening are not replayed
+            self._tally = self._form_cursor = self._tally_event = None
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def broadcast(self, chunk):
+        for subscriber in self.subscribers:
+            subscriber.offer(chunk)
+
+    async def stream(self):
+        """Bytes for one SSE response: current totals first, then changes."""
+        subscriber = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            yield await self.snapshot()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    chunk = b": keepalive\n\n"
+                yield chunk
+        finally:
+            self.unsubscribe(subscriber)
+
+    # -- change detection -------------------------------------------------
+    async def snapshot(self):
+        """The latest totals event, sent first to every new subscriber."""
+        if self._tally_event is None:
+            await sync_to_async(self.collect)()
+        return self._tally_event
+
+    async def _poll(self):
+        while self.subscribers:
+            try:
+                for chunk in await sync_to_async(self.collect)():
+                    self.broadcast(chunk)
+            except Exception:
+                logger.exception("Live results poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def collect(self):
+        """Return encoded events for whatever changed since the last call."""
+        from .models import DRForm
+        from .serializers import DRFormPublicSerializer
+
+        close_old_connections()
+        events = []
+
+        totals, stamp = read_tallies()
+        if self._tally is None or stamp != self._tally_stamp:
+            if self._tally is not None:
+                delta = {party: votes - self._tally.get(party, 0) for party, votes in totals.items()}
+                events.append(encode_event('tally', {'totals': totals, 'delta': delta, 'updated_at': stamp}))
+            self._tally, self._tally_stamp = totals, stamp
+            self._tally_event = encode_event('tally', {'totals': totals, 'delta': {}, 'updated_at': stamp})
+
+        forms = DRForm.objects.filter(verified=True).select_related('polling_station', 'verified_by')
+        if self._form_cursor is None:
+            newest = forms.order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+            self._form_cursor = newest or (None, 0)
+        else:
+            stamp, pk = self._form_cursor
+            if stamp is not None:
+                forms = forms.filter(Q(updated_at__gt=stamp) | Q(updated_at=stamp, id__gt=pk))
+            new = list(forms.order_by('updated_at', 'id')[:MAX_FORMS_PER_POLL])
+            if new:
+                self._form_cursor = (new[-1].updated_at, new[-1].id)
+                for item in DRFormPublicSerializer(new, many=True).data:
+                    events.append(encode_event('drform', item))
+        return events
+
+
+hub = LiveHub()
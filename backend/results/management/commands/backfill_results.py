@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from results import votes
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert DRForm.totals into typed Result rows for forms saved before the dual write, "
+        "and repair rows that no longer match their form. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--check', action='store_true', help="Only report forms whose rows are missing or stale.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(checked, stale):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{checked} forms checked, {stale} to write")
+
+        checked, stale = votes.backfill(options['batch_size'], dry_run=options['check'], on_progress=progress)
+        elapsed = time.monotonic() - started
+        if options['check']:
+            if stale:
+                self.stderr.write(self.style.ERROR(
+                    f"{stale} of {checked} forms have missing or stale Result rows; run without --check."
+                ))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS(f"All {checked} forms have matching Result rows."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Wrote Result rows for {stale} of {checked} forms in {elapsed:.1f}s."))
@@ -0,0 +1,51 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from results import derivatives
+from results.models import DRForm
+from results.storage import get_drform_storage
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail and feed-size renditions for existing DR form images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.DERIVATIVE_WORKERS or 1)
+        parser.add_argument('--force', action='store_true', help="Re-render renditions that already exist.")
+
+    def handle(self, *args, **options):
+        storage = get_drform_storage()
+        # Several forms can share one content-addressed image; render each image once
+        images = {}
+        for pk, name in DRForm.objects.exclude(image='').values_list('pk', 'image').iterator(chunk_size=1000):
+            images.setdefault(name, []).append(pk)
+
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=get_context('spawn')) as pool:
+            futures = {}
+            for name, form_ids in images.items():
+                names, todo = derivatives.pending_outputs(name, options['force'])
+                if not storage.exists(name):
+                    self.stderr.write(self.style.WARNING(f"{name} is missing, skipped"))
+                    continue
+                if todo:
+                    futures[pool.submit(derivatives.render, storage.path(name), todo)] = (name, names, form_ids)
+                else:
+                    DRForm.objects.filter(pk__in=form_ids).update(derivatives=names, updated_at=timezone.now())
+
+            for future in as_completed(futures):
+                name, names, form_ids = futures[future]
+                try:
+                    future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(f"{name}: {exc}"))
+                    continue
+                DRForm.objects.filter(pk__in=form_ids).update(derivatives=names, updated_at=timezone.now())
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{built} images processed, {failed} failed, {len(images)} total"))
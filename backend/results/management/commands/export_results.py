@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from results import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every verified DR form (station, district, constituency, per-party totals, hash, verifier) "
+        "as CSV or NDJSON. Pass the printed 'until' as --since next time to pull only newer verifications."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(export.CONTENT_TYPES), default='csv')
+        parser.add_argument('--since', help="Only forms verified after this ISO 8601 date-time.")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout).")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output (needs --output).")
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options['since']) if options['since'] else None
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['gzip'] and not options['output']:
+            raise CommandError("--gzip needs --output.")
+
+        until = export.export_until()
+        chunks = export.stream(options['format'], since, until, compress=options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+        # stderr, so stdout stays pure data
+        self.stderr.write(f"until {until.isoformat()}")
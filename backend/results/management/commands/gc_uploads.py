@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from results import resumable
+
+
+class Command(BaseCommand):
+    help = "Remove abandoned resumable uploads (sessions and partial files) older than --hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=resumable.SESSION_TTL.total_seconds() / 3600,
+                            help="Age (since the last chunk) after which a session is removed.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be removed.")
+
+    def handle(self, *args, **options):
+        sessions, files, size = resumable.collect_garbage(
+            max_age=timedelta(hours=options['hours']), dry_run=options['dry_run'],
+        )
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {sessions} upload sessions and {files} partial files ({size / (1024 * 1024):.1f}MB)."
+        ))
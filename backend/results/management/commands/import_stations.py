@@ -0,0 +1,54 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from results.importers import detect_format, import_stations, open_text, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Import or update polling stations from a CSV (header: station_id,name,district,"
+        "constituency,location) or NDJSON file, upserting by station_id in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--rejects', help="Write rejected rows here as NDJSON (line, reason, record).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        started = time.monotonic()
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+
+        def on_batch(stats):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{stats['read']} rows read ({stats['read'] / max(elapsed, 1e-6):.0f}/s): "
+                f"{stats['created']} created, {stats['updated']} updated, {stats['rejected']} rejected"
+            )
+
+        def on_reject(line, record, reason):
+            if rejects:
+                rejects.write(json.dumps({'line': line, 'reason': reason, 'record': record}) + "\n")
+            else:
+                self.stderr.write(self.style.WARNING(f"line {line}: {reason}"))
+
+        try:
+            with open_text(path) as stream:
+                stats = import_stations(
+                    read_records(stream, fmt), options['batch_size'], on_batch, on_reject
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.monotonic() - started:.1f}s: {stats['created']} created, "
+            f"{stats['updated']} updated, {stats['unchanged']} unchanged, {stats['rejected']} rejected."
+        ))
@@ -0,0 +1,77 @@
+import hashlib
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from results.models import DRForm, MediaBlob
+from results.storage import content_name, digest_from_name, get_drform_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move existing DR form images into the content-addressed layout "
+        "(dr_forms/ab/cd/<sha256>.ext), merge byte-identical duplicates and "
+        "rebuild the MediaBlob reference counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would move without touching anything.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = get_drform_storage()
+        renamed = {}  # legacy name -> content-addressed name
+        moved = merged = missing = 0
+
+        forms = DRForm.objects.exclude(image='').order_by('pk').values_list('pk', 'image')
+        for pk, name in forms.iterator(chunk_size=1000):
+            if digest_from_name(name):
+                continue
+            if name not in renamed:
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(self.style.WARNING(f"DRForm {pk}: {name} is missing, left as is"))
+                    continue
+                with storage.open(name, 'rb') as handle:
+                    sha256 = hashlib.sha256()
+                    for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+                        sha256.update(chunk)
+                target = content_name(sha256.hexdigest(), name)
+                if storage.exists(target):
+                    merged += 1
+                    if not dry_run:
+                        storage.delete(name)
+                else:
+                    moved += 1
+                    if not dry_run:
+                        os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+                        os.replace(storage.path(name), storage.path(target))
+                renamed[name] = target
+                self.stdout.write(f"{name} -> {target}")
+            if not dry_run:
+                DRForm.objects.filter(pk=pk).update(image=renamed[name], updated_at=timezone.now())
+
+        if not dry_run:
+            self.rebuild_blobs(storage)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved} moved, {merged} merged into an existing copy, {missing} missing"
+            + (" (dry run)" if dry_run else "")
+        ))
+
+    def rebuild_blobs(self, storage):
+        refs = DRForm.objects.exclude(image='').order_by().values('image').annotate(refs=Count('id'))
+        blobs = []
+        for row in refs.iterator():
+            name = row['image']
+            try:
+                size = storage.size(name)
+            except OSError:
+                size = None
+            blobs.append(MediaBlob(path=name, sha256_hash=digest_from_name(name), size=size, ref_count=row['refs']))
+        with transaction.atomic():
+            MediaBlob.objects.all().delete()
+            MediaBlob.objects.bulk_create(blobs, batch_size=1000)
@@ -0,0 +1,45 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from results.importers import detect_format, open_text, provision_agents, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Create agent accounts in bulk from a CSV (header: full_name,phone,email,district,"
+        "constituency,polling_station) or NDJSON file. Writes the generated credentials as CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults from the file extension.")
+        parser.add_argument('--output', help="Write credentials here instead of stdout.")
+        parser.add_argument('--workers', type=int, default=settings.PROVISIONING_WORKERS,
+                            help="Processes used for password hashing.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path == '-' else detect_format(path))
+        try:
+            with open_text(path) as stream:
+                created, rejected = provision_agents(
+                    read_records(stream, fmt), options['workers'], options['batch_size']
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        try:
+            writer = csv.DictWriter(out, fieldnames=['line', 'full_name', 'polling_station', 'username', 'password'])
+            writer.writeheader()
+            writer.writerows(created)
+        finally:
+            if options['output']:
+                out.close()
+
+        for item in rejected:
+            self.stderr.write(self.style.WARNING(f"line {item['line']} ({item['email']}): {item['error']}"))
+        self.stderr.write(self.style.SUCCESS(f"{len(created)} agents created, {len(rejected)} rejected."))
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from results import publisher
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every static results snapshot (summary, districts, constituencies, feed pages) into "
+        "SNAPSHOT_ROOT, rewriting only files whose content changed and removing stale ones."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written, removed = publisher.publish(full=True)
+        if options['verbosity'] > 1:
+            for path in written:
+                self.stdout.write(f"wrote {path}")
+            for path in removed:
+                self.stdout.write(f"removed {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(written)} and removed {len(removed)} snapshot files in {settings.SNAPSHOT_ROOT} "
+            f"({time.monotonic() - started:.1f}s)."
+        ))
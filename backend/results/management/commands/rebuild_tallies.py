@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from results import conflicts, tallies
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-station form groups, stored vote tallies and regional "
+        "rollups from a full recount of DR forms and report any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only compare the national tallies with a recount; do not rewrite anything.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            recounted = tallies.recount()
+            drift = tallies.diff(recounted, tallies.current())
+        else:
+            drifted_groups = conflicts.rebuild()
+            if drifted_groups:
+                self.stdout.write(self.style.WARNING(f"{drifted_groups} station form groups were out of date"))
+            recounted, drift = tallies.rebuild()
+
+        for party in sorted(recounted):
+            self.stdout.write(f"{party}: {recounted[party]}")
+
+        if drift:
+            for party, votes in sorted(drift.items()):
+                self.stdout.write(self.style.WARNING(f"{party} was off by {votes:+d}"))
+            if options['check']:
+                self.stderr.write(self.style.ERROR("Stored tallies drifted; run without --check to rebuild."))
+                raise SystemExit(1)
+        else:
+            self.stdout.write(self.style.SUCCESS("Stored tallies match the recount."))
+
+        if options['check']:
+            return
+
+        drifted_regions = tallies.rebuild_regions()
+        if drifted_regions:
+            self.stdout.write(self.style.WARNING(f"{drifted_regions} regional rollups were out of date"))
+        self.stdout.write(self.style.SUCCESS("Stored tallies rebuilt."))
@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from results import jobs
+
+
+def _worker(worker_id, stop_event, poll_interval, batch):
+    # Finish the current job and stop with the parent rather than dying mid-job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    jobs.work(worker_id, stop_event, poll_interval, batch)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (post-upload processing, tally updates) on the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help="Number of worker processes.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--batch', type=int, default=10, help="Jobs claimed per round trip.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+        if options['once']:
+            ran = jobs.run_pending(prefix, options['batch'])
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs."))
+            return
+
+        stop_event = multiprocessing.Event()
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping workers…")
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        # Forked children must not share the parent's database connection
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(
+                target=_worker,
+                args=(f"{prefix}-{n}", stop_event, options['poll_interval'], options['batch']),
+                daemon=True,
+            )
+            for n in range(max(options['concurrency'], 1))
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f"Started {len(workers)} workers."))
+        for worker in workers:
+            worker.join()
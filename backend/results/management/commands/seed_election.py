@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from results.synthetic import seed_election
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic national election: districts, constituencies, polling stations, "
+        "agents, DR forms with totals, results, reports and news. For load tests only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--districts', type=int, default=20)
+        parser.add_argument('--constituencies', type=int, default=3, help="Per district.")
+        parser.add_argument('--stations', type=int, default=20, help="Per constituency.")
+        parser.add_argument('--forms', type=int, default=1, help="DR forms per station.")
+        parser.add_argument('--verified', type=float, default=0.8, help="Fraction of forms verified.")
+        parser.add_argument('--reports', type=float, default=0.02, help="Fraction of forms reported.")
+        parser.add_argument('--news', type=int, default=20)
+        parser.add_argument('--prefix', default='SYN', help="Station id / username prefix.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible runs.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            created = seed_election(
+                districts=options['districts'], constituencies=options['constituencies'],
+                stations=options['stations'], forms=options['forms'], verified=options['verified'],
+                reports=options['reports'], news=options['news'], prefix=options['prefix'],
+                seed=options['seed'], batch_size=options['batch_size'],
+                on_progress=lambda message: self.stdout.write(message),
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        summary = ', '.join(f"{count} {name}" for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s: {summary}."))
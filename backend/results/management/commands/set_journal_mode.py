@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST')
+
+
+class Command(BaseCommand):
+    help = (
+        "Set the journal mode of a SQLite database (WAL by default, so feed reads run alongside a writer). "
+        "The mode is stored in the database file: run once per deployment, with no other process writing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', nargs='?', default='WAL', choices=MODES, type=str.upper)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"{options['database']} is a {connection.vendor} database, not SQLite.")
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA journal_mode={options['mode']}")
+            mode = cursor.fetchone()[0].upper()
+        if mode != options['mode']:
+            raise CommandError(f"SQLite kept journal_mode={mode} (is another process using the database?).")
+        self.stdout.write(self.style.SUCCESS(f"{connection.settings_dict['NAME']}: journal_mode={mode}"))
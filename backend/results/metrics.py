@@ -0,0 +1,285 @@
+"""
+Per-request performance metrics in Prometheus text exposition format.
+
+``MetricsMiddleware`` records, per URL route pattern (bounded label
+cardinality): request counts by status, a latency histogram, SQL query
+count and time, serializer time, request (upload) bytes and response
+sizes. Everything is kept in process memory behind one lock; with several
+worker processes each exposes its own numbers, so scrape every process
+or aggregate by instance.
+
+Outliers: a sampled fraction of requests (``SLOW_REQUEST_SAMPLE_RATE``)
+also keep their SQL text, and those that take longer than
+``SLOW_REQUEST_SECONDS`` are logged to ``results.slow_requests`` with
+their slowest statements. Unsampled requests only pay for counters.
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+slow_logger = logging.getLogger('results.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 10240, 102400, 1048576, 10485760, 52428800)
+SLOW_SQL_KEPT = 10
+
+_request = ContextVar('metrics_request', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Counters and histograms keyed by ``(name, labels)``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def expose(self):
+        """The registry in Prometheus text format (version 0.0.4)."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            lines, typed = [], set()
+            for (name, labels), value in counters:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            for (name, labels), histogram in histograms:
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+HELP = {
+    'nup_http_requests_total': "Requests handled, by route, method and status.",
+    'nup_http_request_duration_seconds': "Time to produce the response (headers, for streams).",
+    'nup_db_queries_per_request': "SQL statements run per request.",
+    'nup_db_query_seconds_total': "Time spent in SQL.",
+    'nup_serializer_seconds_total': "Time spent building serializer .data.",
+    'nup_http_request_bytes_total': "Request body bytes received (uploads).",
+    'nup_http_response_bytes': "Response body size (non-streaming responses).",
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds', 'serializer_seconds', 'serializer_depth', 'statements')
+
+    def __init__(self, sampled):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.statements = [] if sampled else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.query_seconds += elapsed
+            if self.statements is not None:
+                self.statements.append((elapsed, sql))
+
+
+def install_serializer_timing():
+    """
+    Time ``BaseSerializer.data`` (where to_representation runs) for the
+    current request. Nested calls are counted once, at the outermost level.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, '_metrics_timed', False):
+        return
+
+    def timed_data(self):
+        stats = _request.get()
+        if stats is None:
+            return original.fget(self)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_seconds += time.perf_counter() - start
+
+    timed_data._metrics_timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+def watch_queries(stack, stats):
+    """Time the queries of this thread's connections until ``stack`` closes."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(stats))
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def record(request, response, stats, elapsed):
+    route = route_of(request)
+    method = request.method
+    try:
+        received = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        received = 0
+    size = None if response.streaming else len(response.content)
+    with registry.lock:
+        registry.inc('nup_http_requests_total', (('route', route), ('method', method), ('status', response.status_code)))
+        registry.observe('nup_http_request_duration_seconds', (('route', route), ('method', method)), elapsed, LATENCY_BUCKETS)
+        if stats is not None:
+            registry.observe('nup_db_queries_per_request', (('route', route),), stats.queries, QUERY_BUCKETS)
+            registry.inc('nup_db_query_seconds_total', (('route', route),), stats.query_seconds)
+            registry.inc('nup_serializer_seconds_total', (('route', route),), stats.serializer_seconds)
+        if received:
+            registry.inc('nup_http_request_bytes_total', (('route', route),), received)
+        if size is not None:
+            registry.observe('nup_http_response_bytes', (('route', route),), size, SIZE_BUCKETS)
+
+    if stats is not None and stats.statements is not None and elapsed >= settings.SLOW_REQUEST_SECONDS:
+        slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)[:SLOW_SQL_KEPT]
+        slow_logger.warning(
+            "Slow request %s %s (%s) took %.3fs: %d queries in %.3fs, serializers %.3fs\n%s",
+            method, request.get_full_path(), route, elapsed, stats.queries, stats.query_seconds,
+            stats.serializer_seconds,
+            "\n".join(f"  {seconds * 1000:8.1f} ms  {sql}" for seconds, sql in slowest),
+        )
+
+
+class MetricsMiddleware:
+    """Place first in MIDDLEWARE so the timings cover the whole stack."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.METRICS_ENABLED
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats = RequestStats(sampled=random.random() < settings.SLOW_REQUEST_SAMPLE_RATE)
+        token = _request.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                watch_queries(stack, stats)
+                response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats = RequestStats(sampled=random.random() < settings.SLOW_REQUEST_SAMPLE_RATE)
+        token = _request.set(stats)
+        start = time.perf_counter()
+        stack = ExitStack()
+        try:
+            # Sync views and ORM calls of this request run in the one thread
+            # sync_to_async hands them (thread_sensitive), whose connections
+            # are watched for the duration; the context carries ``stats``.
+            await sync_to_async(watch_queries)(stack, stats)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _request.reset(token)
+        record(request, response, stats, time.perf_counter() - start)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint; requires ``Bearer METRICS_TOKEN``. Without a
+    token it is only served with DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
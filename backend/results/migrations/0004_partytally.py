@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:19
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def seed_tallies(apps, schema_editor):
+    DRForm = apps.get_model('results', 'DRForm')
+    PartyTally = apps.get_model('results', 'PartyTally')
+    totals = Counter()
+    for form_totals in DRForm.objects.values_list('totals', flat=True).iterator():
+        for party, value in (form_totals or {}).items():
+            try:
+                totals[str(party)] += int(value)
+            except (TypeError, ValueError):
+                continue
+    PartyTally.objects.bulk_create(
+        PartyTally(party=party, votes=votes) for party, votes in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0003_nupnews_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartyTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party', models.CharField(max_length=10, unique=True)),
+                ('votes', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['party'],
+            },
+        ),
+        migrations.RunPython(seed_tallies, migrations.RunPython.noop),
+    ]
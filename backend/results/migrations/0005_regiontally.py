@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:19
+
+from django.db import migrations, models
+
+
+def seed_regions(apps, schema_editor):
+    DRForm = apps.get_model('results', 'DRForm')
+    RegionTally = apps.get_model('results', 'RegionTally')
+    rows = {}
+    forms = DRForm.objects.filter(verified=True).values_list(
+        'polling_station__station_id',
+        'polling_station__district',
+        'polling_station__constituency',
+        'totals',
+    )
+    for station_id, district, constituency, form_totals in forms.iterator():
+        keys = [
+            ('station', station_id, constituency),
+            ('constituency', constituency, district),
+            ('district', district, ''),
+            ('national', '', ''),
+        ]
+        newly_reporting = ('station', station_id) not in rows
+        for level, name, parent in keys:
+            row = rows.setdefault(
+                (level, name),
+                RegionTally(level=level, name=name, parent=parent, totals={}),
+            )
+            for party, value in (form_totals or {}).items():
+                try:
+                    row.totals[str(party)] = row.totals.get(str(party), 0) + int(value)
+                except (TypeError, ValueError):
+                    continue
+            row.forms_reported += 1
+            if newly_reporting:
+                row.stations_reporting += 1
+    RegionTally.objects.bulk_create(rows.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0004_partytally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('national', 'National'), ('district', 'District'), ('constituency', 'Constituency'), ('station', 'Polling station')], max_length=20)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('parent', models.CharField(blank=True, default='', max_length=255)),
+                ('totals', models.JSONField(default=dict)),
+                ('forms_reported', models.PositiveIntegerField(default=0)),
+                ('stations_reporting', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['level', 'name'],
+                'indexes': [models.Index(fields=['level', 'parent'], name='region_tally_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('level', 'name'), name='unique_region_tally')],
+            },
+        ),
+        migrations.RunPython(seed_regions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+import results.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_blobs(apps, schema_editor):
+    DRForm = apps.get_model('results', 'DRForm')
+    MediaBlob = apps.get_model('results', 'MediaBlob')
+    refs = DRForm.objects.exclude(image='').order_by().values('image').annotate(refs=Count('id'))
+    MediaBlob.objects.bulk_create(
+        MediaBlob(path=row['image'], ref_count=row['refs']) for row in refs
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0005_regiontally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('sha256_hash', models.CharField(blank=True, db_index=True, max_length=128)),
+                ('size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='drform',
+            name='image',
+            field=models.ImageField(max_length=255, storage=results.storage.get_drform_storage, upload_to=results.storage.drform_image_path),
+        ),
+        migrations.RunPython(seed_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0006_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drform',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0008_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nupnews',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0009_nupnews_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['district'], name='agent_district_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(condition=models.Q(('verified', True)), fields=['-timestamp', '-id'], name='drform_verified_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(condition=models.Q(('verified', False)), fields=['-timestamp', '-id'], name='drform_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(condition=models.Q(('verified', True)), fields=['updated_at', 'id'], name='drform_verified_changes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(fields=['polling_station', 'verified'], name='drform_station_verified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(fields=['sha256_hash'], name='drform_sha256_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['polling_station', 'party'], name='result_station_party_idx'),
+        ),
+    ]
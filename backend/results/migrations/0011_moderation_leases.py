@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_verified_at(apps, schema_editor):
+    # Best available guess for forms verified before verified_at existed
+    DRForm = apps.get_model('results', 'DRForm')
+    DRForm.objects.filter(verified=True).update(verified_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0010_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drform',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='drform',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_forms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='drform',
+            name='verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='drform',
+            index=models.Index(fields=['verified_at'], name='drform_verified_at_idx'),
+        ),
+        migrations.RunPython(backfill_verified_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0011_moderation_leases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drform',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='drform',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('uploaded_by', 'idempotency_key'), name='drform_idempotency_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:32
+
+from collections import Counter, defaultdict, namedtuple
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copies of the results.tallies / results.conflicts helpers as of
+# this migration, so later changes to them do not change what it does.
+FormRow = namedtuple('FormRow', 'id station verified verified_at totals sha256_hash')
+FORM_COLUMNS = ('id', 'polling_station_id', 'verified', 'verified_at', 'totals', 'sha256_hash')
+MAX_VOTES = 2 ** 31 - 1
+MAX_PARTY_LENGTH = 50
+
+
+def parse_totals(totals):
+    votes = {}
+    if not isinstance(totals, dict):
+        return votes
+    for party, value in totals.items():
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= count <= MAX_VOTES and len(str(party)) <= MAX_PARTY_LENGTH:
+            votes[str(party)] = count
+    return votes
+
+
+def totals_key(totals):
+    return tuple(sorted((party, votes) for party, votes in parse_totals(totals).items() if votes))
+
+
+def choose_canonical(rows):
+    pool = [row for row in rows if row.verified] or list(rows)
+    unset = timezone.now()
+    pool.sort(key=lambda row: (row.verified_at is None, row.verified_at or unset, row.id))
+    first, scans = {}, defaultdict(set)
+    for position, row in enumerate(pool):
+        key = totals_key(row.totals)
+        first.setdefault(key, (position, row))
+        scans[key].add(row.sha256_hash or row.id)
+    best = min(first, key=lambda key: (-len(scans[key]), first[key][0]))
+    return first[best][1]
+
+
+def summarize(rows):
+    canonical = choose_canonical(rows)
+    totals_variants = len({totals_key(row.totals) for row in rows})
+    image_variants = len({row.sha256_hash for row in rows if row.sha256_hash})
+    return canonical, False, totals_variants, image_variants
+
+
+def seed_groups(apps, schema_editor):
+    # Until now the tallies counted every form; from here on only each
+    # station's canonical form counts, so group the existing forms and
+    # recount the tallies from the canonical ones.
+    DRForm = apps.get_model('results', 'DRForm')
+    PollingStation = apps.get_model('results', 'PollingStation')
+    StationFormGroup = apps.get_model('results', 'StationFormGroup')
+    PartyTally = apps.get_model('results', 'PartyTally')
+    RegionTally = apps.get_model('results', 'RegionTally')
+
+    by_station = defaultdict(list)
+    for values in DRForm.objects.order_by('polling_station_id', 'id').values_list(*FORM_COLUMNS).iterator():
+        by_station[values[1]].append(FormRow(*values))
+
+    now = timezone.now()
+    stations = {
+        pk: (station_id, district, constituency)
+        for pk, station_id, district, constituency
+        in PollingStation.objects.values_list('pk', 'station_id', 'district', 'constituency').iterator()
+    }
+    groups, national, regions = [], Counter(), {}
+    for station, rows in by_station.items():
+        canonical, _, totals_variants, image_variants = summarize(rows)
+        votes = parse_totals(canonical.totals)
+        groups.append(StationFormGroup(
+            station_id=station, canonical_id=canonical.id,
+            counted={'station': station, 'verified': bool(canonical.verified), 'votes': votes,
+                     **({'region': list(stations[station])} if station in stations else {})},
+            forms=len(rows), totals_variants=totals_variants, image_variants=image_variants,
+            conflict_since=now if totals_variants > 1 or image_variants > 1 else None,
+        ))
+        national.update(votes)
+        if not canonical.verified or station not in stations:
+            continue
+        station_id, district, constituency = stations[station]
+        for level, name, parent in (
+            ('station', station_id, constituency),
+            ('constituency', constituency, district),
+            ('district', district, ''),
+            ('national', '', ''),
+        ):
+            row = regions.setdefault((level, name), RegionTally(level=level, name=name, parent=parent, totals={}))
+            for party, count in votes.items():
+                row.totals[party] = row.totals.get(party, 0) + count
+            row.forms_reported += 1
+            row.stations_reporting += 1
+    StationFormGroup.objects.bulk_create(groups, batch_size=1000)
+
+    PartyTally.objects.all().delete()
+    PartyTally.objects.bulk_create(PartyTally(party=party, votes=votes) for party, votes in national.items())
+    RegionTally.objects.all().delete()
+    RegionTally.objects.bulk_create(regions.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0013_resumable_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationFormGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pinned', models.BooleanField(default=False)),
+                ('counted', models.JSONField(blank=True, null=True)),
+                ('forms', models.PositiveIntegerField(default=0)),
+                ('totals_variants', models.PositiveIntegerField(default=0)),
+                ('image_variants', models.PositiveIntegerField(default=0)),
+                ('conflict_since', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('canonical', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='results.drform')),
+                ('station', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='form_group', to='results.pollingstation')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('conflict_since__isnull', False)), fields=['-conflict_since', '-id'], name='station_conflicts_idx')],
+            },
+        ),
+        migrations.RunPython(seed_groups, migrations.RunPython.noop),
+    ]
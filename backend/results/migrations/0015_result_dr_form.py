@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+MAX_VOTES = 2 ** 31 - 1
+MAX_PARTY_LENGTH = 50
+
+
+def parse_totals(totals):
+    # Frozen copy of results.tallies.parse_totals as of this migration
+    votes = {}
+    if not isinstance(totals, dict):
+        return votes
+    for party, value in totals.items():
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= count <= MAX_VOTES and len(str(party)) <= MAX_PARTY_LENGTH:
+            votes[str(party)] = count
+    return votes
+
+
+def backfill_results(apps, schema_editor):
+    # Recounts sum these rows from now on: give every existing form its rows
+    DRForm = apps.get_model('results', 'DRForm')
+    Result = apps.get_model('results', 'Result')
+
+    rows = []
+    for form_id, station_id, totals in DRForm.objects.order_by('id').values_list(
+        'id', 'polling_station_id', 'totals'
+    ).iterator(chunk_size=2000):
+        rows.extend(
+            Result(dr_form_id=form_id, polling_station_id=station_id, party=party, votes=votes)
+            for party, votes in parse_totals(totals).items()
+        )
+        if len(rows) >= 5000:
+            Result.objects.bulk_create(rows, batch_size=1000)
+            rows = []
+    Result.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('results', '0014_station_form_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='dr_form',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='results.drform'),
+        ),
+        migrations.AlterField(
+            model_name='result',
+            name='party',
+            field=models.CharField(choices=[('NUP', 'NUP'), ('NRM', 'NRM')], max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.UniqueConstraint(fields=('dr_form', 'party'), name='result_form_party_uniq'),
+        ),
+        migrations.RunPython(backfill_results, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.utils import timezone
+
+from .storage import drform_image_path, get_drform_storage
 
 
 # -------------------------------
@@ -9,6 +14,13 @@ from django.conf import settings
 class User(AbstractUser):
     is_agent = models.BooleanField(default=False)
     is_admin = models.BooleanField(default=False)
+    # Cache validator of the feeds that show verifier names (results.caching)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['updated_at'], name='user_updated_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -23,6 +35,13 @@ class PollingStation(models.Model):
     district = models.CharField(max_length=255)
     constituency = models.CharField(max_length=255)
     location = models.CharField(max_length=255, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Cache validator of the feeds that embed stations (results.caching)
+            models.Index(fields=['updated_at'], name='station_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.station_id} - {self.name}"
@@ -41,6 +60,11 @@ class Agent(models.Model):
     polling_station = models.ForeignKey('PollingStation', on_delete=models.CASCADE, related_name='agents')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['district'], name='agent_district_idx'),
+        ]
+
     def __str__(self):
         return f"{self.full_name} ({self.polling_station})"
 
@@ -50,13 +74,15 @@ class Agent(models.Model):
 # -------------------------------
 class DRForm(models.Model):
     polling_station = models.ForeignKey(PollingStation, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='dr_forms/')
+    image = models.ImageField(upload_to=drform_image_path, storage=get_drform_storage, max_length=255)
     video = models.FileField(upload_to='dr_videos/', null=True, blank=True)
     sha256_hash = models.CharField(max_length=128)
     timestamp = models.DateTimeField(auto_now_add=True)
     totals = models.JSONField(default=dict)
     verified = models.BooleanField(default=False)
     gps = models.JSONField(null=True, blank=True)
+    # {size: name} of the resized renditions built by results.derivatives
+    derivatives = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     uploaded_by = models.ForeignKey(
@@ -73,9 +99,49 @@ class DRForm(models.Model):
         blank=True,
         related_name="verified_forms"
     )
+    verified_at = models.DateTimeField(null=True, blank=True)
+    # Moderation lease (results.moderation): who is reviewing it, until when
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="claimed_forms"
+    )
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+    # Client-chosen key of a batch-synced upload (results.sync), unique per uploader
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Public feeds: verified=True ORDER BY -timestamp, -id (keyset pages)
+            models.Index(fields=['-timestamp', '-id'], condition=models.Q(verified=True), name='drform_verified_feed_idx'),
+            # Moderation queue: verified=False, same ordering
+            models.Index(fields=['-timestamp', '-id'], condition=models.Q(verified=False), name='drform_pending_idx'),
+            # Live results cursor and feed cache validators (Max(updated_at))
+            models.Index(fields=['updated_at', 'id'], condition=models.Q(verified=True), name='drform_verified_changes_idx'),
+            models.Index(fields=['polling_station', 'verified'], name='drform_station_verified_idx'),
+            models.Index(fields=['sha256_hash'], name='drform_sha256_idx'),
+            # Moderation throughput (verified in the last N minutes)
+            models.Index(fields=['verified_at'], name='drform_verified_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['uploaded_by', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='drform_idempotency_key_uniq',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.verified and self.verified_at is None:
+            self.verified_at = timezone.now()
+        elif not self.verified:
+            self.verified_at = None
+        # Keep the row and its tally update (results.signals) in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"DRForm {self.polling_station.station_id} @ {self.timestamp.isoformat()}"
@@ -102,23 +168,223 @@ class NupNews(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
 # -------------------------------
 class Result(models.Model):
+    """
+    One party's votes on one DR form: DRForm.totals as typed rows
+    (written by results.votes) so they can be summed in SQL. Rows without
+    a dr_form predate that and are not counted.
+    """
     party_choices = [
         ("NUP", "NUP"),
         ("NRM", "NRM"),
     ]
 
-    party = models.CharField(max_length=10, choices=party_choices)
+    party = models.CharField(max_length=50, choices=party_choices)
     votes = models.PositiveIntegerField(default=0)
     polling_station = models.ForeignKey(
         "PollingStation", on_delete=models.CASCADE, related_name="results"
     )
+    dr_form = models.ForeignKey(DRForm, on_delete=models.CASCADE, null=True, blank=True, related_name="votes")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['polling_station', 'party'], name='result_station_party_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dr_form', 'party'], name='result_form_party_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.party} - {self.votes} votes"
+
+# -------------------------------
+# Vote tally aggregate
+# -------------------------------
+class PartyTally(models.Model):
+    """
+    Running national vote total per party, maintained incrementally from
+    DRForm saves/deletes (see results.tallies) so the summary is a cheap read.
+    """
+    party = models.CharField(max_length=10, unique=True)
+    votes = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['party']
+
+    def __str__(self):
+        return f"{self.party}: {self.votes}"
+
+
+# -------------------------------
+# Regional rollups (verified forms only)
+# -------------------------------
+class RegionTally(models.Model):
+    """
+    Materialized vote totals and reporting counts for one node of the
+    national / district / constituency / station hierarchy.
+    """
+    NATIONAL = 'national'
+    DISTRICT = 'district'
+    CONSTITUENCY = 'constituency'
+    STATION = 'station'
+    LEVEL_CHOICES = [
+        (NATIONAL, 'National'),
+        (DISTRICT, 'District'),
+        (CONSTITUENCY, 'Constituency'),
+        (STATION, 'Polling station'),
+    ]
+
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
+    # district/constituency name, station_id for stations, '' for national
+    name = models.CharField(max_length=255, blank=True)
+    parent = models.CharField(max_length=255, blank=True, default='')
+    totals = models.JSONField(default=dict)
+    forms_reported = models.PositiveIntegerField(default=0)
+    stations_reporting = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['level', 'name']
+        constraints = [
+            models.UniqueConstraint(fields=['level', 'name'], name='unique_region_tally'),
+        ]
+        indexes = [
+            models.Index(fields=['level', 'parent'], name='region_tally_parent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.level} {self.name}".strip()
+
+
+# -------------------------------
+# Forms per station and conflicts (see results.conflicts)
+# -------------------------------
+class StationFormGroup(models.Model):
+    """
+    The DR forms of one polling station: which one is counted in the
+    tallies and whether the others disagree with it.
+    """
+    # No FK constraint: the row must outlive a deleted station until the
+    # tallies have taken its counted form back out
+    station = models.OneToOneField(
+        PollingStation, on_delete=models.DO_NOTHING, db_constraint=False, related_name="form_group"
+    )
+    canonical = models.ForeignKey(DRForm, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # Chosen by a moderator rather than by results.conflicts.choose_canonical
+    pinned = models.BooleanField(default=False)
+    # Snapshot (results.tallies.make_snapshot) of the canonical form as counted
+    counted = models.JSONField(null=True, blank=True)
+    forms = models.PositiveIntegerField(default=0)
+    totals_variants = models.PositiveIntegerField(default=0)
+    image_variants = models.PositiveIntegerField(default=0)
+    # When the forms started to disagree; null while they agree
+    conflict_since = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-conflict_since', '-id'], condition=models.Q(conflict_since__isnull=False),
+                name='station_conflicts_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.forms} forms for station {self.station_id}"
+
+
+
+# -------------------------------
+# Content-addressed media
+# -------------------------------
+class MediaBlob(models.Model):
+    """A stored DR form image and how many DRForm rows reference it."""
+    path = models.CharField(max_length=255, unique=True)
+    sha256_hash = models.CharField(max_length=128, blank=True, db_index=True)
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.ref_count} refs)"
+
+
+# -------------------------------
+# Resumable uploads (see results.resumable)
+# -------------------------------
+class UploadSession(models.Model):
+    IMAGE = 'image'
+    VIDEO = 'video'
+    KIND_CHOICES = [(IMAGE, 'Image'), (VIDEO, 'Video')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+    # polling_station (pk), totals and gps of the form to create
+    fields = models.JSONField(default=dict, blank=True)
+    # The form a video is attached to, or the form an image upload created
+    drform = models.ForeignKey(DRForm, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # Set while a PATCH is writing, so two requests never append at once
+    locked_until = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='uploadsession_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} upload {self.pk} ({self.offset}/{self.length})"
+
+
+# -------------------------------
+# Background jobs (see results.jobs)
+# -------------------------------
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    leased_by = models.CharField(max_length=64, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='job_lease_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.party} - {self.votes} votes"
\ No newline at end of file
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,138 @@
+"""
+Moderation of uploaded DR forms: a leased work queue and bulk verification.
+
+Admins ``claim_forms`` the next pending forms under a time-limited lease
+(``results.leasing``: ``SKIP LOCKED`` where supported, compare-and-set on
+SQLite), so reviewers working at once never get the same form. A lease
+that is not renewed simply expires and the form becomes claimable again.
+
+``verify_forms`` flips a whole batch with one ``UPDATE … WHERE verified =
+false`` and queues a single ``apply_tallies`` job for it, so aggregates
+and the feed caches (keyed on ``updated_at``) move once per batch rather
+than once per form. The UPDATE bypasses the model signals, which is why the
+tally changes are queued here.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import jobs, leasing, tallies
+from .models import DRForm
+
+CLAIM_SECONDS = 600
+MAX_CLAIM = 100
+MAX_BATCH = 5000
+
+VERIFIED = 'verified'
+ALREADY_VERIFIED = 'already_verified'
+NOT_FOUND = 'not_found'
+
+# Filter keys accepted by verify_forms, mapped to DRForm lookups
+FILTERS = {
+    'station_id': 'polling_station__station_id',
+    'district': 'polling_station__district',
+    'constituency': 'polling_station__constituency',
+    'uploaded_by': 'uploaded_by_id',
+    'uploaded_before': 'timestamp__lt',
+}
+
+
+def pending_matching(filters):
+    """Pending forms matching ``filters`` (keys of ``FILTERS``), oldest first."""
+    lookups = {FILTERS[key]: value for key, value in filters.items()}
+    return DRForm.objects.filter(verified=False, **lookups).order_by('timestamp', 'id')
+
+
+def claimable(now=None):
+    """Pending forms nobody holds an unexpired lease on, oldest first."""
+    now = now or timezone.now()
+    return DRForm.objects.filter(verified=False).filter(
+        Q(claimed_by__isnull=True) | Q(claim_expires_at__lte=now)
+    ).order_by('timestamp', 'id')
+
+
+def claim_forms(user, limit, lease_seconds=CLAIM_SECONDS):
+    """
+    Lease up to ``limit`` pending forms to ``user``: the ones they already
+    hold (lease renewed) first, then the oldest claimable ones.
+    Returns ``(pks, lease expiry)``.
+    """
+    now = timezone.now()
+    expires = now + timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        held = list(
+            DRForm.objects.filter(verified=False, claimed_by=user, claim_expires_at__gt=now)
+            .order_by('timestamp', 'id').values_list('id', flat=True)[:limit]
+        )
+        if held:
+            DRForm.objects.filter(pk__in=held).update(claim_expires_at=expires)
+    claimed = []
+    if len(held) < limit:
+        claimed = leasing.claim(claimable(now), limit - len(held), 'claimed_by', user, claim_expires_at=expires)
+    return held + claimed, expires
+
+
+def release_forms(user, ids):
+    """Hand ``user``'s leases on ``ids`` back to the queue. Returns the count."""
+    return DRForm.objects.filter(pk__in=ids, claimed_by=user, verified=False).update(
+        claimed_by=None, claim_expires_at=None
+    )
+
+
+def queue_stats():
+    """Queue depth, active leases and recent verification throughput."""
+    now = timezone.now()
+    pending = DRForm.objects.filter(verified=False)
+    leased = pending.filter(claimed_by__isnull=False, claim_expires_at__gt=now)
+    oldest = pending.order_by('timestamp', 'id').values_list('timestamp', flat=True).first()
+    verified = DRForm.objects.filter(verified=True)
+    last_15 = verified.filter(verified_at__gte=now - timedelta(minutes=15)).count()
+    return {
+        'depth': pending.count(),
+        'claimed': leased.count(),
+        'reviewers': leased.order_by().values('claimed_by').distinct().count(),
+        'oldest_pending_seconds': int((now - oldest).total_seconds()) if oldest else 0,
+        'verified_last_15m': last_15,
+        'verified_last_60m': verified.filter(verified_at__gte=now - timedelta(minutes=60)).count(),
+        'per_minute': round(last_15 / 15, 2),
+    }
+
+
+def verify_forms(user, ids=None, filters=None, limit=MAX_BATCH):
+    """
+    Verify the forms in ``ids``, or up to ``limit`` pending forms matching
+    ``filters``, in one transaction. Returns ``{id: outcome}`` with outcome
+    one of ``VERIFIED``, ``ALREADY_VERIFIED`` or ``NOT_FOUND``.
+    """
+    with transaction.atomic():
+        if ids is None:
+            ids = list(pending_matching(filters or {}).values_list('id', flat=True)[:limit])
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+
+        now = timezone.now()
+        DRForm.objects.filter(pk__in=ids, verified=False).update(
+            verified=True, verified_by=user, verified_at=now, updated_at=now,
+            claimed_by=None, claim_expires_at=None,
+        )
+        # Read back the rows this UPDATE changed (its write locks are held
+        # until commit) rather than trusting an earlier read.
+        changed = list(
+            DRForm.objects.filter(pk__in=ids, verified=True, verified_by=user, updated_at=now)
+            .values_list('id', 'polling_station_id', 'totals')
+        )
+        if changed:
+            jobs.enqueue('apply_tallies', {'changes': [
+                [tallies.make_snapshot(station, False, totals), tallies.make_snapshot(station, True, totals)]
+                for _, station, totals in changed
+            ], 'forms': [pk for pk, _, _ in changed]})
+
+        done = {pk for pk, _, _ in changed}
+        existing = set(DRForm.objects.filter(pk__in=ids).values_list('id', flat=True))
+    return {
+        pk: VERIFIED if pk in done else ALREADY_VERIFIED if pk in existing else NOT_FOUND
+        for pk in ids
+    }
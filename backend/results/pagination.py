@@ -0,0 +1,129 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(timestamp, id)``, newest first.
+
+    Each page is fetched with ``WHERE (timestamp, id) < cursor ... LIMIT n`` so
+    deep pages cost the same as the first one, no COUNT(*) is run, and rows
+    inserted while a client scrolls never shift or duplicate items.
+
+    If ``page_mode_class`` is set, requests carrying ``?page=`` fall back to
+    that page-number paginator so existing clients keep working.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_mode_class = None
+    timestamp_field = 'timestamp'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.delegate = None
+        if self.page_mode_class is not None and 'page' in request.query_params:
+            self.delegate = self.page_mode_class()
+            return self.delegate.paginate_queryset(queryset, request, view)
+
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.cursor = self.decode_cursor(cursor) if cursor else None
+        ts = self.timestamp_field
+
+        if self.cursor and self.cursor[0] == 'p':
+            # Walking back towards newer rows: scan ascending, then flip.
+            _, stamp, pk = self.cursor
+            rows = list(
+                queryset.filter(Q(**{f'{ts}__gt': stamp}) | Q(**{ts: stamp, 'id__gt': pk}))
+                .order_by(ts, 'id')[:size + 1]
+            )
+            self.has_previous = len(rows) > size
+            self.has_next = True
+            rows = rows[:size]
+            rows.reverse()
+        else:
+            if self.cursor:
+                _, stamp, pk = self.cursor
+                queryset = queryset.filter(Q(**{f'{ts}__lt': stamp}) | Q(**{ts: stamp, 'id__lt': pk}))
+            rows = list(queryset.order_by(f'-{ts}', '-id')[:size + 1])
+            self.has_next = len(rows) > size
+            self.has_previous = self.cursor is not None
+            rows = rows[:size]
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, direction, row):
+        raw = f"{direction}|{getattr(row, self.timestamp_field).isoformat()}|{row.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, value):
+        try:
+            direction, stamp, pk = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction, datetime.fromisoformat(stamp), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, direction, row):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(direction, row))
+
+    def get_next_link(self):
+        if self.delegate is not None:
+            return self.delegate.get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self._link('n', self.page[-1])
+
+    def get_previous_link(self):
+        if self.delegate is not None:
+            return self.delegate.get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self._link('p', self.page[0])
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BoundedPagination(PageNumberPagination):
+    """Page-number pagination for admin lists that used to return every row."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
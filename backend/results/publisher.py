@@ -0,0 +1,222 @@
+"""
+Static snapshots of the public results, served by a plain file server.
+
+Under ``SNAPSHOT_ROOT`` (default ``MEDIA_ROOT/snapshots``)::
+
+    summary.json                  national totals and the district rollups
+    district/<slug>.json          a district and its constituencies
+    constituency/<slug>.json      a constituency and its polling stations
+    feed/latest.json              the newest verified forms, as /api/drforms/public/
+    feed/<n>.json                 verified forms with ids in (n*100, (n+1)*100]
+    manifest.json                 version, and each file's version and path
+
+Every file has a ``.gz`` twin (for ``gzip_static``) and is wrapped as
+``{"version", "generated_at", "data"}``. Feed pages are buckets of form ids
+rather than offsets, so a change only ever touches the page of the forms
+it names. The ``publish_snapshots`` job renders just the files a change
+can affect and rewrites only those whose content differs; each file is
+swapped in with ``os.replace`` and the manifest goes last.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import tallies
+from .models import DRForm, PollingStation, RegionTally
+from .serializers import DRFormPublicSerializer, RegionTallySerializer
+
+FEED_PAGE_SIZE = 100
+LATEST_SIZE = 50
+MANIFEST = 'manifest.json'
+LATEST = 'feed/latest.json'
+
+ROLLUP_CHILD_LEVEL = {
+    RegionTally.NATIONAL: RegionTally.DISTRICT,
+    RegionTally.DISTRICT: RegionTally.CONSTITUENCY,
+    RegionTally.CONSTITUENCY: RegionTally.STATION,
+}
+
+
+def rollup(level, name):
+    """A region's RegionTally with its children's, or None if it has no results."""
+    region = RegionTally.objects.filter(level=level, name=name).first()
+    if region is None:
+        return None
+    data = RegionTallySerializer(region).data
+    child_level = ROLLUP_CHILD_LEVEL.get(level)
+    if child_level:
+        children = RegionTally.objects.filter(level=child_level, parent=name)
+        data["children"] = RegionTallySerializer(children, many=True).data
+    return data
+
+
+def region_path(level, name):
+    # The hash keeps names that slugify alike apart
+    digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+    return f"{level}/{slugify(name) or level}-{digest}.json"
+
+
+def feed_page(form_id):
+    return (form_id - 1) // FEED_PAGE_SIZE
+
+
+def _public_forms():
+    return DRForm.objects.filter(verified=True).select_related('polling_station', 'verified_by')
+
+
+def render_summary():
+    return {"summary": tallies.summary(), "national": rollup(RegionTally.NATIONAL, '')}
+
+
+def render_page(page):
+    forms = _public_forms().filter(
+        pk__gt=page * FEED_PAGE_SIZE, pk__lte=(page + 1) * FEED_PAGE_SIZE
+    ).order_by('-id')
+    results = DRFormPublicSerializer(forms, many=True).data
+    return {"page": page, "results": results} if results else None
+
+
+def render_latest(pages):
+    forms = _public_forms().order_by('-timestamp', '-id')[:LATEST_SIZE]
+    return {"results": DRFormPublicSerializer(forms, many=True).data, "pages": sorted(pages, reverse=True)}
+
+
+def _encode(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'), sort_keys=True).encode()
+
+
+def _replace(path, content):
+    """Write ``content`` to ``path`` so readers see the old or the new file, never a partial one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(content)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(temp, 0o644)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def _remove(path):
+    for name in (path, path + '.gz'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def _locked(root):
+    # One publisher at a time per root, across worker processes
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), 'rb') as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return {"version": 0, "files": {}, "regions": {}}
+
+
+def _targets(stations, forms, full, manifest):
+    """``{path: render}`` for the files a change to ``stations``/``forms`` can affect."""
+    targets = {'summary.json': render_summary}
+    if full:
+        regions = set(
+            RegionTally.objects.filter(level__in=[RegionTally.DISTRICT, RegionTally.CONSTITUENCY])
+            .values_list('level', 'name')
+        )
+        pages = {feed_page(pk) for pk in _public_forms().values_list('pk', flat=True).iterator(chunk_size=5000)}
+    else:
+        regions = set()
+        for district, constituency in PollingStation.objects.filter(pk__in=stations).values_list(
+            'district', 'constituency'
+        ):
+            regions.add((RegionTally.DISTRICT, district))
+            regions.add((RegionTally.CONSTITUENCY, constituency))
+        pages = {feed_page(pk) for pk in forms}
+    for level, name in regions:
+        targets[region_path(level, name)] = lambda level=level, name=name: rollup(level, name)
+    for page in pages:
+        targets[f"feed/{page}.json"] = lambda page=page: render_page(page)
+    if full:
+        # Files published before and no longer rendered are removed
+        for path in manifest['files']:
+            if path != LATEST:
+                targets.setdefault(path, lambda: None)
+    return targets, regions
+
+
+def publish(stations=(), forms=(), full=False):
+    """
+    Re-render the files affected by changes to the polling stations
+    ``stations`` (pks) and the DR forms ``forms`` (ids), or every file with
+    ``full``. Returns ``(paths written, paths removed)``.
+    """
+    root = str(settings.SNAPSHOT_ROOT)
+    with _locked(root):
+        manifest = _read_manifest(root)
+        files, region_index = manifest['files'], manifest['regions']
+        version = manifest['version'] + 1
+        now = timezone.now()
+        targets, regions = _targets(stations, forms, full, manifest)
+        written, removed = [], []
+
+        def put(path, data):
+            if data is None:
+                if path in files:
+                    del files[path]
+                    _remove(os.path.join(root, path))
+                    removed.append(path)
+                return
+            digest = hashlib.sha256(_encode(data)).hexdigest()
+            if files.get(path, {}).get('sha256') == digest:
+                return
+            content = _encode({"version": version, "generated_at": now, "data": data})
+            target = os.path.join(root, path)
+            _replace(target + '.gz', gzip.compress(content, mtime=0))
+            _replace(target, content)
+            files[path] = {"version": version, "sha256": digest}
+            written.append(path)
+
+        for path, render in targets.items():
+            put(path, render())
+        # The page list in latest.json follows the pages just (un)published
+        pages = [int(path[5:-5]) for path in files if path.startswith('feed/') and path[5:-5].isdigit()]
+        put(LATEST, render_latest(pages))
+
+        for level, name in regions:
+            names = region_index.setdefault(level, {})
+            if region_path(level, name) in files:
+                names[name] = region_path(level, name)
+            else:
+                names.pop(name, None)
+        if full:
+            for level, names in region_index.items():
+                for name in [name for name, path in names.items() if path not in files]:
+                    del names[name]
+
+        if written or removed:
+            manifest.update(version=version, generated_at=now)
+            _replace(os.path.join(root, MANIFEST), _encode(manifest))
+    return written, removed
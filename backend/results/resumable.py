@@ -0,0 +1,361 @@
+"""
+Resumable uploads of DR form scans and videos, modeled on tus (tus.io 1.0):
+
+    POST   drforms/uploads/        Upload-Length, Upload-Metadata → 201 + Location
+    HEAD   drforms/uploads/<id>/   Upload-Offset / Upload-Length of the session
+    PATCH  drforms/uploads/<id>/   Upload-Offset + an application/offset+octet-stream chunk
+    GET    drforms/uploads/<id>/   the same as JSON, with the form id once complete
+    DELETE drforms/uploads/<id>/   abandon the upload
+
+Chunks are appended to ``<staging>/resumable/<id>.part`` and hashed as
+they arrive. A hashlib object cannot be stored in the database, so the
+running SHA-256 is kept in process memory keyed by session and offset; a
+PATCH landing on another worker (or after a restart) rehashes the part
+file up to its offset once and carries on from there. When the last byte
+arrives the digest is already known, so completing the upload is the
+hash comparison DRFormUploadView makes plus a rename into storage.
+
+An image upload creates a DRForm like ``drforms/upload/``; a video is
+attached to an existing form of the uploader (metadata ``drform``).
+Sessions untouched for ``SESSION_TTL`` are removed by ``manage.py gc_uploads``.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.utils import timezone
+from rest_framework import status
+
+from .models import DRForm, UploadSession
+from .sync import resolve_stations
+from .uploads import MAX_UPLOAD_SIZES, MB, staging_dir
+
+SESSION_TTL = timedelta(hours=24)
+# How long one PATCH may hold the session before another may take over
+LOCK_SECONDS = 300
+CHUNK_SIZE = 64 * 1024
+DEFAULT_NAMES = {'image': 'scan.png', 'video': 'video.mp4'}
+HASHERS_KEPT = 256
+
+TUS_VERSION = '1.0.0'
+CONTENT_TYPE = 'application/offset+octet-stream'
+
+
+class UploadError(Exception):
+    def __init__(self, detail, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def part_dir():
+    path = os.path.join(staging_dir(), 'resumable')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(pk):
+    return os.path.join(part_dir(), f"{pk}.part")
+
+
+def expires_at(session):
+    return session.updated_at + SESSION_TTL
+
+
+# -------------------------------
+# Running hashes, per process
+# -------------------------------
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _hasher_at(session, offset):
+    """A SHA-256 of the first ``offset`` bytes of the session's part file."""
+    with _hashers_lock:
+        cached = _hashers.pop(str(session.pk), None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    sha256 = hashlib.sha256()
+    read = 0
+    try:
+        with open(part_path(session.pk), 'rb') as f:
+            while read < offset:
+                chunk = f.read(min(CHUNK_SIZE * 16, offset - read))
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                read += len(chunk)
+    except FileNotFoundError:
+        pass
+    if read != offset:
+        discard(session)
+        raise UploadError("Upload data was lost; start a new upload.", status.HTTP_410_GONE)
+    return sha256
+
+
+def _remember(pk, offset, sha256):
+    with _hashers_lock:
+        _hashers[str(pk)] = (offset, sha256)
+        while len(_hashers) > HASHERS_KEPT:
+            _hashers.popitem(last=False)
+
+
+def _forget(pk):
+    with _hashers_lock:
+        _hashers.pop(str(pk), None)
+
+
+# -------------------------------
+# Creation
+# -------------------------------
+def parse_metadata(header):
+    """tus ``Upload-Metadata``: comma-separated ``key base64(value)`` pairs."""
+    metadata = {}
+    for pair in (header or '').split(','):
+        pair = pair.strip()
+        if not pair:
+            continue
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(f"Upload-Metadata value of {key!r} is not base64.")
+    return metadata
+
+
+def _json_field(metadata, key, default):
+    value = metadata.get(key)
+    if value in (None, ''):
+        return default
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise UploadError(f"{key} must be JSON.")
+    return value
+
+
+def create_session(user, length, metadata):
+    """
+    Validate an upload before any byte is sent. ``metadata``: ``kind``
+    (image, the default, or video), ``filename``, ``sha256``, and either
+    ``polling_station``/``totals``/``gps`` for a new form or ``drform``
+    for a video of an existing one.
+    """
+    kind = metadata.get('kind') or UploadSession.IMAGE
+    if kind not in MAX_UPLOAD_SIZES:
+        raise UploadError(f"kind must be one of: {', '.join(MAX_UPLOAD_SIZES)}.")
+    try:
+        length = int(length)
+    except (TypeError, ValueError):
+        raise UploadError("Upload-Length is required.")
+    limit = MAX_UPLOAD_SIZES[kind]
+    if length <= 0:
+        raise UploadError("Upload-Length must be positive.")
+    if length > limit:
+        raise UploadError(
+            f"{kind.capitalize()} file too large (max {limit // MB}MB).", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    expected = str(metadata.get('sha256') or '').strip().lower()
+    if expected and (len(expected) != 64 or any(c not in '0123456789abcdef' for c in expected)):
+        raise UploadError("sha256 must be 64 hex characters.")
+
+    filename = os.path.basename(metadata.get('filename') or '') or DEFAULT_NAMES[kind]
+    session = UploadSession(user=user, kind=kind, length=length, expected_sha256=expected, filename=filename[:255])
+    if kind == UploadSession.VIDEO:
+        ref = str(metadata.get('drform') or '')
+        form = DRForm.objects.filter(pk=int(ref), uploaded_by=user).first() if ref.isdigit() else None
+        if form is None:
+            raise UploadError("A video needs the id (drform) of a form you uploaded.")
+        session.drform = form
+    else:
+        station = resolve_stations([metadata.get('polling_station')]).get(str(metadata.get('polling_station')))
+        if station is None:
+            raise UploadError("Polling station not found")
+        totals = _json_field(metadata, 'totals', {})
+        if not isinstance(totals, dict):
+            raise UploadError("totals must be a JSON object.")
+        session.fields = {'polling_station': station.pk, 'totals': totals, 'gps': _json_field(metadata, 'gps', None)}
+    session.save()
+    return session
+
+
+# -------------------------------
+# Appending chunks
+# -------------------------------
+def _lock(session, offset):
+    now = timezone.now()
+    locked = UploadSession.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        pk=session.pk, offset=offset, completed_at__isnull=True,
+    ).update(locked_until=now + timedelta(seconds=LOCK_SECONDS))
+    if locked:
+        return
+    current = UploadSession.objects.filter(pk=session.pk).values('offset', 'completed_at').first()
+    if current is None:
+        raise UploadError("Upload not found.", status.HTTP_404_NOT_FOUND)
+    if current['offset'] != offset or current['completed_at']:
+        raise UploadError(
+            f"Upload-Offset {offset} does not match the upload ({current['offset']}).", status.HTTP_409_CONFLICT
+        )
+    raise UploadError("Another request is writing to this upload.", status.HTTP_423_LOCKED)
+
+
+def append(session, offset, stream, content_length=None):
+    """
+    Write the chunk read from ``stream`` at ``offset`` (which must be the
+    session's current offset). Bytes received before a dropped connection
+    are kept. Returns the DRForm once the last byte is in, else None.
+    """
+    if content_length is not None and offset + content_length > session.length:
+        raise UploadError("Chunk goes past Upload-Length.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    _lock(session, offset)
+    written = 0
+    try:
+        sha256 = _hasher_at(session, offset)
+        remaining = session.length - offset
+        path = part_path(session.pk)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as out:
+            out.seek(offset)
+            out.truncate()
+            while written < remaining:
+                try:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining - written))
+                except (OSError, UnreadablePostError):
+                    break
+                if not chunk:
+                    break
+                out.write(chunk)
+                sha256.update(chunk)
+                written += len(chunk)
+            if written == remaining and stream.read(1):
+                out.truncate(offset)
+                written = 0
+                raise UploadError("Chunk goes past Upload-Length.", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except BaseException:
+        _forget(session.pk)
+        UploadSession.objects.filter(pk=session.pk).update(locked_until=None)
+        raise
+
+    session.offset, session.updated_at = offset + written, timezone.now()
+    UploadSession.objects.filter(pk=session.pk).update(
+        offset=session.offset, locked_until=None, updated_at=session.updated_at
+    )
+    if session.offset < session.length:
+        _remember(session.pk, session.offset, sha256)
+        return None
+    return complete(session, sha256.hexdigest())
+
+
+class PartFile(File):
+    """The finished part file; storage moves it into place instead of copying."""
+
+    def __init__(self, path, name, size, sha256):
+        super().__init__(open(path, 'rb'), name)
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def complete(session, digest):
+    _forget(session.pk)
+    path = part_path(session.pk)
+    if session.expected_sha256 and session.expected_sha256 != digest:
+        discard(session)
+        raise UploadError('Hash mismatch')
+
+    upload = PartFile(path, session.filename, session.length, digest)
+    try:
+        if session.kind == UploadSession.IMAGE:
+            from PIL import Image
+            try:
+                Image.open(upload).verify()
+            except Exception:
+                raise UploadError("Upload a valid image. The file you uploaded was either not an image or a corrupted image.")
+            upload.seek(0)
+        with transaction.atomic():
+            if session.kind == UploadSession.VIDEO:
+                form = DRForm.objects.select_for_update().get(pk=session.drform_id)
+                form.video = upload
+                form.save()
+            else:
+                fields = session.fields
+                form = DRForm(
+                    polling_station_id=fields['polling_station'], image=upload, sha256_hash=digest,
+                    totals=fields.get('totals') or {}, gps=fields.get('gps'), uploaded_by=session.user,
+                )
+                form.save()
+            UploadSession.objects.filter(pk=session.pk).update(drform=form, completed_at=timezone.now())
+    except BaseException:
+        upload.close()
+        discard(session)
+        raise
+    upload.close()
+    # Content-addressed storage keeps an existing copy instead of moving ours
+    if os.path.exists(path):
+        os.remove(path)
+    session.drform, session.completed_at = form, timezone.now()
+    return form
+
+
+def discard(session):
+    """Drop a session and its partial data."""
+    _forget(session.pk)
+    UploadSession.objects.filter(pk=session.pk).delete()
+    try:
+        os.remove(part_path(session.pk))
+    except FileNotFoundError:
+        pass
+
+
+# -------------------------------
+# Garbage collection
+# -------------------------------
+def collect_garbage(max_age=SESSION_TTL, dry_run=False):
+    """
+    Remove sessions untouched for ``max_age`` (complete ones only keep
+    their status for that long) and part files no session owns.
+    Returns ``(sessions, files, bytes)`` removed.
+    """
+    cutoff = timezone.now() - max_age
+    stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+    pks = {str(pk) for pk in stale.values_list('pk', flat=True)}
+    sessions = len(pks)
+    if not dry_run:
+        stale.filter(pk__in=pks).delete()
+    live = {str(pk) for pk in UploadSession.objects.exclude(pk__in=pks).values_list('pk', flat=True)}
+
+    files = size = 0
+    directory = part_dir()
+    for entry in os.scandir(directory):
+        stem = entry.name[:-len('.part')] if entry.name.endswith('.part') else None
+        if stem is None or stem in live:
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        # A file without a row may belong to a session being created right now
+        if stem not in pks and stat.st_mtime >= cutoff.timestamp():
+            continue
+        files += 1
+        size += stat.st_size
+        if not dry_run:
+            _forget(stem)
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    return sessions, files, size
@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from django.conf import settings
 from election import settings
-from .models import PollingStation, DRForm, User, Report, AbstractUser, Agent, NupNews
+from .models import PollingStation, DRForm, User, Report, AbstractUser, Agent, NupNews, RegionTally, StationFormGroup
+from .moderation import MAX_BATCH, FILTERS as MODERATION_FILTERS
+from .tallies import parse_totals
+from . import directory
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -21,32 +24,48 @@ class DRFormUploadSerializer(serializers.ModelSerializer):
         fields = ['polling_station', 'image', 'video', 'sha256_hash', 'totals', 'gps']
 
     def validate_polling_station(self, value):
-        # Try to match station by ID or by station_id
+        # pk, station_id or (tolerantly matched) name, from the in-memory directory
         try:
-            # If the frontend sent a numeric ID, this will work
-            if value.isdigit():
-                return PollingStation.objects.get(pk=int(value))
-            # Otherwise try to match by station_id or name
-            return PollingStation.objects.get(station_id=value)
-        except PollingStation.DoesNotExist:
-            try:
-                return PollingStation.objects.get(name=value)
-            except PollingStation.DoesNotExist:
-                raise serializers.ValidationError("Polling station not found")
+            station = directory.resolve(value)
+        except directory.AmbiguousStation:
+            raise serializers.ValidationError("Several polling stations match this name; use the station_id")
+        if station is None:
+            raise serializers.ValidationError("Polling station not found")
+        return station
 
     def create(self, validated_data):
         return DRForm.objects.create(**validated_data)
 
-class DRFormPublicSerializer(serializers.ModelSerializer):
+class DerivativeURLsMixin(serializers.Serializer):
+    """Adds `image_thumb` / `image_feed` URLs, falling back to the original until they are built."""
+    image_thumb = serializers.SerializerMethodField()
+    image_feed = serializers.SerializerMethodField()
+
+    def _derivative_url(self, obj, size):
+        if not obj.image:
+            return None
+        name = (obj.derivatives or {}).get(size)
+        url = obj.image.storage.url(name) if name else obj.image.url
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_thumb(self, obj):
+        return self._derivative_url(obj, "thumb")
+
+    def get_image_feed(self, obj):
+        return self._derivative_url(obj, "feed")
+
+
+class DRFormPublicSerializer(DerivativeURLsMixin, serializers.ModelSerializer):
     polling_station = PollingStationSerializer(read_only=True)
     verified_by = serializers.StringRelatedField()
 
     class Meta:
         model = DRForm
-        fields = ('id', 'polling_station', 'image', 'sha256_hash', 'totals', 'timestamp', 'verified', 'verified_by')
+        fields = ('id', 'polling_station', 'image', 'image_thumb', 'image_feed', 'sha256_hash', 'totals', 'timestamp', 'verified', 'verified_by')
     
 
-class DRFormSerializer(serializers.ModelSerializer):
+class DRFormSerializer(DerivativeURLsMixin, serializers.ModelSerializer):
     uploaded_by = serializers.StringRelatedField(read_only=True)
     verified_by = serializers.StringRelatedField(read_only=True)
     polling_station = PollingStationSerializer(read_only=True)  # ✅ nested, not slug
@@ -71,7 +90,15 @@ class DRFormSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DRForm
-        fields = '__all__'
+        # Listed, so internal columns (derivatives, moderation claims,
+        # idempotency keys) stay out of the API as the model grows
+        fields = (
+            'id', 'polling_station', 'polling_station_id', 'image', 'image_thumb', 'image_feed', 'video',
+            'sha256_hash', 'timestamp', 'totals', 'verified', 'verified_at', 'gps', 'created_at', 'updated_at',
+            'uploaded_by', 'verified_by', 'district', 'sub_county', 'parish', 'total_votes',
+            'agent_name', 'agent_contact',
+        )
+        read_only_fields = ('verified_at',)
 
     def get_district(self, obj):
         return getattr(obj.polling_station, "district", None)
@@ -83,10 +110,8 @@ class DRFormSerializer(serializers.ModelSerializer):
         return getattr(obj.polling_station, "name", None)
 
     def get_total_votes(self, obj):
-        try:
-            return sum(obj.totals.values()) if obj.totals else 0
-        except Exception:
-            return 0
+        # The row's totals are already loaded: summing them here is cheaper than a per-row SUM subquery
+        return sum(parse_totals(obj.totals).values())
 
     def get_agent_name(self, obj):
         return getattr(obj.uploaded_by, "username", None)
@@ -168,4 +193,60 @@ class AgentRegisterSerializer(serializers.ModelSerializer):
 class NupNewsSerializer(serializers.ModelSerializer):
     class Meta:
         model = NupNews
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class RegionTallySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RegionTally
+        fields = ['level', 'name', 'parent', 'totals', 'forms_reported', 'stations_reporting', 'updated_at']
+
+class ModerationFilterSerializer(serializers.Serializer):
+    """The keys of moderation.FILTERS, typed before they reach the ORM."""
+    station_id = serializers.CharField(required=False)
+    district = serializers.CharField(required=False)
+    constituency = serializers.CharField(required=False)
+    uploaded_by = serializers.IntegerField(required=False)
+    uploaded_before = serializers.DateTimeField(required=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            unknown = set(data) - set(MODERATION_FILTERS)
+            if unknown:
+                raise serializers.ValidationError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+        value = super().to_internal_value(data)
+        if not value:
+            raise serializers.ValidationError("Give at least one filter key.")
+        return value
+
+
+class DRFormBatchVerifySerializer(serializers.Serializer):
+    """Either `ids` or `filter` (with an optional `limit`), see results.moderation."""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=MAX_BATCH)
+    filter = ModerationFilterSerializer(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=MAX_BATCH, default=MAX_BATCH)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Send exactly one of 'ids' or 'filter'.")
+        return data
+
+class ConflictFormSerializer(serializers.ModelSerializer):
+    uploaded_by = serializers.StringRelatedField()
+
+    class Meta:
+        model = DRForm
+        fields = ['id', 'image', 'sha256_hash', 'totals', 'verified', 'uploaded_by', 'timestamp']
+
+class StationConflictSerializer(serializers.ModelSerializer):
+    """A station whose forms disagree, with every form; `canonical` is the one counted."""
+    station = PollingStationSerializer(read_only=True)
+    form_count = serializers.IntegerField(source='forms', read_only=True)
+    forms = ConflictFormSerializer(source='station.drform_set', many=True, read_only=True)
+
+    class Meta:
+        model = StationFormGroup
+        fields = ['station', 'canonical', 'pinned', 'form_count', 'totals_variants', 'image_variants',
+                  'conflict_since', 'forms']
+
+class ConflictResolveSerializer(serializers.Serializer):
+    canonical = serializers.IntegerField()
@@ -0,0 +1,88 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import conflicts, directory, jobs, storage, tallies, votes
+from .models import DRForm, PollingStation
+
+
+@receiver(pre_save, sender=DRForm)
+def capture_previous_snapshot(sender, instance, raw=False, **kwargs):
+    # Read (and lock) the stored row so the tally delta is taken against what
+    # is actually in the database, not against a possibly stale instance.
+    if raw or instance._state.adding or instance.pk is None:
+        instance._tally_before = None
+        instance._image_before = None
+        return
+    previous = (
+        DRForm.objects.select_for_update()
+        .filter(pk=instance.pk)
+        .values_list('polling_station_id', 'verified', 'totals', 'image')
+        .first()
+    )
+    if previous is None:
+        instance._tally_before = instance._image_before = None
+        return
+    instance._tally_before = tallies.make_snapshot(*previous[:3])
+    instance._image_before = previous[3]
+
+
+@receiver(post_save, sender=DRForm)
+def enqueue_tallies_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_tally_before', None)
+    after = tallies.snapshot(instance)
+    if before != after:
+        # Queued in the same transaction as the save; a worker applies it
+        jobs.enqueue('apply_tallies', {'changes': [[before, after]], 'forms': [instance.pk]})
+
+
+@receiver(post_save, sender=DRForm)
+def write_votes_on_save(sender, instance, raw=False, **kwargs):
+    # Dual write of totals into Result rows (results.votes), same transaction
+    if raw:
+        return
+    before = getattr(instance, '_tally_before', None)
+    after = tallies.snapshot(instance)
+    if before is None or (before['station'], before['votes']) != (after['station'], after['votes']):
+        votes.write(instance, created=kwargs.get('created', False))
+
+
+@receiver(post_save, sender=DRForm)
+def update_media_references_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_image_before', None) or ''
+    after = instance.image.name or ''
+    if before == after:
+        return
+    storage.retain(after)
+    storage.release(before)
+    instance._image_before = after
+    if after:
+        jobs.enqueue('process_upload', {'form_id': instance.pk})
+
+
+@receiver(post_delete, sender=DRForm)
+def enqueue_tallies_on_delete(sender, instance, **kwargs):
+    jobs.enqueue('apply_tallies', {'changes': [[tallies.snapshot(instance), None]], 'forms': [instance.pk]})
+
+
+@receiver(post_delete, sender=DRForm)
+def release_media_on_delete(sender, instance, **kwargs):
+    storage.release(instance.image.name)
+
+
+@receiver(post_save, sender=PollingStation)
+def enqueue_tallies_on_station_move(sender, instance, created=False, raw=False, **kwargs):
+    # Votes counted under the old district/constituency move with the station
+    if raw or created:
+        return
+    if conflicts.moved([instance.pk]):
+        jobs.enqueue('apply_tallies', {'changes': [], 'moved': [instance.pk]})
+
+
+@receiver(post_save, sender=PollingStation)
+@receiver(post_delete, sender=PollingStation)
+def invalidate_station_directory(sender, **kwargs):
+    directory.invalidate()
@@ -0,0 +1,100 @@
+"""
+Content-addressed storage for DR form images.
+
+Images are stored under their SHA-256, sharded two levels deep
+(``dr_forms/ab/cd/abcd….png``), so directories stay small and an agent
+re-uploading the same scan stores nothing new. ``MediaBlob`` counts how many
+DRForm rows point at each file; the file is removed when the last one goes.
+"""
+import os
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.core.files.storage import FileSystemStorage
+
+from .uploads import file_sha256
+
+IMAGE_PREFIX = 'dr_forms'
+
+
+def content_name(digest, filename, prefix=IMAGE_PREFIX):
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def drform_image_path(instance, filename):
+    # Always hash the actual content: the sha256_hash column may be client-supplied
+    return content_name(file_sha256(instance.image.file), filename)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    A name is derived from the content, so an existing file with the same
+    name already holds these bytes: keep it and skip the write.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saving = threading.local()
+
+    def get_available_name(self, name, max_length=None):
+        if getattr(self._saving, 'active', False):
+            # FileSystemStorage._save found the file already written (by
+            # another upload of the same bytes) and asks for another name
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        self._saving.active = True
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return name
+        finally:
+            self._saving.active = False
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_drform_storage():
+    return content_storage
+
+
+def digest_from_name(name):
+    """The SHA-256 encoded in a content-addressed name, or '' for legacy names."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem if len(stem) == 64 and name.startswith(f"{IMAGE_PREFIX}/{stem[:2]}/{stem[2:4]}/") else ''
+
+
+def retain(name):
+    """Record one more DRForm referencing the stored file ``name``."""
+    from .models import MediaBlob
+
+    if not name:
+        return
+    updated = MediaBlob.objects.filter(path=name).update(ref_count=F('ref_count') + 1)
+    if not updated:
+        try:
+            size = get_drform_storage().size(name)
+        except OSError:
+            size = None
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(path=name, sha256_hash=digest_from_name(name), size=size, ref_count=1)
+        except IntegrityError:
+            # An identical upload created the row first
+            MediaBlob.objects.filter(path=name).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    """Drop one reference to ``name``; delete the file once nothing points at it."""
+    from .models import MediaBlob
+
+    if not name:
+        return
+    MediaBlob.objects.filter(path=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    if MediaBlob.objects.filter(path=name, ref_count=0).delete()[0]:
+        storage = get_drform_storage()
+        transaction.on_commit(lambda: storage.delete(name))
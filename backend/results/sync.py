@@ -0,0 +1,194 @@
+"""
+Batch sync of DR forms collected offline by agents.
+
+One request carries a manifest and the scans, either as multipart fields
+or as a zip ``bundle`` holding ``manifest.json``. Every file has already
+been hashed and staged while it streamed in (results.uploads); items are
+then processed in manifest order, each in its own transaction, and every
+item gets its own outcome:
+
+- ``created``: a new DRForm
+- ``duplicate``: the uploader already sent this idempotency key, or the
+  same scan (``sha256_hash``) exists for that polling station; the existing
+  form id is returned and nothing is written
+- ``rejected``: with an ``error``; the rest of the batch still goes through
+
+So a client that lost the response can resend the whole batch safely.
+"""
+import json
+import zipfile
+
+from django.db import IntegrityError, transaction
+
+from . import directory
+from .models import DRForm
+from .uploads import MAX_UPLOAD_SIZES, file_sha256, stage_stream
+
+MAX_SYNC_ITEMS = 50
+MAX_KEY_LENGTH = 64
+INVALID_IMAGE = "Upload a valid image. The file you uploaded was either not an image or a corrupted image."
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+REJECTED = 'rejected'
+
+
+def parse_manifest(raw):
+    """``raw`` JSON (a list of items, or ``{"items": [...]}``) → list of dicts."""
+    try:
+        manifest = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    except ValueError:
+        raise ValueError("Manifest is not valid JSON.")
+    if isinstance(manifest, dict):
+        manifest = manifest.get('items')
+    if not isinstance(manifest, list) or not all(isinstance(item, dict) for item in manifest):
+        raise ValueError("Manifest must be a list of items.")
+    if not manifest:
+        raise ValueError("Manifest is empty.")
+    if len(manifest) > MAX_SYNC_ITEMS:
+        raise ValueError(f"At most {MAX_SYNC_ITEMS} items per sync.")
+    return manifest
+
+
+def open_bundle(bundle):
+    """
+    Read ``manifest.json`` from a zip bundle and stage the files it names.
+    Returns ``(manifest, files, errors)``, files and errors keyed by member name.
+    """
+    try:
+        archive = zipfile.ZipFile(bundle)
+    except zipfile.BadZipFile:
+        raise ValueError("Bundle is not a zip file.")
+    with archive:
+        try:
+            manifest = parse_manifest(archive.read('manifest.json'))
+        except KeyError:
+            raise ValueError("Bundle has no manifest.json.")
+        files, errors = {}, {}
+        limit = MAX_UPLOAD_SIZES['image']
+        for name in {item.get('file') for item in manifest if isinstance(item.get('file'), str)}:
+            try:
+                info = archive.getinfo(name)
+            except KeyError:
+                continue
+            if info.file_size > limit:
+                errors[name] = f"{name} too large (max {limit // (1024 * 1024)}MB)."
+                continue
+            try:
+                with archive.open(info) as member:
+                    files[name] = stage_stream(member, name.rsplit('/', 1)[-1], limit)
+            except (ValueError, zipfile.BadZipFile) as exc:
+                errors[name] = str(exc)
+    return manifest, files, errors
+
+
+def resolve_stations(refs):
+    """Station refs as accepted by the single upload: pk, station_id or name."""
+    refs = [str(ref) for ref in refs if ref not in (None, '')]
+    found = directory.resolve_many(refs)
+    return {ref: found[ref.strip()] for ref in refs if ref.strip() in found}
+
+
+def is_image(upload):
+    """Whether Pillow reads ``upload`` as an image, as the ImageField of a single upload checks."""
+    from PIL import Image
+
+    try:
+        Image.open(upload).verify()
+    except Exception:
+        return False
+    finally:
+        upload.seek(0)
+    return True
+
+
+def _clean_totals(value):
+    if isinstance(value, str):
+        value = json.loads(value) if value.strip() else {}
+    if not isinstance(value, dict):
+        raise ValueError
+    return value
+
+
+def sync_forms(user, manifest, files, file_errors=None):
+    """
+    Create the forms described by ``manifest`` from ``files`` (name → staged
+    upload). Returns one ``{'key', 'status', 'id'|'error'}`` per item.
+    """
+    file_errors = file_errors or {}
+    keys = [item.get('key') for item in manifest if isinstance(item.get('key'), str)]
+    known = dict(
+        DRForm.objects.filter(uploaded_by=user, idempotency_key__in=keys).values_list('idempotency_key', 'id')
+    )
+    stations = resolve_stations(item.get('polling_station') for item in manifest)
+    digests = {name: file_sha256(upload) for name, upload in files.items()}
+    scans = {
+        (digest, station): pk
+        for digest, station, pk in DRForm.objects.filter(sha256_hash__in=set(digests.values()))
+        .values_list('sha256_hash', 'polling_station_id', 'id')
+    }
+    images = {}
+
+    results = []
+    for item in manifest:
+        key = item.get('key')
+
+        def reject(error):
+            results.append({'key': key, 'status': REJECTED, 'error': error})
+
+        if not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH:
+            reject(f"key must be a string of 1-{MAX_KEY_LENGTH} characters")
+            continue
+        if key in known:
+            results.append({'key': key, 'status': DUPLICATE, 'id': known[key]})
+            continue
+        station = stations.get(str(item.get('polling_station')))
+        if station is None:
+            reject("Polling station not found")
+            continue
+        name = item.get('file')
+        if not isinstance(name, str):
+            reject("file must be the name of a file in the request")
+            continue
+        upload = files.get(name)
+        if upload is None:
+            reject(file_errors.get(name, f"No file named {name!r} in the request"))
+            continue
+        digest = digests[name]
+        claimed = str(item.get('sha256') or '').strip().lower()
+        if claimed and claimed != digest:
+            reject("Hash mismatch")
+            continue
+        if name not in images:
+            images[name] = is_image(upload)
+        if not images[name]:
+            reject(INVALID_IMAGE)
+            continue
+        try:
+            totals = _clean_totals(item.get('totals', {}))
+        except ValueError:
+            reject("totals must be a JSON object")
+            continue
+        existing = scans.get((digest, station.pk))
+        if existing:
+            results.append({'key': key, 'status': DUPLICATE, 'id': existing})
+            continue
+
+        try:
+            with transaction.atomic():
+                form = DRForm(
+                    polling_station=station, image=upload, sha256_hash=digest, totals=totals,
+                    gps=item.get('gps'), uploaded_by=user, idempotency_key=key,
+                )
+                form.save()
+        except IntegrityError:
+            # The same key committed concurrently (a retry racing the original)
+            pk = DRForm.objects.filter(uploaded_by=user, idempotency_key=key).values_list('id', flat=True).first()
+            if pk is None:
+                raise
+            known[key] = pk
+            results.append({'key': key, 'status': DUPLICATE, 'id': pk})
+            continue
+        known[key] = scans[(digest, station.pk)] = form.pk
+        results.append({'key': key, 'status': CREATED, 'id': form.pk})
+    return results
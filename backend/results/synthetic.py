@@ -0,0 +1,169 @@
+"""
+Synthetic national election data for load tests and benchmarks.
+
+``seed_election`` builds districts → constituencies → polling stations,
+one agent per station, DR forms with totals (most verified), their
+``Result`` vote rows, reports and news, all with ``bulk_create`` in batches.
+Every form points at one shared placeholder scan so no media is written
+per row. Bulk inserts skip the model signals, so the station form groups,
+tallies and rollups are rebuilt from a recount at the end.
+"""
+import hashlib
+import io
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import conflicts, directory, tallies, votes
+from .models import Agent, DRForm, MediaBlob, NupNews, PollingStation, Report, Result, User
+from .storage import content_name, get_drform_storage
+
+PARTIES = ('NUP', 'NRM')
+REPORT_REASONS = ('Totals do not add up', 'Blurry scan', 'Wrong polling station', 'Missing signatures')
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let bulk_create keep given values for ``auto_now``/``auto_now_add`` fields."""
+    fields = [
+        f for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def placeholder_scan(references):
+    """Store one small PNG (once) and return its content-addressed name."""
+    from django.core.files.base import ContentFile
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('L', (64, 96), color=200).save(buffer, format='PNG')
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    name = get_drform_storage().save(content_name(digest, 'scan.png'), ContentFile(data))
+    blob, created = MediaBlob.objects.get_or_create(
+        path=name, defaults={'sha256_hash': digest, 'size': len(data), 'ref_count': 0}
+    )
+    MediaBlob.objects.filter(pk=blob.pk).update(ref_count=blob.ref_count + references)
+    return name
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def seed_election(districts=20, constituencies=3, stations=20, forms=1, verified=0.8,
+                  reports=0.02, news=20, prefix='SYN', seed=0, batch_size=2000, on_progress=None):
+    """
+    Create ``districts * constituencies * stations`` polling stations with
+    ``forms`` DR forms each. ``verified`` and ``reports`` are the fractions
+    of forms verified and reported. Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    progress = on_progress or (lambda message: None)
+    now = timezone.now()
+    created = {}
+
+    if PollingStation.objects.filter(station_id__startswith=f'{prefix}-').exists():
+        raise ValueError(f"Stations with prefix {prefix!r} already exist; use another prefix or a fresh database.")
+
+    with transaction.atomic():
+        admin = User.objects.create_user(username=f'{prefix.lower()}-admin', is_staff=True, is_admin=True)
+
+        station_rows = []
+        for d in range(districts):
+            for c in range(constituencies):
+                for s in range(stations):
+                    n = len(station_rows)
+                    station_rows.append(PollingStation(
+                        station_id=f'{prefix}-{n:06d}', name=f'Polling Station {n}',
+                        district=f'District {d:03d}', constituency=f'Constituency {d:03d}-{c:02d}',
+                        location=f'Parish {n // 7}',
+                    ))
+        for batch in _batches(station_rows, batch_size):
+            PollingStation.objects.bulk_create(batch)
+        directory.invalidate()
+        station_list = list(PollingStation.objects.filter(station_id__startswith=f'{prefix}-').order_by('id'))
+        created['stations'] = len(station_list)
+        progress(f"{len(station_list)} stations")
+
+        # One agent per station; hashing a password per row would dominate the run
+        password = make_password(None)
+        users = [
+            User(username=f'{prefix.lower()}-agent-{n}', email=f'{prefix.lower()}-agent-{n}@example.com',
+                 password=password, is_agent=True)
+            for n in range(len(station_list))
+        ]
+        for batch in _batches(users, batch_size):
+            User.objects.bulk_create(batch)
+        users = list(User.objects.filter(username__startswith=f'{prefix.lower()}-agent-').order_by('id'))
+        agents = [
+            Agent(user=user, full_name=f'Agent {n}', phone=f'07{n:08d}'[:10], email=user.email,
+                  district=station.district, constituency=station.constituency, polling_station=station)
+            for n, (user, station) in enumerate(zip(users, station_list))
+        ]
+        for batch in _batches(agents, batch_size):
+            Agent.objects.bulk_create(batch)
+        created['agents'] = len(agents)
+        progress(f"{len(agents)} agents")
+
+        total_forms = len(station_list) * forms
+        image = placeholder_scan(total_forms)
+        window = timedelta(hours=12)
+        form_rows = []
+        for n in range(total_forms):
+            station, user = station_list[n % len(station_list)], users[n % len(users)]
+            totals = {party: rng.randrange(0, 600) for party in PARTIES}
+            stamp = now - window + window * (n / max(total_forms, 1))
+            is_verified = rng.random() < verified
+            form_rows.append(DRForm(
+                polling_station=station, image=image, sha256_hash=hashlib.sha256(f'{prefix}{n}'.encode()).hexdigest(),
+                totals=totals, verified=is_verified, uploaded_by=user,
+                verified_by=admin if is_verified else None, verified_at=stamp if is_verified else None,
+                timestamp=stamp, created_at=stamp, updated_at=stamp,
+            ))
+        with explicit_timestamps(DRForm):
+            for batch in _batches(form_rows, batch_size):
+                DRForm.objects.bulk_create(batch)
+        result_rows = [
+            row for form in form_rows for row in votes.rows_for(form.pk, form.polling_station_id, form.totals)
+        ]
+        for batch in _batches(result_rows, batch_size):
+            Result.objects.bulk_create(batch)
+        created['drforms'] = total_forms
+        created['results'] = len(result_rows)
+        progress(f"{total_forms} DR forms")
+
+        form_ids = list(DRForm.objects.filter(polling_station__station_id__startswith=f'{prefix}-')
+                        .values_list('id', 'uploaded_by_id'))
+        report_rows = [
+            Report(dr_form_id=pk, reported_by_id=uploader, reason=rng.choice(REPORT_REASONS))
+            for pk, uploader in form_ids if rng.random() < reports
+        ]
+        for batch in _batches(report_rows, batch_size):
+            Report.objects.bulk_create(batch)
+        created['reports'] = len(report_rows)
+
+        NupNews.objects.bulk_create(
+            NupNews(title=f'Update {n}', content=f'Results update number {n}.') for n in range(news)
+        )
+        created['news'] = news
+
+        conflicts.rebuild()
+        tallies.rebuild()
+        tallies.rebuild_regions()
+        progress("tallies rebuilt")
+    return created
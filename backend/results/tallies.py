@@ -0,0 +1,333 @@
+"""
+Incrementally maintained vote tallies.
+
+Two aggregates are kept current from DRForm saves and deletes
+(see results.signals) instead of being summed on every request. Each
+station counts once, through its canonical form (see results.conflicts):
+
+* ``PartyTally``: national totals per party over the canonical forms,
+  served by ``results_summary``.
+* ``RegionTally``: totals and reporting counts of the stations whose
+  canonical form is verified, for every station, constituency, district
+  and the nation, served by the rollup API.
+
+A form is reduced to a small snapshot (station, verified flag, votes) and
+changes are applied as the difference between the old and new snapshot.
+The snapshots a station group counts also carry the station's region, so
+its votes can still be taken out of the rollups once the station is gone.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import PartyTally, PollingStation, RegionTally, Result, StationFormGroup
+
+SUMMARY_PARTIES = ("NUP", "NRM")
+# What a Result row can hold (see results.votes)
+MAX_VOTES = 2 ** 31 - 1
+MAX_PARTY_LENGTH = Result._meta.get_field('party').max_length
+
+
+def parse_totals(totals):
+    """
+    Return ``{party: votes}`` for the integer entries of a DRForm.totals dict.
+    Values that are not whole numbers (e.g. blank strings), are negative
+    or too large, and party names too long for a Result row are ignored.
+    """
+    votes = {}
+    if not isinstance(totals, dict):
+        return votes
+    for party, value in totals.items():
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= count <= MAX_VOTES and len(str(party)) <= MAX_PARTY_LENGTH:
+            votes[str(party)] = count
+    return votes
+
+
+def make_snapshot(station_id, verified, totals, region=None):
+    """``region`` is the station's ``(station_id code, district, constituency)``."""
+    snap = {'station': station_id, 'verified': bool(verified), 'votes': parse_totals(totals)}
+    if region is not None:
+        snap['region'] = list(region)
+    return snap
+
+
+def snapshot(form):
+    """The parts of a form that feed the tallies, or None for no form."""
+    if form is None:
+        return None
+    return make_snapshot(form.polling_station_id, form.verified, form.totals)
+
+
+def contribution(form):
+    """Votes a single form adds to the national tally."""
+    if form is None:
+        return {}
+    return parse_totals(form.totals)
+
+
+def diff(before, after):
+    """Per-party change going from contribution ``before`` to ``after``."""
+    delta = Counter(after)
+    delta.subtract(before)
+    return {party: votes for party, votes in delta.items() if votes}
+
+
+# -------------------------------
+# National party tallies
+# -------------------------------
+def apply_delta(delta):
+    """Add ``delta`` to the stored tallies using atomic in-database increments."""
+    if not delta:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        for party, votes in delta.items():
+            updated = PartyTally.objects.filter(party=party).update(
+                votes=F('votes') + votes, updated_at=now
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        PartyTally.objects.create(party=party, votes=votes)
+                except IntegrityError:
+                    # A concurrent first vote for this party created the row
+                    PartyTally.objects.filter(party=party).update(votes=F('votes') + votes, updated_at=now)
+
+
+def current():
+    """Stored tallies as ``{party: votes}``."""
+    return dict(PartyTally.objects.values_list('party', 'votes'))
+
+
+def summary():
+    """National totals in the shape served by ``results_summary``."""
+    stored = current()
+    return [{"party": party, "votes": stored.get(party, 0)} for party in SUMMARY_PARTIES]
+
+
+def recount():
+    """
+    Recompute the tallies: a SUM … GROUP BY party over the Result rows of
+    every station's canonical form (see results.votes), for checks and rebuilds.
+    """
+    from .votes import party_totals
+
+    return party_totals()
+
+
+def rebuild():
+    """
+    Replace the stored tallies with a full recount.
+    Returns ``(recounted, drift)`` where drift is what the store was off by.
+    """
+    with transaction.atomic():
+        stored = current()
+        recounted = recount()
+        drift = diff(recounted, stored)
+        PartyTally.objects.exclude(party__in=recounted.keys()).delete()
+        for party, votes in recounted.items():
+            PartyTally.objects.update_or_create(party=party, defaults={'votes': votes})
+    return recounted, drift
+
+
+# -------------------------------
+# Regional rollups
+# -------------------------------
+def _station_changes(changes):
+    """
+    Collapse ``(before, after)`` snapshot pairs into
+    ``{(station, region): (votes_delta, forms_delta)}`` over verified forms,
+    keyed by the region each snapshot was counted under (None if unrecorded),
+    so a station that moved is taken off its old parents.
+    """
+    per_station = defaultdict(lambda: [Counter(), 0])
+    for before, after in changes:
+        for snap, sign in ((before, -1), (after, 1)):
+            if not snap or not snap['verified']:
+                continue
+            region = snap.get('region')
+            entry = per_station[(snap['station'], tuple(region) if region else None)]
+            for party, votes in snap['votes'].items():
+                entry[0][party] += sign * votes
+            entry[1] += sign
+    return {
+        key: (votes, forms)
+        for key, (votes, forms) in per_station.items()
+        if forms or any(votes.values())
+    }
+
+
+def _merge(totals, votes):
+    merged = dict(totals)
+    for party, delta in votes.items():
+        merged[party] = merged.get(party, 0) + delta
+    return merged
+
+
+def _locked_rows(level, names):
+    return {
+        row.name: row
+        for row in RegionTally.objects.select_for_update().filter(level=level, name__in=names)
+    }
+
+
+def apply_region_changes(per_station):
+    """
+    Apply per-station deltas to the station rows and every ancestor row,
+    each under the region its snapshots recorded (the station's current
+    region for snapshots that recorded none).
+    """
+    if not per_station:
+        return
+    current = {
+        pk: (station_id, district, constituency)
+        for pk, station_id, district, constituency in PollingStation.objects.filter(
+            pk__in=[pk for pk, region in per_station if region is None]
+        ).values_list('pk', 'station_id', 'district', 'constituency')
+    }
+    # Removals first, so a station's row stops reporting under its old
+    # parents before it starts reporting under the new ones
+    changes = sorted(
+        ((region or current.get(pk), votes, forms) for (pk, region), (votes, forms) in per_station.items()),
+        key=lambda change: change[2],
+    )
+    changes = [change for change in changes if change[0] is not None]
+    ancestors = defaultdict(lambda: [Counter(), 0, 0])  # (level, name, parent) -> votes, forms, stations
+    now = timezone.now()
+
+    with transaction.atomic():
+        station_rows = _locked_rows(RegionTally.STATION, [code for (code, _, _), _, _ in changes])
+        for (code, district, constituency), votes, forms in changes:
+            row = station_rows.get(code) or RegionTally(level=RegionTally.STATION, name=code)
+            was_reporting = row.forms_reported > 0
+            row.parent = constituency
+            row.totals = _merge(row.totals, votes)
+            row.forms_reported = max(row.forms_reported + forms, 0)
+            row.stations_reporting = int(row.forms_reported > 0)
+            row.save()
+            station_rows[code] = row
+
+            reporting = row.stations_reporting - int(was_reporting)
+            for key in (
+                (RegionTally.CONSTITUENCY, constituency, district),
+                (RegionTally.DISTRICT, district, ''),
+                (RegionTally.NATIONAL, '', ''),
+            ):
+                entry = ancestors[key]
+                entry[0].update(votes)
+                entry[1] += forms
+                entry[2] += reporting
+
+        for level in (RegionTally.CONSTITUENCY, RegionTally.DISTRICT, RegionTally.NATIONAL):
+            keys = [key for key in ancestors if key[0] == level]
+            rows = _locked_rows(level, [name for _, name, _ in keys])
+            for _, name, parent in keys:
+                votes, forms, reporting = ancestors[(level, name, parent)]
+                row = rows.get(name) or RegionTally(level=level, name=name)
+                row.parent = parent
+                row.totals = _merge(row.totals, votes)
+                row.forms_reported = max(row.forms_reported + forms, 0)
+                row.stations_reporting = max(row.stations_reporting + reporting, 0)
+                row.updated_at = now
+                row.save()
+
+
+def recount_regions():
+    """
+    Recompute every RegionTally row from the verified canonical forms,
+    with their votes summed per station in SQL.
+    Returns ``{(level, name): RegionTally}`` (unsaved).
+    """
+    from .votes import canonical_rows
+
+    rows = {}
+
+    def row_for(level, name, parent):
+        row = rows.get((level, name))
+        if row is None:
+            row = rows[(level, name)] = RegionTally(level=level, name=name, parent=parent)
+        return row
+
+    stations = {
+        pk: (station_id, district, constituency)
+        for pk, station_id, district, constituency
+        in PollingStation.objects.values_list('pk', 'station_id', 'district', 'constituency').iterator(chunk_size=2000)
+    }
+    votes_by_station = defaultdict(dict)
+    for pk, party, votes in (
+        canonical_rows().filter(dr_form__verified=True).order_by()
+        .values_list('polling_station_id', 'party').annotate(total=Sum('votes'))
+        .values_list('polling_station_id', 'party', 'total')
+    ):
+        votes_by_station[pk][party] = votes
+    reporting = StationFormGroup.objects.filter(canonical__verified=True).values_list('station_id', flat=True)
+    for pk in reporting.iterator(chunk_size=2000):
+        if pk not in stations:
+            continue
+        station_id, district, constituency = stations[pk]
+        votes = votes_by_station.get(pk, {})
+        station = row_for(RegionTally.STATION, station_id, constituency)
+        newly_reporting = station.forms_reported == 0
+        station.stations_reporting = 1
+        for row in (
+            station,
+            row_for(RegionTally.CONSTITUENCY, constituency, district),
+            row_for(RegionTally.DISTRICT, district, ''),
+            row_for(RegionTally.NATIONAL, '', ''),
+        ):
+            row.totals = _merge(row.totals, votes)
+            row.forms_reported += 1
+            if newly_reporting and row.level != RegionTally.STATION:
+                row.stations_reporting += 1
+    return rows
+
+
+def _region_state(row):
+    # Rows left at zero by deletions are equivalent to rows that do not exist
+    if row is None or (not row.forms_reported and not diff({}, row.totals)):
+        return None
+    return (row.parent, diff({}, row.totals), row.forms_reported, row.stations_reporting)
+
+
+def rebuild_regions():
+    """
+    Replace every RegionTally row with a full recount.
+    Returns the number of regions whose stored values were wrong or missing.
+    """
+    with transaction.atomic():
+        recounted = recount_regions()
+        stored = {(row.level, row.name): row for row in RegionTally.objects.all()}
+        drifted = sum(
+            1 for key in set(recounted) | set(stored)
+            if _region_state(recounted.get(key)) != _region_state(stored.get(key))
+        )
+        RegionTally.objects.all().delete()
+        RegionTally.objects.bulk_create(recounted.values(), batch_size=1000)
+    return drifted
+
+
+# -------------------------------
+# Entry point used by signals and bulk operations
+# -------------------------------
+def record_changes(changes):
+    """
+    Apply a batch of ``(before, after)`` form snapshots (None for a missing
+    side) to both the national and the regional tallies in one transaction.
+    """
+    national = Counter()
+    for before, after in changes:
+        national.update((after or {}).get('votes', {}))
+        national.subtract((before or {}).get('votes', {}))
+    with transaction.atomic():
+        apply_delta({party: votes for party, votes in national.items() if votes})
+        apply_region_changes(_station_changes(changes))
+
+
+def record_change(before, after):
+    record_changes([(before, after)])
@@ -0,0 +1,70 @@
+"""Job handlers run by the background workers (see results.jobs)."""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import conflicts, derivatives, jobs, publisher, tallies
+from .exif import extract_gps
+from .jobs import task
+from .models import DRForm
+from .storage import digest_from_name
+
+logger = logging.getLogger(__name__)
+
+
+@task('apply_tallies')
+def apply_tallies(payload):
+    """
+    Regroup the stations named by ``[[before, after], …]`` form snapshots
+    (and the ``moved`` stations) and apply the change in their canonical
+    forms to the tallies and rollups.
+    """
+    moved = payload.get('moved', [])
+    stations = {snap['station'] for pair in payload['changes'] for snap in pair if snap} | set(moved)
+    changes = conflicts.refresh(stations)
+    tallies.record_changes(changes)
+    if settings.SNAPSHOTS_ENABLED:
+        # Queued in this transaction, so it renders the committed tallies
+        # (in full when a station moved: its old region's files change too)
+        jobs.enqueue('publish_snapshots', {
+            'stations': sorted(stations), 'forms': payload.get('forms', []), 'full': bool(moved),
+        })
+    return {'stations': len(stations), 'changes': len(changes)}
+
+
+@task('publish_snapshots')
+def publish_snapshots(payload):
+    """Rewrite the static snapshots affected by a change (see results.publisher)."""
+    written, removed = publisher.publish(payload['stations'], payload['forms'], payload.get('full', False))
+    return {'written': len(written), 'removed': len(removed)}
+
+
+@task('process_upload')
+def process_upload(payload):
+    """Post-upload work for one DR form: integrity check, renditions, EXIF GPS."""
+    form = DRForm.objects.filter(pk=payload['form_id']).first()
+    if form is None or not form.image:
+        return {'skipped': True}
+    path = form.image.path
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    digest = sha256.hexdigest()
+    expected = digest_from_name(form.image.name) or form.sha256_hash
+    hash_ok = digest == expected
+    if not hash_ok:
+        logger.warning("DRForm %s: stored image hash %s does not match %s", form.pk, digest, expected)
+
+    names = derivatives.build(form)
+
+    gps = None
+    if not form.gps:
+        gps = extract_gps(path)
+        if gps:
+            DRForm.objects.filter(pk=form.pk, gps__isnull=True).update(gps=gps, updated_at=timezone.now())
+
+    return {'hash_ok': hash_ok, 'derivatives': sorted(names), 'gps': gps}
@@ -1,7 +1,36 @@
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
-from .models import PollingStation, DRForm
+from .models import PollingStation, DRForm, PartyTally, RegionTally, MediaBlob, Agent, Report, NupNews
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .storage import get_drform_storage
+from . import conflicts, tallies
+from django.core.management import call_command, CommandError
+from io import StringIO, BytesIO
+from unittest import mock
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from PIL import Image
+from . import uploads, jobs, live, metrics, resumable, directory, serializers
+from rest_framework.exceptions import ValidationError
+import asyncio
+import json
+import zipfile
+import csv
+import gzip
+import io
+from .models import Job, Result
 from django.urls import reverse
+from django.utils import timezone
+from datetime import datetime, timedelta
+from collections import Counter
 
 
 class DRFormModelTest(TestCase):
@@ -26,4 +55,1270 @@ class PublicFeedAPITest(TestCase):
 		self.assertEqual(resp.status_code, 200)
 		data = resp.json()
 		# only one verified entry
-		self.assertEqual(len(data), 1)
+		self.assertEqual(len(data['results']), 1)
+
+	def test_feed_items_leave_out_internal_columns(self):
+		item = serializers.DRFormSerializer(DRForm.objects.get(verified=True)).data
+		self.assertEqual(item['total_votes'], 5)
+		for column in ('derivatives', 'claimed_by', 'claim_expires_at', 'idempotency_key'):
+			self.assertNotIn(column, item)
+
+
+class PartyTallyTest(TestCase):
+	def setUp(self):
+		self.station = PollingStation.objects.create(station_id='S3', name='Station 3', district='D3')
+
+	def test_tally_follows_create_update_delete(self):
+		dr = DRForm.objects.create(polling_station=self.station, sha256_hash='h1', totals={'NUP': 10, 'NRM': '4'})
+		other = PollingStation.objects.create(station_id='S4', name='Station 4', district='D3')
+		DRForm.objects.create(polling_station=other, sha256_hash='h2', totals={'NUP': 1, 'NRM': 'n/a'})
+		self.assertEqual(tallies.current(), {})
+		jobs.run_pending()
+		self.assertEqual(tallies.current(), {'NUP': 11, 'NRM': 4})
+
+		dr.totals = {'NUP': 7, 'NRM': 4}
+		dr.verified = True
+		dr.save()
+		jobs.run_pending()
+		self.assertEqual(tallies.current(), {'NUP': 8, 'NRM': 4})
+
+		dr.delete()
+		jobs.run_pending()
+		self.assertEqual(tallies.current(), {'NUP': 1, 'NRM': 0})
+
+	def test_summary_endpoint_reads_tallies(self):
+		DRForm.objects.create(polling_station=self.station, sha256_hash='h1', totals={'NUP': 5, 'NRM': 2})
+		jobs.run_pending()
+		resp = self.client.get('/api/results/summary/')
+		self.assertEqual(resp.json(), [{'party': 'NUP', 'votes': 5}, {'party': 'NRM', 'votes': 2}])
+
+	def test_rebuild_command_repairs_drift(self):
+		DRForm.objects.create(polling_station=self.station, sha256_hash='h1', totals={'NUP': 5})
+		jobs.run_pending()
+		PartyTally.objects.filter(party='NUP').update(votes=99)
+		out = StringIO()
+		call_command('rebuild_tallies', stdout=out)
+		self.assertIn('NUP was off by +94', out.getvalue())
+		self.assertEqual(tallies.current(), {'NUP': 5})
+
+	def test_racing_first_votes_for_a_party_both_count(self):
+		from django.db.models.query import QuerySet
+		PartyTally.objects.create(party='NUP', votes=4)
+		update, calls = QuerySet.update, []
+
+		def lost_race(queryset, **kwargs):
+			calls.append(kwargs)
+			return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+		with mock.patch.object(QuerySet, 'update', lost_race):
+			tallies.apply_delta({'NUP': 3})
+		self.assertEqual(tallies.current(), {'NUP': 7})
+
+
+class VoteRowsTest(TestCase):
+	def setUp(self):
+		self.station = PollingStation.objects.create(station_id='T1', name='Typed', district='D', constituency='C')
+
+	def rows(self, form):
+		return dict(Result.objects.filter(dr_form=form).values_list('party', 'votes'))
+
+	def test_totals_are_dual_written(self):
+		form = DRForm.objects.create(polling_station=self.station, sha256_hash='t', totals={'NUP': '12', 'NRM': 3, 'X': 'n/a', 'Y': -2})
+		self.assertEqual(self.rows(form), {'NUP': 12, 'NRM': 3})
+		form.totals = {'NUP': 20}
+		form.save()
+		self.assertEqual(self.rows(form), {'NUP': 20})
+		form.delete()
+		self.assertFalse(Result.objects.exists())
+
+	def test_rows_and_tallies_drop_the_same_out_of_range_votes(self):
+		form = DRForm.objects.create(polling_station=self.station, sha256_hash='r', totals={'NUP': 2 ** 31, 'NRM': 4, 'P' * 51: 1})
+		jobs.run_pending()
+		self.assertEqual(self.rows(form), {'NRM': 4})
+		self.assertEqual(tallies.current(), {'NRM': 4})
+		self.assertEqual(tallies.diff(tallies.recount(), tallies.current()), {})
+		call_command('backfill_results', '--check', stdout=StringIO())
+
+	def test_backfill_converts_legacy_forms_and_sql_sums_match_the_json(self):
+		other = PollingStation.objects.create(station_id='T2', name='Typed 2', district='D', constituency='C')
+		a = DRForm.objects.create(polling_station=self.station, sha256_hash='a', totals={'NUP': 5, 'NRM': 1})
+		DRForm.objects.create(polling_station=self.station, sha256_hash='b', totals={'NUP': 50})
+		DRForm.objects.create(polling_station=other, sha256_hash='c', totals={'NUP': 2, 'NRM': 7}, verified=True)
+		jobs.run_pending()
+		# As if saved before the dual write
+		Result.objects.filter(dr_form=a).delete()
+		Result.objects.filter(party='NRM').update(votes=0)
+
+		with self.assertRaises(SystemExit):
+			call_command('backfill_results', '--check', stdout=StringIO(), stderr=StringIO())
+		out = StringIO()
+		call_command('backfill_results', stdout=out)
+		self.assertIn('Wrote Result rows for 2 of 3 forms', out.getvalue())
+		call_command('backfill_results', '--check', stdout=StringIO())
+
+		json_totals = Counter()
+		for counted in conflicts.canonical_snapshots():
+			json_totals.update(counted['votes'])
+		self.assertEqual(tallies.recount(), dict(json_totals))
+		self.assertEqual(tallies.recount(), {'NUP': 7, 'NRM': 8})
+		self.assertEqual(tallies.diff(tallies.recount(), tallies.current()), {})
+		self.assertEqual(tallies.rebuild_regions(), 0)
+
+
+class RegionRollupTest(TestCase):
+	def setUp(self):
+		self.s1 = PollingStation.objects.create(station_id='K1', name='Kira 1', district='Wakiso', constituency='Kira')
+		self.s2 = PollingStation.objects.create(station_id='K2', name='Kira 2', district='Wakiso', constituency='Kira')
+		self.s3 = PollingStation.objects.create(station_id='E1', name='Entebbe 1', district='Wakiso', constituency='Entebbe')
+
+	def test_rollups_follow_verification(self):
+		a = DRForm.objects.create(polling_station=self.s1, sha256_hash='a', totals={'NUP': 10, 'NRM': 2})
+		b = DRForm.objects.create(polling_station=self.s2, sha256_hash='b', totals={'NUP': 1})
+		c = DRForm.objects.create(polling_station=self.s3, sha256_hash='c', totals={'NUP': 3, 'NRM': 3})
+		self.assertFalse(RegionTally.objects.exists())
+
+		for form in (a, b, c):
+			form.verified = True
+			form.save()
+		jobs.run_pending()
+
+		kira = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Kira')
+		self.assertEqual(kira.totals, {'NUP': 11, 'NRM': 2})
+		self.assertEqual((kira.forms_reported, kira.stations_reporting), (2, 2))
+		wakiso = RegionTally.objects.get(level=RegionTally.DISTRICT, name='Wakiso')
+		self.assertEqual((wakiso.forms_reported, wakiso.stations_reporting), (3, 3))
+
+		a.delete()
+		b.verified = False
+		b.save()
+		jobs.run_pending()
+		kira.refresh_from_db()
+		self.assertEqual((kira.totals['NUP'], kira.forms_reported, kira.stations_reporting), (0, 0, 0))
+		self.assertEqual(tallies.rebuild_regions(), 0)
+
+	def test_deleting_a_station_takes_its_votes_out_of_the_rollups(self):
+		DRForm.objects.create(polling_station=self.s1, sha256_hash='a', totals={'NUP': 10}, verified=True)
+		DRForm.objects.create(polling_station=self.s3, sha256_hash='c', totals={'NUP': 3}, verified=True)
+		jobs.run_pending()
+		self.s1.delete()
+		jobs.run_pending()
+		kira = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Kira')
+		self.assertEqual((kira.totals['NUP'], kira.forms_reported, kira.stations_reporting), (0, 0, 0))
+		national = RegionTally.objects.get(level=RegionTally.NATIONAL)
+		self.assertEqual((national.totals['NUP'], national.stations_reporting), (3, 1))
+		self.assertEqual(tallies.current(), {'NUP': 3})
+
+	def test_moving_a_station_moves_its_votes(self):
+		DRForm.objects.create(polling_station=self.s1, sha256_hash='a', totals={'NUP': 10}, verified=True)
+		jobs.run_pending()
+		self.s1.district, self.s1.constituency = 'Mukono', 'Seeta'
+		self.s1.save()
+		jobs.run_pending()
+		kira = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Kira')
+		self.assertEqual((kira.totals['NUP'], kira.forms_reported, kira.stations_reporting), (0, 0, 0))
+		seeta = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Seeta')
+		self.assertEqual((seeta.parent, seeta.totals, seeta.stations_reporting), ('Mukono', {'NUP': 10}, 1))
+		self.assertEqual(RegionTally.objects.get(level=RegionTally.STATION, name='K1').parent, 'Seeta')
+		self.assertEqual(RegionTally.objects.get(level=RegionTally.NATIONAL).stations_reporting, 1)
+		self.assertEqual(tallies.current(), {'NUP': 10})
+		self.assertEqual(tallies.rebuild_regions(), 0)
+
+	def test_rollup_endpoints(self):
+		DRForm.objects.create(polling_station=self.s2, sha256_hash='a', totals={'NUP': 4}, verified=True)
+		jobs.run_pending()
+		resp = self.client.get('/api/results/district/Wakiso/')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()['totals'], {'NUP': 4})
+		self.assertEqual([c['name'] for c in resp.json()['children']], ['Kira'])
+
+		resp = self.client.get('/api/results/constituency/Kira/')
+		self.assertEqual(resp.json()['children'][0]['name'], 'K2')
+
+		tree = self.client.get('/api/results/tree/').json()
+		self.assertEqual(tree['children'][0]['children'][0]['name'], 'Kira')
+		self.assertEqual(self.client.get('/api/results/district/Nowhere/').status_code, 404)
+
+
+class StationConflictTest(TestCase):
+	def setUp(self):
+		self.admin = get_user_model().objects.create_user(username='referee', password='pw', is_staff=True)
+		self.client = APIClient()
+		self.client.force_authenticate(self.admin)
+		self.station = PollingStation.objects.create(station_id='X1', name='Disputed', district='D', constituency='C')
+		self.calm = PollingStation.objects.create(station_id='X2', name='Calm', district='D', constituency='C')
+
+	def form(self, station, sha, totals, **extra):
+		form = DRForm.objects.create(polling_station=station, sha256_hash=sha, totals=totals, **extra)
+		jobs.run_pending()
+		return form
+
+	def test_disagreeing_forms_are_flagged_and_counted_once(self):
+		first = self.form(self.station, 'a', {'NUP': 10, 'NRM': 5})
+		self.form(self.calm, 'c', {'NUP': 1})
+		self.form(self.calm, 'c', {'NUP': 1, 'NRM': 0})  # the same scan again: no conflict
+		self.assertEqual(tallies.current(), {'NUP': 11, 'NRM': 5})
+		self.assertFalse(self.client.get('/api/conflicts/').json()['results'])
+
+		second = self.form(self.station, 'b', {'NUP': 2, 'NRM': 9})
+		self.assertEqual(tallies.current(), {'NUP': 11, 'NRM': 5})
+		[conflict] = self.client.get('/api/conflicts/').json()['results']
+		self.assertEqual(conflict['station']['station_id'], 'X1')
+		self.assertEqual((conflict['form_count'], conflict['totals_variants'], conflict['image_variants']), (2, 2, 2))
+		self.assertEqual((conflict['canonical'], [f['id'] for f in conflict['forms']]), (first.pk, [first.pk, second.pk]))
+
+		# A verified form wins over unverified ones
+		second.verified = True
+		second.save()
+		jobs.run_pending()
+		self.assertEqual(tallies.current(), {'NUP': 3, 'NRM': 9})
+		x1 = RegionTally.objects.get(level=RegionTally.STATION, name='X1')
+		self.assertEqual((x1.totals, x1.forms_reported), ({'NUP': 2, 'NRM': 9}, 1))
+
+		second.delete()
+		jobs.run_pending()
+		self.assertEqual(tallies.current(), {'NUP': 11, 'NRM': 5})
+		self.assertFalse(self.client.get('/api/conflicts/').json()['results'])
+		self.assertEqual(tallies.diff(tallies.recount(), tallies.current()), {})
+		self.assertEqual(tallies.rebuild_regions(), 0)
+
+	def test_resolving_pins_the_counted_form(self):
+		self.form(self.station, 'a', {'NUP': 10})
+		second = self.form(self.station, 'b', {'NUP': 4})
+		resp = self.client.post('/api/conflicts/X1/resolve/', {'canonical': second.pk}, format='json')
+		self.assertEqual(resp.status_code, 200, resp.content)
+		self.assertEqual((resp.json()['canonical'], resp.json()['pinned']), (second.pk, True))
+		self.assertEqual(tallies.current(), {'NUP': 4})
+
+		# Later uploads do not move the pin; it is still listed, as resolved
+		self.form(self.station, 'c', {'NUP': 10})
+		self.assertEqual(tallies.current(), {'NUP': 4})
+		self.assertEqual(len(self.client.get('/api/conflicts/?resolved=true').json()['results']), 1)
+		self.assertFalse(self.client.get('/api/conflicts/?resolved=false').json()['results'])
+		self.assertEqual(self.client.post('/api/conflicts/X2/resolve/', {'canonical': second.pk}, format='json').status_code, 404)
+
+		out = StringIO()
+		call_command('rebuild_tallies', stdout=out)
+		self.assertIn('Stored tallies match the recount.', out.getvalue())
+		self.assertNotIn('out of date', out.getvalue())
+
+
+class KeysetPaginationTest(TestCase):
+	def setUp(self):
+		station = PollingStation.objects.create(station_id='S4', name='Station 4', district='D4')
+		self.forms = [
+			DRForm.objects.create(polling_station=station, sha256_hash=f'h{i}', totals={'NUP': i}, verified=True)
+			for i in range(5)
+		]
+
+	def test_cursor_walks_feed_without_gaps_or_duplicates(self):
+		resp = self.client.get('/api/drforms/public/', {'page_size': 2}).json()
+		self.assertNotIn('count', resp)
+		seen = [item['id'] for item in resp['results']]
+		# a new upload arriving mid-scroll must not shift the following pages
+		DRForm.objects.create(polling_station=self.forms[0].polling_station, sha256_hash='new', verified=True)
+		while resp['next']:
+			resp = self.client.get(resp['next']).json()
+			seen += [item['id'] for item in resp['results']]
+		self.assertEqual(seen, [f.id for f in reversed(self.forms)])
+
+		back = self.client.get(resp['previous']).json()
+		self.assertEqual([item['id'] for item in back['results']], seen[-3:-1])
+
+	def test_page_mode_is_still_available(self):
+		resp = self.client.get('/api/drforms/public/', {'page': 1}).json()
+		self.assertEqual(resp['count'], 5)
+		self.assertEqual(self.client.get('/api/drforms/public/', {'cursor': 'bogus'}).status_code, 404)
+
+	def test_agent_and_station_lists_are_paginated(self):
+		resp = self.client.get('/api/polling_stations/', {'page_size': 500}).json()
+		self.assertEqual(resp['count'], 1)
+		self.assertEqual(resp['results'][0]['station_id'], 'S4')
+
+
+def make_png(color='red', exif=None):
+	buf = BytesIO()
+	Image.new('RGB', (8, 8), color).save(buf, 'PNG', **({'exif': exif} if exif else {}))
+	return buf.getvalue()
+
+
+class StreamingUploadTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.settings_override = override_settings(MEDIA_ROOT=self.media, UPLOAD_STAGING_DIR=None)
+		self.settings_override.enable()
+		self.user = get_user_model().objects.create_user(username='agent', password='pw')
+		self.client.force_login(self.user)
+		PollingStation.objects.create(station_id='S5', name='Station 5', district='D5')
+		self.png = make_png()
+
+	def tearDown(self):
+		self.settings_override.disable()
+		shutil.rmtree(self.media, ignore_errors=True)
+
+	def post(self, **extra):
+		client = APIClient()
+		client.force_authenticate(self.user)
+		data = {'polling_station': 'S5', 'image': SimpleUploadedFile('form.png', self.png, 'image/png'), 'totals': '{}',
+				'sha256_hash': hashlib.sha256(self.png).hexdigest()}
+		return client.post('/api/drforms/upload/', data, format='multipart', **extra)
+
+	def test_upload_hashes_while_streaming(self):
+		resp = self.post()
+		self.assertEqual(resp.status_code, 201, resp.content)
+		self.assertEqual(resp.json()['sha256_hash'], hashlib.sha256(self.png).hexdigest())
+		self.assertEqual(DRForm.objects.get().image.read(), self.png)
+
+	def test_hash_header_mismatch_is_rejected(self):
+		resp = self.post(HTTP_X_CONTENT_SHA256='0' * 64)
+		self.assertEqual(resp.status_code, 400)
+		self.assertFalse(DRForm.objects.exists())
+
+	def test_oversized_image_is_rejected(self):
+		with mock.patch.dict(uploads.MAX_UPLOAD_SIZES, {'image': 16}):
+			resp = self.post()
+		self.assertEqual(resp.status_code, 413)
+		self.assertFalse(DRForm.objects.exists())
+
+	def test_oversized_request_is_refused_before_reading_it(self):
+		resp = self.post(CONTENT_LENGTH=str(300 * 1024 * 1024))
+		self.assertEqual(resp.status_code, 413)
+		self.assertIn('too large', resp.json()['detail'])
+		self.assertFalse(DRForm.objects.exists())
+
+	def test_identical_uploads_share_one_file(self):
+		first = self.post().json()
+		second = self.post().json()
+		a, b = DRForm.objects.get(pk=first['id']), DRForm.objects.get(pk=second['id'])
+		digest = hashlib.sha256(self.png).hexdigest()
+		self.assertEqual(a.image.name, f'dr_forms/{digest[:2]}/{digest[2:4]}/{digest}.png')
+		self.assertEqual(a.image.name, b.image.name)
+		self.assertEqual(MediaBlob.objects.get(path=a.image.name).ref_count, 2)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			a.delete()
+		self.assertTrue(get_drform_storage().exists(b.image.name))
+		with self.captureOnCommitCallbacks(execute=True):
+			b.delete()
+		self.assertFalse(get_drform_storage().exists(b.image.name))
+		self.assertFalse(MediaBlob.objects.exists())
+
+	def test_saving_an_existing_name_keeps_the_file(self):
+		storage = get_drform_storage()
+		name = storage.save('dr_forms/ab/cd/abcd.png', SimpleUploadedFile('x.png', self.png))
+		# As if another upload wrote the same bytes between the name check and the write
+		self.assertEqual(storage._save(name, SimpleUploadedFile('x.png', self.png)), name)
+		self.assertEqual(sorted(os.listdir(os.path.dirname(storage.path(name)))), ['abcd.png'])
+		with storage.open(name) as f:
+			self.assertEqual(f.read(), self.png)
+
+	def test_racing_first_references_share_one_blob(self):
+		from django.db.models.query import QuerySet
+		from . import storage
+		name = get_drform_storage().save('dr_forms/ab/cd/abcd.png', SimpleUploadedFile('x.png', self.png))
+		MediaBlob.objects.create(path=name, ref_count=1)
+		update, calls = QuerySet.update, []
+
+		def lost_race(queryset, **kwargs):
+			# The first increment runs before the other upload's row exists
+			calls.append(kwargs)
+			return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+		with mock.patch.object(QuerySet, 'update', lost_race):
+			storage.retain(name)
+		self.assertEqual(MediaBlob.objects.get(path=name).ref_count, 2)
+
+	def test_migrate_media_moves_legacy_files(self):
+		storage = get_drform_storage()
+		legacy = [storage.save(f'dr_forms/drform_{i}.png', SimpleUploadedFile('x.png', self.png)) for i in range(2)]
+		station = PollingStation.objects.get()
+		for name in legacy:
+			DRForm.objects.create(polling_station=station, sha256_hash='x', image=name)
+		DRForm.objects.update(updated_at=timezone.now() - timedelta(days=1))
+		call_command('migrate_media', stdout=StringIO())
+		# The feeds' cache validators must see the moved URLs
+		self.assertFalse(DRForm.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=1)).exists())
+		names = set(DRForm.objects.values_list('image', flat=True))
+		self.assertEqual(len(names), 1)
+		self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+		self.assertFalse(any(storage.exists(name) for name in legacy))
+
+	def test_upload_is_processed_by_job(self):
+		resp = self.post()
+		form = DRForm.objects.get(pk=resp.json()['id'])
+		self.assertEqual(form.derivatives, {})
+		self.assertEqual(jobs.run_pending(), 2)  # process_upload + apply_tallies
+		job = Job.objects.get(kind='process_upload')
+		self.assertEqual((job.status, job.result['hash_ok']), (Job.DONE, True))
+		form = DRForm.objects.get(pk=resp.json()['id'])
+		self.assertEqual(set(form.derivatives), {'thumb', 'feed'})
+		self.assertTrue(get_drform_storage().exists(form.derivatives['thumb']))
+
+		form.verified = True
+		form.save()
+		item = self.client.get('/api/drforms/public/').json()['results'][0]
+		self.assertTrue(item['image_thumb'].endswith(form.derivatives['thumb']))
+		self.assertTrue(item['image'].endswith(form.image.name))
+
+	def test_gps_is_read_from_exif(self):
+		exif = Image.Exif()
+		exif[0x8825] = {1: 'N', 2: (0.0, 30.0, 0.0), 3: 'E', 4: (32.0, 34.0, 48.0)}
+		self.png = make_png(exif=exif)
+		resp = self.post()
+		jobs.run_pending()
+		self.assertEqual(DRForm.objects.get(pk=resp.json()['id']).gps, {'lat': 0.5, 'lng': 32.58, 'source': 'exif'})
+
+	def test_backfill_command(self):
+		resp = self.post()
+		call_command('build_derivatives', '--workers', '1', stdout=StringIO())
+		form = DRForm.objects.get(pk=resp.json()['id'])
+		self.assertTrue(get_drform_storage().exists(form.derivatives['feed']))
+
+
+@jobs.task('test_flaky')
+def flaky_job(payload):
+	if payload.get('fail'):
+		raise ValueError('boom')
+	return {'ok': True}
+
+
+class JobQueueTest(TestCase):
+	def test_failed_jobs_retry_then_give_up(self):
+		job = jobs.enqueue('test_flaky', {'fail': True}, max_attempts=2)
+		with self.assertLogs('results.jobs', 'ERROR'):
+			self.assertEqual(jobs.run_pending(), 1)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+		self.assertIn('boom', job.last_error)
+
+		Job.objects.filter(pk=job.pk).update(run_after=job.created_at)
+		with self.assertLogs('results.jobs', 'ERROR'):
+			jobs.run_pending()
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+	def test_claim_leases_each_job_once(self):
+		for _ in range(3):
+			jobs.enqueue('test_flaky')
+		first = jobs.claim('w1', limit=2)
+		second = jobs.claim('w2', limit=2)
+		self.assertEqual(len(first), 2)
+		self.assertEqual(len(second), 1)
+		self.assertFalse({j.pk for j in first} & {j.pk for j in second})
+
+		# a worker that lost its lease cannot complete the job
+		stolen = first[0]
+		Job.objects.filter(pk=stolen.pk).update(leased_by='someone-else')
+		with self.assertLogs('results.jobs', 'WARNING'):
+			self.assertFalse(jobs.run(stolen))
+		self.assertTrue(jobs.run(first[1]))
+
+	@override_settings(JOBS_EAGER=True)
+	def test_eager_mode_runs_inline(self):
+		station = PollingStation.objects.create(station_id='S6', name='Station 6', district='D6')
+		DRForm.objects.create(polling_station=station, sha256_hash='h', totals={'NUP': 2})
+		self.assertFalse(Job.objects.exists())
+		self.assertEqual(tallies.current(), {'NUP': 2})
+
+
+class ImportStationsTest(TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		PollingStation.objects.create(station_id='PS-1', name='Old name', district='Kampala', constituency='Central')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir, ignore_errors=True)
+
+	def write(self, name, text):
+		path = f'{self.dir}/{name}'
+		with open(path, 'w') as out:
+			out.write(text)
+		return path
+
+	def test_csv_upsert_with_rejects(self):
+		path = self.write('stations.csv', (
+			'station_id,name,district,constituency,location\n'
+			'PS-1,Kololo,Kampala,Central,\n'
+			'PS-2,Nakawa,Kampala,Nakawa,Market\n'
+			',No id,Kampala,Central,\n'
+		))
+		rejects = f'{self.dir}/rejects.ndjson'
+		out = StringIO()
+		call_command('import_stations', path, '--batch-size', '1', '--rejects', rejects, stdout=out)
+		self.assertIn('1 created, 1 updated, 0 unchanged, 1 rejected', out.getvalue())
+		self.assertEqual(PollingStation.objects.get(station_id='PS-1').name, 'Kololo')
+		self.assertEqual(PollingStation.objects.get(station_id='PS-2').location, 'Market')
+		with open(rejects) as handle:
+			self.assertIn('missing station_id', handle.read())
+
+	def test_moved_stations_take_their_votes_along(self):
+		station = PollingStation.objects.get(station_id='PS-1')
+		DRForm.objects.create(polling_station=station, sha256_hash='a', totals={'NUP': 4}, verified=True)
+		jobs.run_pending()
+		path = self.write('stations.csv', 'station_id,name,district,constituency,location\nPS-1,Old name,Kampala,Kawempe,\n')
+		call_command('import_stations', path, stdout=StringIO())
+		jobs.run_pending()
+		central = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Central')
+		self.assertEqual((central.totals['NUP'], central.stations_reporting), (0, 0))
+		kawempe = RegionTally.objects.get(level=RegionTally.CONSTITUENCY, name='Kawempe')
+		self.assertEqual((kawempe.totals, kawempe.stations_reporting), ({'NUP': 4}, 1))
+		self.assertEqual(tallies.rebuild_regions(), 0)
+
+	def test_ndjson(self):
+		path = self.write('stations.ndjson', (
+			'{"station_id": "PS-3", "name": "Gulu", "district": "Gulu", "constituency": "Gulu East"}\n'
+			'not json\n'
+		))
+		call_command('import_stations', path, stdout=StringIO(), stderr=StringIO())
+		self.assertTrue(PollingStation.objects.filter(station_id='PS-3').exists())
+
+
+@override_settings(PROVISIONING_WORKERS=0, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkAgentProvisioningTest(TestCase):
+	def setUp(self):
+		self.admin = get_user_model().objects.create_user(username='admin', password='pw', is_staff=True)
+		self.client = APIClient()
+		self.client.force_authenticate(self.admin)
+		PollingStation.objects.create(station_id='PS-1', name='Kololo', district='Kampala', constituency='Central')
+		get_user_model().objects.create_user(username='taken@example.com', password='pw')
+
+	def agent(self, email, station='PS-1', **extra):
+		row = {'full_name': 'A. Agent', 'phone': '0700000000', 'email': email,
+			'district': 'Kampala', 'constituency': 'Central', 'polling_station': station}
+		row.update(extra)
+		return row
+
+	def test_good_rows_are_committed_and_bad_rows_reported(self):
+		resp = self.client.post('/api/agents/bulk/', {'agents': [
+			self.agent('one@example.com'),
+			self.agent('two@example.com', station='Kololo'),
+			self.agent('taken@example.com'),
+			self.agent('three@example.com', station='PS-404'),
+			self.agent('one@example.com'),
+			self.agent('not-an-email'),
+		]}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		data = resp.json()
+		self.assertEqual([c['username'] for c in data['created']], ['one@example.com', 'two@example.com'])
+		self.assertEqual([r['line'] for r in data['rejected']], [3, 4, 5, 6])
+		passwords = {c['password'] for c in data['created']}
+		self.assertEqual(len(passwords), 2)
+		user = get_user_model().objects.get(username='one@example.com')
+		self.assertTrue(user.is_agent)
+		self.assertTrue(user.check_password(data['created'][0]['password']))
+		self.assertEqual(Agent.objects.get(user=user).polling_station.station_id, 'PS-1')
+
+	def test_items_that_are_not_objects_are_rejected(self):
+		resp = self.client.post('/api/agents/bulk/', {'agents': ['one@example.com', None, [1], self.agent('ok@example.com')]}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		data = resp.json()
+		self.assertEqual([c['username'] for c in data['created']], ['ok@example.com'])
+		self.assertEqual([(r['line'], r['error']) for r in data['rejected']], [(n, 'not a JSON object') for n in (1, 2, 3)])
+
+	def test_command_reads_csv(self):
+		path = tempfile.mktemp(suffix='.csv')
+		with open(path, 'w') as handle:
+			handle.write('full_name,phone,email,district,constituency,polling_station\n')
+			handle.write('B. Agent,0711,b@example.com,Kampala,Central,PS-1\n')
+		out = StringIO()
+		call_command('provision_agents', path, stdout=out, stderr=StringIO())
+		self.assertIn('b@example.com', out.getvalue())
+		self.assertTrue(Agent.objects.filter(email='b@example.com').exists())
+
+
+class BatchVerifyTest(TestCase):
+	def setUp(self):
+		self.admin = get_user_model().objects.create_user(username='admin', password='pw', is_staff=True)
+		self.client = APIClient()
+		self.client.force_authenticate(self.admin)
+		self.kampala = PollingStation.objects.create(station_id='V1', name='V 1', district='Kampala', constituency='Central')
+		self.wakiso = PollingStation.objects.create(station_id='V2', name='V 2', district='Wakiso', constituency='Kira')
+		self.pending = [
+			DRForm.objects.create(
+				polling_station=PollingStation.objects.create(station_id=f'V1-{n}', name=f'V 1-{n}', district='Kampala', constituency='Central'),
+				sha256_hash=f'v{n}', totals={'NUP': 10, 'NRM': n})
+			for n in range(3)
+		]
+		self.done = DRForm.objects.create(polling_station=self.wakiso, sha256_hash='vd', totals={'NUP': 1}, verified=True)
+		jobs.run_pending()
+
+	def test_ids_are_verified_in_one_update_and_one_tally_job(self):
+		ids = [f.pk for f in self.pending] + [self.done.pk, 9999]
+		before = Job.objects.filter(kind='apply_tallies').count()
+		resp = self.client.post('/api/drforms/verify/', {'ids': ids}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		data = resp.json()
+		self.assertEqual((data['verified'], data['already_verified'], data['not_found']), (3, 1, 1))
+		self.assertEqual(data['results'][-1], {'id': 9999, 'status': 'not_found'})
+		self.assertEqual(Job.objects.filter(kind='apply_tallies').count(), before + 1)
+		self.assertEqual(DRForm.objects.filter(verified=True, verified_by=self.admin).count(), 3)
+
+		jobs.run_pending()
+		kampala = RegionTally.objects.get(level=RegionTally.DISTRICT, name='Kampala')
+		self.assertEqual((kampala.forms_reported, kampala.totals), (3, {'NUP': 30, 'NRM': 3}))
+
+	def test_query_count_does_not_grow_with_the_batch(self):
+		more = [DRForm.objects.create(polling_station=self.kampala, sha256_hash=f'm{n}', totals={'NUP': 1}) for n in range(20)]
+		with CaptureQueriesContext(connection) as small:
+			self.client.post('/api/drforms/verify/', {'ids': [self.pending[0].pk]}, format='json')
+		with CaptureQueriesContext(connection) as large:
+			self.client.post('/api/drforms/verify/', {'ids': [f.pk for f in more]}, format='json')
+		self.assertEqual(len(large), len(small))
+
+	def test_filter_verifies_oldest_matching_pending_forms(self):
+		other = DRForm.objects.create(polling_station=self.wakiso, sha256_hash='w', totals={'NUP': 2})
+		resp = self.client.post('/api/drforms/verify/', {'filter': {'district': 'Kampala'}, 'limit': 2}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual([r['id'] for r in resp.json()['results']], [f.pk for f in self.pending[:2]])
+		other.refresh_from_db()
+		self.assertFalse(other.verified)
+
+	def test_single_verify_uses_the_same_path(self):
+		resp = self.client.post(f'/api/drforms/{self.pending[0].pk}/verify/')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(self.client.post('/api/drforms/9999/verify/').status_code, 404)
+		jobs.run_pending()
+		self.assertEqual(RegionTally.objects.get(level=RegionTally.DISTRICT, name='Kampala').totals, {'NUP': 10, 'NRM': 0})
+
+	def test_bad_requests_and_non_admins_are_refused(self):
+		for body in ({}, {'ids': [1], 'filter': {'district': 'Kampala'}}, {'filter': {'password': 'x'}}, {'filter': {}},
+				{'filter': {'uploaded_before': 'yesterday'}}, {'filter': {'uploaded_by': 'bob'}}, {'filter': ['district']}):
+			with self.subTest(body=body):
+				self.assertEqual(self.client.post('/api/drforms/verify/', body, format='json').status_code, 400)
+		resp = self.client.post('/api/drforms/verify/', {'filter': {'uploaded_before': '2000-01-01T00:00:00Z'}}, format='json')
+		self.assertEqual((resp.status_code, resp.json()['verified']), (200, 0))
+		self.client.force_authenticate(get_user_model().objects.create_user(username='agent', password='pw'))
+		self.assertEqual(self.client.post('/api/drforms/verify/', {'ids': [1]}, format='json').status_code, 403)
+
+
+class ModerationQueueTest(TestCase):
+	def setUp(self):
+		User = get_user_model()
+		self.alice = User.objects.create_user(username='alice', password='pw', is_staff=True)
+		self.bob = User.objects.create_user(username='bob', password='pw', is_staff=True)
+		station = PollingStation.objects.create(station_id='Q1', name='Q 1', district='D')
+		self.forms = [DRForm.objects.create(polling_station=station, sha256_hash=f'q{n}', totals={'NUP': 1}) for n in range(5)]
+		self.client = APIClient()
+
+	def claim(self, user, limit):
+		self.client.force_authenticate(user)
+		resp = self.client.post('/api/moderation/claim/', {'limit': limit}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		return [f['id'] for f in resp.json()['results']]
+
+	def test_reviewers_get_disjoint_oldest_first_batches(self):
+		alice = self.claim(self.alice, 2)
+		bob = self.claim(self.bob, 2)
+		self.assertEqual(alice, [f.pk for f in self.forms[:2]])
+		self.assertEqual(bob, [f.pk for f in self.forms[2:4]])
+		# Claiming again renews what alice holds instead of taking more
+		self.assertEqual(self.claim(self.alice, 2), alice)
+
+	def test_expired_leases_return_to_the_queue(self):
+		alice = self.claim(self.alice, 2)
+		DRForm.objects.filter(pk__in=alice).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+		self.assertEqual(self.claim(self.bob, 2), alice)
+
+	def test_release_and_verify_clear_the_lease(self):
+		alice = self.claim(self.alice, 3)
+		resp = self.client.post('/api/moderation/release/', {'ids': [True]}, format='json')
+		self.assertEqual(resp.status_code, 400)
+		resp = self.client.post('/api/moderation/release/', {'ids': alice[2:]}, format='json')
+		self.assertEqual(resp.json(), {'released': 1})
+		self.client.post('/api/drforms/verify/', {'ids': alice[:2]}, format='json')
+		verified = DRForm.objects.get(pk=alice[0])
+		self.assertIsNone(verified.claimed_by)
+		self.assertIsNotNone(verified.verified_at)
+		self.assertEqual(self.claim(self.bob, 1), alice[2:])
+
+	def test_stats_report_depth_leases_and_throughput(self):
+		self.claim(self.alice, 2)
+		self.client.post('/api/drforms/verify/', {'ids': [self.forms[0].pk]}, format='json')
+		stats = self.client.get('/api/moderation/stats/').json()
+		self.assertEqual((stats['depth'], stats['claimed'], stats['reviewers']), (4, 1, 1))
+		self.assertEqual((stats['verified_last_15m'], stats['verified_last_60m']), (1, 1))
+
+	def test_queue_is_admin_only(self):
+		self.client.force_authenticate(get_user_model().objects.create_user(username='agent', password='pw'))
+		self.assertEqual(self.client.post('/api/moderation/claim/', {}, format='json').status_code, 403)
+		self.assertEqual(self.client.get('/api/moderation/stats/').status_code, 403)
+
+
+class SeedElectionTest(TestCase):
+	def test_generates_a_consistent_election(self):
+		media = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+		with override_settings(MEDIA_ROOT=media):
+			call_command('seed_election', districts=2, constituencies=2, stations=3, forms=2, news=4, stdout=StringIO())
+		self.assertEqual(PollingStation.objects.count(), 12)
+		self.assertEqual(Agent.objects.count(), 12)
+		self.assertEqual(DRForm.objects.count(), 24)
+		self.assertEqual(NupNews.objects.count(), 4)
+		self.assertEqual(RegionTally.objects.filter(level=RegionTally.CONSTITUENCY).count(), 4)
+		self.assertEqual(tallies.diff(tallies.recount(), tallies.current()), {})
+		self.assertEqual(tallies.rebuild_regions(), 0)
+		self.assertEqual(MediaBlob.objects.get().ref_count, 24)
+		call_command('backfill_results', '--check', stdout=StringIO())
+
+		with self.assertRaises(CommandError):
+			call_command('seed_election', districts=1, stdout=StringIO())
+
+
+class MetricsTest(TestCase):
+	def setUp(self):
+		metrics.registry.reset()
+		station = PollingStation.objects.create(station_id='M1', name='Metrics 1', district='D')
+		DRForm.objects.create(polling_station=station, sha256_hash='m1', totals={'NUP': 2}, verified=True)
+
+	def scrape(self, **headers):
+		resp = self.client.get('/api/_metrics', **headers)
+		return resp, resp.content.decode()
+
+	@override_settings(DEBUG=True)
+	def test_requests_are_recorded_per_route(self):
+		self.client.get('/api/drforms/public/')
+		self.client.get('/api/drforms/public/')
+		self.client.get('/api/results/district/Nowhere/')
+		resp, text = self.scrape()
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp['Content-Type'].startswith('text/plain; version=0.0.4'))
+		self.assertIn('nup_http_requests_total{route="api/drforms/public/",method="GET",status="200"} 2', text)
+		self.assertIn('nup_http_requests_total{route="api/results/district/<str:name>/",method="GET",status="404"} 1', text)
+		self.assertIn('nup_http_request_duration_seconds_bucket{route="api/drforms/public/",method="GET",le="+Inf"} 2', text)
+		self.assertIn('# TYPE nup_http_request_duration_seconds histogram', text)
+		queries = [line for line in text.splitlines() if line.startswith('nup_db_queries_per_request_sum{route="api/drforms/public/"}')]
+		self.assertGreater(float(queries[0].split()[-1]), 0)
+		serializer = [line for line in text.splitlines() if line.startswith('nup_serializer_seconds_total{route="api/drforms/public/"}')]
+		self.assertGreater(float(serializer[0].split()[-1]), 0)
+
+	@override_settings(METRICS_TOKEN='s3cret')
+	def test_scrapes_need_the_token_when_configured(self):
+		self.assertEqual(self.scrape()[0].status_code, 403)
+		self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')[0].status_code, 200)
+
+	@override_settings(METRICS_TOKEN='', DEBUG=False)
+	def test_scrapes_are_refused_without_a_token_outside_debug(self):
+		self.assertEqual(self.scrape()[0].status_code, 403)
+
+	@override_settings(METRICS_TOKEN='s3cret')
+	async def test_async_requests_record_queries_and_serializers(self):
+		resp = await self.async_client.get('/api/drforms/public/')
+		self.assertEqual(resp.status_code, 200)
+		text = metrics.registry.expose()
+		queries = [line for line in text.splitlines() if line.startswith('nup_db_queries_per_request_sum{route="api/drforms/public/"}')]
+		self.assertGreater(float(queries[0].split()[-1]), 0)
+		serializer = [line for line in text.splitlines() if line.startswith('nup_serializer_seconds_total{route="api/drforms/public/"}')]
+		self.assertGreater(float(serializer[0].split()[-1]), 0)
+
+	@override_settings(SLOW_REQUEST_SECONDS=0, SLOW_REQUEST_SAMPLE_RATE=1)
+	def test_sampled_slow_requests_log_their_sql(self):
+		with self.assertLogs('results.slow_requests', 'WARNING') as logs:
+			self.client.get('/api/drforms/public/')
+		self.assertIn('api/drforms/public/', logs.output[0])
+		self.assertIn('SELECT', logs.output[0])
+
+
+class BatchSyncTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.settings_override = override_settings(MEDIA_ROOT=self.media, UPLOAD_STAGING_DIR=None)
+		self.settings_override.enable()
+		self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+		self.addCleanup(self.settings_override.disable)
+		self.user = get_user_model().objects.create_user(username='field-agent', password='pw')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+		PollingStation.objects.create(station_id='S-A', name='Alpha', district='D', constituency='C')
+		PollingStation.objects.create(station_id='S-B', name='Beta', district='D', constituency='C')
+		self.scans = {'a.png': make_png('red'), 'b.png': make_png('blue'), 'c.png': make_png('green')}
+		self.manifest = [
+			{'key': 'k-1', 'polling_station': 'S-A', 'file': 'a.png', 'totals': {'NUP': 10, 'NRM': 4},
+				'sha256': hashlib.sha256(self.scans['a.png']).hexdigest()},
+			{'key': 'k-2', 'polling_station': 'Beta', 'file': 'b.png', 'totals': {'NUP': 3}},
+			{'key': 'k-3', 'polling_station': 'S-404', 'file': 'c.png'},
+		]
+
+	def sync(self, manifest=None):
+		data = {'manifest': json.dumps(manifest or self.manifest)}
+		for name, content in self.scans.items():
+			data[name] = SimpleUploadedFile(name, content, 'image/png')
+		resp = self.client.post('/api/drforms/sync/', data, format='multipart')
+		self.assertEqual(resp.status_code, 200, resp.content)
+		return resp.json()
+
+	def test_items_get_their_own_outcomes_and_retries_are_idempotent(self):
+		first = self.sync()
+		self.assertEqual((first['created'], first['duplicate'], first['rejected']), (2, 0, 1))
+		self.assertEqual(first['results'][2], {'key': 'k-3', 'status': 'rejected', 'error': 'Polling station not found'})
+		form = DRForm.objects.get(pk=first['results'][0]['id'])
+		self.assertEqual((form.uploaded_by, form.idempotency_key, form.totals), (self.user, 'k-1', {'NUP': 10, 'NRM': 4}))
+		self.assertEqual(form.image.read(), self.scans['a.png'])
+
+		again = self.sync()
+		self.assertEqual((again['created'], again['duplicate']), (0, 2))
+		self.assertEqual([r.get('id') for r in again['results'][:2]], [r['id'] for r in first['results'][:2]])
+		self.assertEqual(DRForm.objects.count(), 2)
+
+	def test_same_scan_for_the_same_station_is_a_duplicate(self):
+		first = self.sync()
+		resent = self.sync([dict(self.manifest[0], key='new-key')])
+		self.assertEqual(resent['results'], [{'key': 'new-key', 'status': 'duplicate', 'id': first['results'][0]['id']}])
+
+	def test_hash_mismatch_and_oversized_files_are_rejected_per_item(self):
+		manifest = [dict(self.manifest[0], sha256='0' * 64), self.manifest[1]]
+		result = self.sync(manifest)
+		self.assertEqual([r['status'] for r in result['results']], ['rejected', 'created'])
+		self.assertEqual(result['results'][0]['error'], 'Hash mismatch')
+
+		self.scans['big.png'] = make_png('white') + b'\0' * 4096
+		with mock.patch.dict(uploads.MAX_UPLOAD_SIZES, {'image': 2048}):
+			result = self.sync([{'key': 'k-big', 'polling_station': 'S-A', 'file': 'big.png'}])
+		self.assertEqual(result['results'][0]['status'], 'rejected')
+		self.assertIn('too large', result['results'][0]['error'])
+
+	def test_files_that_are_not_images_are_rejected_per_item(self):
+		self.scans['notes.png'] = b'not an image'
+		result = self.sync([{'key': 'k-txt', 'polling_station': 'S-A', 'file': 'notes.png'}, self.manifest[1]])
+		self.assertEqual([r['status'] for r in result['results']], ['rejected', 'created'])
+		self.assertIn('valid image', result['results'][0]['error'])
+		self.assertEqual(DRForm.objects.count(), 1)
+
+	def test_file_names_that_are_not_strings_are_rejected_per_item(self):
+		result = self.sync([{'key': 'k-list', 'polling_station': 'S-A', 'file': ['a.png']}, self.manifest[1]])
+		self.assertEqual([r['status'] for r in result['results']], ['rejected', 'created'])
+		self.assertIn('file must be', result['results'][0]['error'])
+
+	def test_oversized_batch_is_refused(self):
+		resp = self.client.post('/api/drforms/sync/', {'manifest': json.dumps(self.manifest)}, format='multipart',
+			CONTENT_LENGTH=str(uploads.BatchUploadHandler.max_request_size + 1))
+		self.assertEqual(resp.status_code, 413)
+		self.assertFalse(DRForm.objects.exists())
+
+	def test_zip_bundle(self):
+		bundle = BytesIO()
+		with zipfile.ZipFile(bundle, 'w') as archive:
+			archive.writestr('manifest.json', json.dumps({'items': self.manifest[:2]}))
+			for name in ('a.png', 'b.png'):
+				archive.writestr(name, self.scans[name])
+		bundle.seek(0)
+		resp = self.client.post('/api/drforms/sync/', {'bundle': SimpleUploadedFile('sync.zip', bundle.read())}, format='multipart')
+		self.assertEqual(resp.status_code, 200, resp.content)
+		self.assertEqual(resp.json()['created'], 2)
+		form = DRForm.objects.get(idempotency_key='k-2')
+		self.assertEqual(form.sha256_hash, hashlib.sha256(self.scans['b.png']).hexdigest())
+
+	def test_bad_manifest_is_refused(self):
+		resp = self.client.post('/api/drforms/sync/', {'manifest': 'not json'}, format='multipart')
+		self.assertEqual(resp.status_code, 400)
+
+
+class ResumableUploadTest(TestCase):
+	def setUp(self):
+		self.media = tempfile.mkdtemp()
+		self.settings_override = override_settings(MEDIA_ROOT=self.media, UPLOAD_STAGING_DIR=None)
+		self.settings_override.enable()
+		self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+		self.addCleanup(self.settings_override.disable)
+		self.user = get_user_model().objects.create_user(username='slow-link', password='pw')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+		PollingStation.objects.create(station_id='S-R', name='Remote', district='D', constituency='C')
+		self.png = make_png('purple')
+
+	def start(self, length, **metadata):
+		encoded = ','.join(f"{key} {base64.b64encode(str(value).encode()).decode()}" for key, value in metadata.items())
+		resp = self.client.post('/api/drforms/uploads/', HTTP_UPLOAD_LENGTH=str(length), HTTP_UPLOAD_METADATA=encoded)
+		self.assertEqual(resp.status_code, 201, resp.content)
+		self.assertTrue(resp['Location'].endswith(f"/api/drforms/uploads/{resp.json()['id']}/"))
+		return f"/api/drforms/uploads/{resp.json()['id']}/"
+
+	def patch(self, url, offset, data):
+		return self.client.generic('PATCH', url, data, content_type='application/offset+octet-stream',
+								   HTTP_UPLOAD_OFFSET=str(offset), HTTP_TUS_RESUMABLE='1.0.0')
+
+	def test_chunks_resume_from_the_offset_and_complete_into_a_form(self):
+		digest = hashlib.sha256(self.png).hexdigest()
+		url = self.start(len(self.png), filename='scan.png', polling_station='S-R', totals='{"NUP": 9}', sha256=digest)
+		half = len(self.png) // 2
+
+		resp = self.patch(url, 0, self.png[:half])
+		self.assertEqual((resp.status_code, resp['Upload-Offset']), (204, str(half)))
+		self.assertEqual(self.client.head(url)['Upload-Offset'], str(half))
+		self.assertEqual(self.patch(url, 0, self.png[:half]).status_code, 409)
+
+		# The next chunk lands on a worker that never saw this upload
+		resumable._hashers.clear()
+		resp = self.patch(url, half, self.png[half:])
+		self.assertEqual(resp.status_code, 204, resp.content)
+		form = DRForm.objects.get(pk=resp['Upload-DRForm-Id'])
+		self.assertEqual((form.sha256_hash, form.totals, form.uploaded_by), (digest, {'NUP': 9}, self.user))
+		self.assertEqual(form.image.read(), self.png)
+		self.assertEqual(self.client.get(url).json()['drform'], form.pk)
+		self.assertEqual(os.listdir(resumable.part_dir()), [])
+
+	def test_hash_mismatch_drops_the_upload(self):
+		url = self.start(len(self.png), polling_station='S-R', sha256='0' * 64)
+		resp = self.patch(url, 0, self.png)
+		self.assertEqual((resp.status_code, resp.json()['detail']), (400, 'Hash mismatch'))
+		self.assertEqual(self.client.head(url).status_code, 404)
+		self.assertFalse(DRForm.objects.exists())
+
+	def test_limits_and_video_attachment(self):
+		resp = self.client.post('/api/drforms/uploads/', HTTP_UPLOAD_LENGTH=str(uploads.MAX_UPLOAD_SIZES['image'] + 1),
+								HTTP_UPLOAD_METADATA='polling_station ' + base64.b64encode(b'S-R').decode())
+		self.assertEqual(resp.status_code, 413)
+		url = self.start(4, polling_station='S-R')
+		self.assertEqual(self.patch(url, 0, b'12345').status_code, 413)
+
+		form = DRForm.objects.create(polling_station=PollingStation.objects.get(), uploaded_by=self.user,
+									 image=SimpleUploadedFile('f.png', self.png), sha256_hash='x')
+		video = b'\0\0\0\x18ftypmp42' + b'v' * 100
+		url = self.start(len(video), kind='video', drform=form.pk, filename='count.mp4')
+		self.assertEqual(self.patch(url, 0, video).status_code, 204)
+		form.refresh_from_db()
+		self.assertEqual(form.video.read(), video)
+
+	def test_gc_removes_abandoned_uploads(self):
+		url = self.start(len(self.png), polling_station='S-R')
+		self.patch(url, 0, self.png[:10])
+		fresh = self.start(len(self.png), polling_station='S-R')
+		self.patch(fresh, 0, self.png[:10])
+		stale = resumable.UploadSession.objects.get(pk=url.split('/')[-2])
+		resumable.UploadSession.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=2))
+		with open(os.path.join(resumable.part_dir(), 'orphan.part'), 'wb') as f:
+			f.write(b'x')
+		os.utime(os.path.join(resumable.part_dir(), 'orphan.part'), (0, 0))
+
+		out = StringIO()
+		call_command('gc_uploads', stdout=out)
+		self.assertIn('Removed 1 upload sessions and 2 partial files', out.getvalue())
+		self.assertEqual(self.client.head(url).status_code, 404)
+		self.assertEqual(self.client.head(fresh)['Upload-Offset'], '10')
+		self.assertEqual(os.listdir(resumable.part_dir()), [fresh.split('/')[-2] + '.part'])
+
+
+class QueryBudgetTest(TestCase):
+	"""
+	Every list endpoint must run a fixed number of queries however many rows
+	it returns. Raise a budget only together with a justification.
+	News and summary spend two queries on cache validators, the public feeds
+	six (forms, stations and users).
+	"""
+	BUDGETS = {
+		'/api/drforms/public/': 7,
+		'/api/drforms/public/?page=1': 8,
+		'/api/public_feed/': 7,
+		'/api/drforms/': 2,
+		'/api/verified/': 1,
+		'/api/pending/': 2,
+		'/api/reports/': 1,
+		'/api/reports/?status=verified': 1,
+		'/api/agents/': 2,
+		'/api/polling_stations/': 2,
+		'/api/pollingstations/': 2,
+		'/api/users/': 2,
+		'/api/nup/news/': 3,
+		'/api/results/summary/': 3,
+		'/api/results/national/': 2,
+		'/api/results/district/District/': 2,
+		'/api/results/tree/?stations=true': 1,
+	}
+
+	def setUp(self):
+		self.admin = get_user_model().objects.create_user(username='admin', password='pw', is_staff=True)
+		self.client = APIClient()
+		self.client.force_authenticate(self.admin)
+		self.seeded = 0
+
+	def seed(self, count):
+		for n in range(self.seeded, self.seeded + count):
+			user = get_user_model().objects.create_user(username=f'agent{n}', email=f'agent{n}@example.com')
+			station = PollingStation.objects.create(
+				station_id=f'PS-{n}', name=f'Station {n}', district='District', constituency=f'C{n % 3}'
+			)
+			Agent.objects.create(user=user, full_name=f'Agent {n}', phone='0700', email=user.email,
+				district='District', constituency=station.constituency, polling_station=station)
+			for verified in (True, False):
+				form = DRForm.objects.create(polling_station=station, sha256_hash=f'h{n}', totals={'NUP': n},
+					uploaded_by=user, verified=verified, verified_by=self.admin if verified else None)
+				Report.objects.create(dr_form=form, reported_by=user, reason='blurry')
+			NupNews.objects.create(title=f'News {n}', content='...')
+		self.seeded += count
+		jobs.run_pending()
+
+	def count_queries(self, url):
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200, url)
+		return len(queries)
+
+	def test_list_endpoints_stay_within_budget(self):
+		self.seed(2)
+		small = {url: self.count_queries(url) for url in self.BUDGETS}
+		self.seed(10)
+		for url, budget in self.BUDGETS.items():
+			with self.subTest(url=url):
+				large = self.count_queries(url)
+				self.assertEqual(large, small[url], f'{url} query count grows with the number of rows')
+				self.assertLessEqual(large, budget)
+
+
+class ConditionalGetTest(TestCase):
+	def setUp(self):
+		self.client = APIClient()
+		self.station = PollingStation.objects.create(station_id='C1', name='Cached 1', district='D')
+		DRForm.objects.create(polling_station=self.station, sha256_hash='c1', totals={'NUP': 4}, verified=True)
+		NupNews.objects.create(title='Hello', content='...')
+		jobs.run_pending()
+
+	def test_matching_etag_gets_304_without_serializing(self):
+		# Two queries per source table
+		for url, queries in (('/api/drforms/public/', 6), ('/api/nup/news/', 2), ('/api/results/summary/', 2)):
+			with self.subTest(url=url):
+				first = self.client.get(url)
+				self.assertEqual(first.status_code, 200)
+				self.assertIn('public', first['Cache-Control'])
+				self.assertIn('s-maxage', first['Cache-Control'])
+				with self.assertNumQueries(queries):
+					again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+				self.assertEqual(again.status_code, 304)
+				self.assertEqual(again['ETag'], first['ETag'])
+
+				since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+				self.assertEqual(since.status_code, 304)
+
+	def test_changes_invalidate_the_etag(self):
+		feed = self.client.get('/api/drforms/public/')
+		summary = self.client.get('/api/results/summary/')
+
+		other = PollingStation.objects.create(station_id='C2', name='Cached 2', district='D')
+		DRForm.objects.create(polling_station=other, sha256_hash='c2', totals={'NUP': 6}, verified=True)
+		jobs.run_pending()
+
+		resp = self.client.get('/api/drforms/public/', HTTP_IF_NONE_MATCH=feed['ETag'])
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(len(resp.json()['results']), 2)
+		resp = self.client.get('/api/results/summary/', HTTP_IF_NONE_MATCH=summary['ETag'])
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()[0]['votes'], 10)
+
+	def test_station_and_verifier_changes_invalidate_the_feed(self):
+		verifier = get_user_model().objects.create_user(username='checker')
+		DRForm.objects.update(verified_by=verifier, updated_at=timezone.now())
+		feed = self.client.get('/api/drforms/public/')
+		self.station.name = 'Renamed'
+		self.station.save()
+		resp = self.client.get('/api/drforms/public/', HTTP_IF_NONE_MATCH=feed['ETag'])
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()['results'][0]['polling_station']['name'], 'Renamed')
+
+		verifier.username = 'chief-checker'
+		verifier.save()
+		again = self.client.get('/api/drforms/public/', HTTP_IF_NONE_MATCH=resp['ETag'])
+		self.assertEqual(again.status_code, 200)
+		self.assertEqual(again.json()['results'][0]['verified_by'], 'chief-checker')
+
+	def test_unverified_upload_does_not_bust_the_public_feed(self):
+		feed = self.client.get('/api/drforms/public/')
+		DRForm.objects.create(polling_station=self.station, sha256_hash='c3', totals={'NUP': 1})
+		resp = self.client.get('/api/drforms/public/', HTTP_IF_NONE_MATCH=feed['ETag'])
+		self.assertEqual(resp.status_code, 304)
+
+	def test_posting_news_is_not_cached(self):
+		admin = get_user_model().objects.create_user(username='editor', password='pw')
+		self.client.force_authenticate(admin)
+		resp = self.client.post('/api/nup/news/', {'title': 'New', 'content': 'x'}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		self.assertNotIn('ETag', resp)
+		self.assertFalse(resp.has_header('Cache-Control') and 'public' in resp['Cache-Control'])
+
+
+class LiveResultsTest(TestCase):
+	def setUp(self):
+		self.station = PollingStation.objects.create(station_id='L1', name='Live 1', district='D')
+
+	def test_collect_reports_tally_deltas_and_new_verified_forms(self):
+		hub = live.LiveHub(poll_interval=None)
+		self.assertEqual(hub.collect(), [])  # first call only takes a baseline
+
+		form = DRForm.objects.create(polling_station=self.station, sha256_hash='h', totals={'NUP': 7})
+		jobs.run_pending()
+		form.verified = True
+		form.save()
+		events = hub.collect()
+		self.assertEqual([e.split(b'\n')[0] for e in events], [b'event: tally', b'event: drform'])
+		tally = json.loads(events[0].split(b'data: ')[1])
+		self.assertEqual(tally['delta'], {'NUP': 7, 'NRM': 0})
+		self.assertEqual(hub.collect(), [])
+
+	def test_stream_fans_out_and_drops_oldest_for_slow_readers(self):
+		hub = live.LiveHub(poll_interval=None, buffer=2)
+		hub.collect()
+
+		async def scenario():
+			stream = hub.stream()
+			self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+			self.assertTrue((await stream.__anext__()).startswith(b'event: tally'))
+			for n in range(3):
+				hub.broadcast(live.encode_event('drform', {'n': n}))
+			chunks = [await stream.__anext__() for _ in range(2)]
+			await stream.aclose()
+			return chunks
+
+		chunks = asyncio.run(scenario())
+		self.assertEqual([json.loads(c.split(b'data: ')[1])['n'] for c in chunks], [1, 2])
+		self.assertFalse(hub.subscribers)
+
+	def test_wsgi_requests_get_a_single_snapshot(self):
+		resp = self.client.get('/api/results/live/')
+		self.assertEqual(resp['Content-Type'], 'text/event-stream')
+		self.assertIn(b'event: tally', resp.content)
+
+
+class ResultsExportTest(TestCase):
+	def setUp(self):
+		self.station = PollingStation.objects.create(station_id='E1', name='Export, "1"', district='D', constituency='C')
+		self.verifier = get_user_model().objects.create_user(username='checker', password='pw')
+		self.forms = [
+			DRForm.objects.create(polling_station=self.station, sha256_hash=f'e{n}', totals={'NUP': n, 'NRM': '2', 'ABC': 1},
+								  verified=True, verified_by=self.verifier)
+			for n in range(3)
+		]
+		DRForm.objects.create(polling_station=self.station, sha256_hash='pending', totals={'NUP': 99})
+		# Verified earlier than the export's settle window
+		DRForm.objects.filter(verified=True).update(verified_at=timezone.now() - timedelta(minutes=1))
+
+	def test_csv_streams_verified_forms_and_since_pulls_only_newer_ones(self):
+		resp = self.client.get('/api/results/export/')
+		self.assertEqual(resp.status_code, 200)
+		self.assertTrue(resp.streaming)
+		self.assertEqual(resp['Content-Type'], 'text/csv; charset=utf-8')
+		rows = list(csv.DictReader(io.StringIO(b''.join(resp.streaming_content).decode())))
+		self.assertEqual([int(row['id']) for row in rows], [form.pk for form in self.forms])
+		self.assertEqual(rows[2]['station'], 'Export, "1"')
+		self.assertEqual((rows[2]['NUP'], rows[2]['NRM'], rows[2]['other_votes'], rows[2]['total_votes']), ('2', '2', 'ABC:1', '5'))
+		self.assertEqual(rows[2]['verified_by'], 'checker')
+
+		until = resp['X-Export-Until']
+		newer = self.forms[0]
+		# Verified just after the previous pull's cutoff
+		DRForm.objects.filter(pk=newer.pk).update(verified_at=datetime.fromisoformat(until) + timedelta(microseconds=1))
+		resp = self.client.get('/api/results/export/', {'since': until})
+		rows = list(csv.DictReader(io.StringIO(b''.join(resp.streaming_content).decode())))
+		self.assertEqual([int(row['id']) for row in rows], [newer.pk])
+
+		self.assertEqual(self.client.get('/api/results/export/', {'since': 'yesterday'}).status_code, 400)
+		self.assertEqual(self.client.get('/api/results/export/', {'format': 'xml'}).status_code, 400)
+
+	def test_ndjson_gzip_and_command(self):
+		resp = self.client.get('/api/results/export/', {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip, br')
+		self.assertEqual(resp['Content-Encoding'], 'gzip')
+		lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+		records = [json.loads(line) for line in lines]
+		self.assertEqual(len(records), 3)
+		self.assertEqual(records[0]['totals'], {'NUP': 0, 'NRM': 2, 'ABC': 1})
+		self.assertEqual((records[0]['station_id'], records[0]['sha256']), ('E1', 'e0'))
+
+		path = os.path.join(tempfile.mkdtemp(), 'export.ndjson.gz')
+		self.addCleanup(shutil.rmtree, os.path.dirname(path))
+		call_command('export_results', '--format', 'ndjson', '--gzip', '-o', path, stderr=StringIO())
+		with gzip.open(path, 'rt') as exported:
+			self.assertEqual(exported.read().splitlines(), lines)
+		with self.assertRaises(CommandError):
+			call_command('export_results', '--since', 'soon')
+
+
+class SnapshotPublisherTest(TestCase):
+	def setUp(self):
+		self.root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.root)
+		self.settings_override = override_settings(SNAPSHOTS_ENABLED=True, SNAPSHOT_ROOT=self.root)
+		self.settings_override.enable()
+		self.addCleanup(self.settings_override.disable)
+		self.kira = PollingStation.objects.create(station_id='P1', name='Kira', district='Wakiso', constituency='Kira')
+		self.gulu = PollingStation.objects.create(station_id='P2', name='Gulu', district='Gulu', constituency='Gulu East')
+		self.kira_form = DRForm.objects.create(polling_station=self.kira, sha256_hash='p1', totals={'NUP': 5}, verified=True)
+		DRForm.objects.create(polling_station=self.gulu, sha256_hash='p2', totals={'NUP': 1, 'NRM': 4}, verified=True)
+		jobs.run_pending()
+
+	def manifest(self):
+		with open(os.path.join(self.root, 'manifest.json')) as handle:
+			return json.load(handle)
+
+	def read(self, path):
+		with open(os.path.join(self.root, path), 'rb') as handle:
+			content = handle.read()
+		with open(os.path.join(self.root, path + '.gz'), 'rb') as handle:
+			self.assertEqual(gzip.decompress(handle.read()), content)
+		return json.loads(content)
+
+	def test_changes_rewrite_only_the_files_they_affect(self):
+		manifest = self.manifest()
+		gulu = manifest['regions']['district']['Gulu']
+		wakiso = manifest['regions']['district']['Wakiso']
+		self.assertEqual(self.read(wakiso)['data']['totals'], {'NUP': 5})
+		self.assertEqual(self.read('summary.json')['data']['national']['totals'], {'NUP': 6, 'NRM': 4})
+		self.assertEqual(len(self.read('feed/latest.json')['data']['results']), 2)
+
+		self.kira_form.totals = {'NUP': 7}
+		self.kira_form.save()
+		jobs.run_pending()
+		after = self.manifest()
+		changed = {path for path, entry in after['files'].items() if entry != manifest['files'].get(path)}
+		self.assertEqual(changed, {
+			'summary.json', wakiso, manifest['regions']['constituency']['Kira'], 'feed/0.json', 'feed/latest.json',
+		})
+		self.assertEqual(after['files'][gulu], manifest['files'][gulu])
+		self.assertEqual(self.read(wakiso)['data']['totals'], {'NUP': 7})
+		self.assertEqual(self.read(wakiso)['version'], after['version'])
+
+		# A full publish of unchanged data writes nothing
+		out = StringIO()
+		call_command('publish_snapshots', stdout=out)
+		self.assertIn('Wrote 0 and removed 0', out.getvalue())
+
+	def test_pages_without_verified_forms_are_removed(self):
+		DRForm.objects.all().delete()
+		jobs.run_pending()
+		manifest = self.manifest()
+		self.assertFalse(any(path.startswith('feed/') and path != 'feed/latest.json' for path in manifest['files']))
+		# Regions stay published, as in the API, with nothing counted
+		self.assertEqual(self.read(manifest['regions']['district']['Wakiso'])['data']['stations_reporting'], 0)
+		self.assertFalse(os.path.exists(os.path.join(self.root, 'feed', '0.json.gz')))
+		self.assertEqual(self.read('feed/latest.json')['data'], {'results': [], 'pages': []})
+
+
+class StationDirectoryTest(TestCase):
+	def setUp(self):
+		self.kira = PollingStation.objects.create(station_id='WAK-001', name='Kira Primary School', district='Wakiso', constituency='Kira')
+		self.kiira = PollingStation.objects.create(station_id='JIN-007', name='Kiira College Butiki', district='Jinja', constituency='Butembe')
+		PollingStation.objects.create(station_id='WAK-002', name='Nsasa Market', district='Wakiso', constituency='Kira')
+		PollingStation.objects.create(station_id='WAK-003', name='nsasa  market', district='Wakiso', constituency='Kira')
+		directory.current()
+
+	def validate(self, value):
+		return serializers.DRFormUploadSerializer().validate_polling_station(value)
+
+	def test_refs_resolve_from_memory(self):
+		with self.assertNumQueries(0):
+			self.assertEqual(self.validate(str(self.kira.pk)).station_id, 'WAK-001')
+			self.assertEqual(self.validate('JIN-007'), self.kiira)
+			self.assertEqual(self.validate(' wak-001 '), self.kira)
+			self.assertEqual(self.validate('KIRA  P/S'), self.kira)
+			with self.assertRaisesMessage(ValidationError, 'use the station_id'):
+				self.validate('Nsasa Market')
+		# Misspellings are matched only after checking the database for a newer exact match
+		with self.assertNumQueries(2):
+			self.assertEqual(self.validate('Kira Primary Schol'), self.kira)
+			self.assertEqual(self.validate('Kiira Colege Butiki'), self.kiira)
+		with self.assertRaisesMessage(ValidationError, 'not found'):
+			self.validate('Gulu Main')
+
+	def test_changes_are_picked_up(self):
+		self.kira.name = 'Kira Town Hall'
+		self.kira.save()
+		self.assertEqual(self.validate('kira town hall'), self.kira)
+		# Written without signals (or by another process): found in the database
+		PollingStation.objects.bulk_create([PollingStation(station_id='GUL-001', name='Gulu Main', district='Gulu', constituency='Gulu')])
+		self.assertEqual(self.validate('GUL-001').name, 'Gulu Main')
+		with self.assertNumQueries(1):
+			self.assertEqual(self.validate('gulu main').station_id, 'GUL-001')
@@ -0,0 +1,190 @@
+"""
+Single-pass handling of DR form uploads.
+
+Django's default handlers spool an upload to a temp file, the view then
+re-reads it to hash it, and storage copies it once more into MEDIA_ROOT.
+``HashingUploadHandler`` instead hashes and size-checks each chunk as it
+arrives and writes it to a staging file on the same filesystem as
+MEDIA_ROOT, so saving the form is a rename rather than another copy.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from rest_framework import status
+from rest_framework.response import Response
+
+MB = 1024 * 1024
+
+# Per-field limits, matching DRFormSerializer.validate
+MAX_UPLOAD_SIZES = {
+    'image': 10 * MB,
+    'video': 50 * MB,
+}
+
+# Room for the non-file fields and multipart framing on top of the files
+MAX_FORM_OVERHEAD = 1 * MB
+
+# Total size of one batch sync request (results.sync)
+MAX_SYNC_BYTES = 200 * MB
+
+HASH_HEADER = 'HTTP_X_CONTENT_SHA256'
+
+
+def staging_dir():
+    path = getattr(settings, 'UPLOAD_STAGING_DIR', None) or os.path.join(settings.MEDIA_ROOT, '.staging')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_sha256(uploaded_file):
+    """SHA-256 of an upload, reusing the digest taken while it streamed in."""
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    uploaded_file.seek(0)
+    return sha256.hexdigest()
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """A TemporaryUploadedFile created in the staging directory and carrying its digest."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=staging_dir())
+        super(TemporaryUploadedFile, self).__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Hash, size-check and stage every uploaded file in one streaming pass.
+
+    Oversized files are dropped as soon as they cross their limit (nothing
+    past the limit is kept), and if the client sends ``X-Content-SHA256``
+    the image is rejected on mismatch before it ever reaches storage.
+    Rejections are collected in ``self.rejections`` as ``{field: (status, detail)}``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejections = {}
+        self.expected_hash = (request.META.get(HASH_HEADER) or '').strip().lower() if request else ''
+
+    max_request_size = sum(MAX_UPLOAD_SIZES.values()) + MAX_FORM_OVERHEAD
+
+    def file_limit(self, field_name):
+        return MAX_UPLOAD_SIZES.get(field_name)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        limit = self.max_request_size
+        if content_length and content_length > limit:
+            self.rejections['__all__'] = (
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"Upload too large (max {limit // MB}MB per request).",
+            )
+            # Raising StopUpload here would escape MultiPartParser (it only
+            # catches it while reading parts): parse nothing instead, and the
+            # view answers 413 from the rejection.
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.limit = self.file_limit(field_name)
+        self.sha256 = hashlib.sha256()
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.limit is not None and start + len(raw_data) > self.limit:
+            self.file.close()
+            self.rejections[self.field_name] = (
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"{self.field_name.capitalize()} file too large (max {self.limit // MB}MB).",
+            )
+            raise SkipFile()
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        digest = self.sha256.hexdigest()
+        if self.field_name == 'image' and self.expected_hash and self.expected_hash != digest:
+            self.file.close()
+            self.rejections[self.field_name] = (status.HTTP_400_BAD_REQUEST, 'Hash mismatch')
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = digest
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+class BatchUploadHandler(HashingUploadHandler):
+    """
+    For the batch sync endpoint: any number of image fields (named by the
+    manifest) or one zip ``bundle``, up to ``MAX_SYNC_BYTES`` per request.
+    """
+    max_request_size = MAX_SYNC_BYTES + MAX_FORM_OVERHEAD
+
+    def file_limit(self, field_name):
+        return MAX_SYNC_BYTES if field_name == 'bundle' else MAX_UPLOAD_SIZES['image']
+
+
+def stage_stream(stream, name, limit, chunk_size=64 * 1024):
+    """
+    Copy a readable stream into a staged upload, hashing it on the way.
+    Raises ValueError once more than ``limit`` bytes have been read.
+    """
+    staged = StagedUploadedFile(name, 'application/octet-stream', 0, None)
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"{name} too large (max {limit // MB}MB).")
+            sha256.update(chunk)
+            staged.write(chunk)
+    except BaseException:
+        staged.close()
+        raise
+    staged.seek(0)
+    staged.size = size
+    staged.sha256 = sha256.hexdigest()
+    return staged
+
+
+class StreamingUploadMixin:
+    """
+    View mixin installing ``upload_handler_class`` (``HashingUploadHandler``)
+    for the request. Call ``upload_rejection()`` after touching ``request.data``.
+    """
+    upload_handler_class = HashingUploadHandler
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.upload_handler = self.upload_handler_class(request)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def upload_rejection(self):
+        handler = getattr(self, 'upload_handler', None)
+        if handler is None or not handler.rejections:
+            return None
+        code, detail = next(iter(handler.rejections.values()))
+        return Response({'detail': detail}, status=code)
@@ -17,12 +17,14 @@ from .views import (
     current_user, 
 )
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     # JWT Auth
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('agents/create/', create_agent, name='create_agent'),
+    path('agents/bulk/', views.bulk_create_agents, name='bulk_create_agents'),
     # path('agents/create/', AgentCreateView.as_view(), name='agent-create'),
     #path('create_agent/', views.create_agent, name='create_agent'),
     path("user/", CurrentUserView.as_view(), name="current_user"),
@@ -31,8 +33,17 @@ urlpatterns = [
     path("drforms/", DRFormListCreateView.as_view(), name="drform-list"),      # ✅ list all /api/drforms/?verified=true&page=1
     path('pollingstations/', PollingStationListCreateView.as_view()),
     path("drforms/upload/", DRFormUploadView.as_view(), name="drform-upload"),
+    path("drforms/sync/", views.DRFormSyncView.as_view(), name="drform-sync"),
+    path("drforms/uploads/", views.ResumableUploadCreateView.as_view(), name="drform-resumable-create"),
+    path("drforms/uploads/<uuid:pk>/", views.ResumableUploadView.as_view(), name="drform-resumable"),
     path("pending/", PendingListView.as_view(), name="pending-list"),
     path("drforms/<int:pk>/verify/", DRFormVerifyView.as_view(), name="drform-verify"),
+    path("drforms/verify/", views.verify_drforms, name="drform-verify-batch"),
+    path("moderation/claim/", views.claim_drforms, name="moderation-claim"),
+    path("moderation/release/", views.release_drforms, name="moderation-release"),
+    path("moderation/stats/", views.moderation_stats, name="moderation-stats"),
+    path("conflicts/", views.StationConflictListView.as_view(), name="conflict-list"),
+    path("conflicts/<str:station_id>/resolve/", views.resolve_conflict, name="conflict-resolve"),
     path("verified/", VerifiedListView.as_view(), name="verified-list"),
     path("drforms/public/", PublicFeedView.as_view(), name="drform-public"),
 
@@ -45,5 +56,13 @@ urlpatterns = [
     path('polling_stations/', views.polling_stations, name='polling_stations'),
     path('nup/news/', views.nup_news, name='nup_news'),
     path("results/summary/", views.results_summary, name="results_summary"),
+    path("results/national/", views.national_rollup, name="results_national"),
+    path("results/district/<str:name>/", views.district_rollup, name="results_district"),
+    path("results/constituency/<str:name>/", views.constituency_rollup, name="results_constituency"),
+    path("results/station/<str:station_id>/", views.station_rollup, name="results_station"),
+    path("results/tree/", views.results_tree, name="results_tree"),
+    path("results/live/", views.live_results, name="results_live"),
+    path("results/export/", views.export_results, name="results_export"),
+    path("_metrics", metrics_view, name="metrics"),
 
 ]
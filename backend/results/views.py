@@ -1,7 +1,6 @@
 from django.shortcuts import render
 
 # Create your views here.
-import hashlib
 from rest_framework import generics, status, filters, viewsets, permissions, parsers
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
@@ -9,33 +8,50 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
-from .models import DRForm, PollingStation, User, Report, AbstractUser, Agent, NupNews, Result
-from .serializers import DRFormUploadSerializer, DRFormPublicSerializer, DRFormSerializer, UserSerializer, PollingStationSerializer, ReportSerializer,AgentSerializer, AgentRegisterSerializer, NupNewsSerializer
+from .models import DRForm, PollingStation, User, Report, AbstractUser, Agent, NupNews, Result, RegionTally, PartyTally, UploadSession, StationFormGroup
+from .serializers import DRFormUploadSerializer, DRFormPublicSerializer, DRFormSerializer, UserSerializer, PollingStationSerializer, ReportSerializer,AgentSerializer, AgentRegisterSerializer, NupNewsSerializer, RegionTallySerializer, DRFormBatchVerifySerializer, StationConflictSerializer, ConflictResolveSerializer
 from .permissions import IsAgent
+from . import conflicts, directory, export, moderation, resumable, sync, tallies
+from .pagination import KeysetPagination, BoundedPagination
+from .uploads import BatchUploadHandler, StreamingUploadMixin, file_sha256
+from .importers import detect_format, provision_agents, read_records
+from .caching import public_cache
+from .publisher import ROLLUP_CHILD_LEVEL, rollup
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum
-
-
-class DRFormUploadView(generics.CreateAPIView):
+from django.db.models import Prefetch, Q, Sum
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+from django.urls import reverse
+from django.conf import settings
+import io
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from asgiref.sync import sync_to_async
+from .live import current_tally_event, hub
+
+
+class DRFormUploadView(StreamingUploadMixin, generics.CreateAPIView):
     serializer_class = DRFormUploadSerializer
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
+        # Oversized files / hash mismatches were already refused while streaming
+        rejection = self.upload_rejection()
+        if rejection:
+            return rejection
         serializer.is_valid(raise_exception=True)
 
         image_file = request.FILES.get('image')
         provided_hash = serializer.validated_data.get('sha256_hash')
 
-        # Verify hash
+        # Verify hash (computed by the upload handler as the file streamed in)
         if image_file:
-            sha256 = hashlib.sha256()
-            for chunk in image_file.chunks():
-                sha256.update(chunk)
-            computed_hash = sha256.hexdigest()
+            computed_hash = file_sha256(image_file)
 
             if provided_hash and provided_hash != computed_hash:
                 return Response({'detail': 'Hash mismatch'}, status=status.HTTP_400_BAD_REQUEST)
@@ -50,6 +66,128 @@ class DRFormUploadView(generics.CreateAPIView):
             'status': 'uploaded'
         }, status=status.HTTP_201_CREATED)
     
+class DRFormSyncView(StreamingUploadMixin, APIView):
+    """
+    Batch upload for agents syncing forms collected offline (see results.sync).
+    Multipart with `manifest` (JSON list of {key, polling_station, file, totals,
+    sha256?, gps?}) plus one file field per item, or a zip `bundle` holding
+    manifest.json and the files. Every item gets its own outcome.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+    upload_handler_class = BatchUploadHandler
+
+    def post(self, request):
+        request.data  # parse (and stage) the whole body before looking at rejections
+        too_large = self.upload_handler.rejections.pop('__all__', None)
+        if too_large:
+            return Response({'detail': too_large[1]}, status=too_large[0])
+        file_errors = {field: detail for field, (_, detail) in self.upload_handler.rejections.items()}
+
+        staged = []
+        try:
+            if 'bundle' in request.FILES:
+                if 'bundle' in file_errors:
+                    return Response({'detail': file_errors['bundle']}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                manifest, files, bundle_errors = sync.open_bundle(request.FILES['bundle'])
+                staged = list(files.values())
+                file_errors.update(bundle_errors)
+            else:
+                manifest = sync.parse_manifest(request.data.get('manifest') or '')
+                files = {name: request.FILES[name] for name in request.FILES}
+            results = sync.sync_forms(request.user, manifest, files, file_errors)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            for upload in staged:
+                upload.close()
+
+        counts = {outcome: 0 for outcome in (sync.CREATED, sync.DUPLICATE, sync.REJECTED)}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results})
+
+
+def _tus_headers(session):
+    return {
+        'Tus-Resumable': resumable.TUS_VERSION,
+        'Upload-Offset': str(session.offset),
+        'Upload-Length': str(session.length),
+        'Upload-Expires': http_date(resumable.expires_at(session).timestamp()),
+        'Cache-Control': 'no-store',
+    }
+
+
+class ResumableUploadCreateView(APIView):
+    """
+    Start a resumable upload (see results.resumable): tus `Upload-Length` and
+    `Upload-Metadata` headers, or the same fields as a JSON body.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            metadata = resumable.parse_metadata(request.headers.get('Upload-Metadata'))
+            length = request.headers.get('Upload-Length')
+            if not metadata and not length:
+                metadata = dict(request.data.items())
+                length = metadata.get('length')
+            session = resumable.create_session(request.user, length, metadata)
+        except resumable.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status_code)
+        location = request.build_absolute_uri(reverse('drform-resumable', args=[session.pk]))
+        return Response(
+            {'id': str(session.pk), 'offset': 0, 'length': session.length},
+            status=status.HTTP_201_CREATED, headers={**_tus_headers(session), 'Location': location},
+        )
+
+
+class ResumableUploadView(APIView):
+    """HEAD / GET the offset, PATCH the next chunk, DELETE to abandon."""
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, pk):
+        return get_object_or_404(UploadSession, pk=pk, user=request.user)
+
+    def head(self, request, pk):
+        return Response(headers=_tus_headers(self.get_session(request, pk)))
+
+    def get(self, request, pk):
+        session = self.get_session(request, pk)
+        return Response({
+            'id': str(session.pk),
+            'kind': session.kind,
+            'offset': session.offset,
+            'length': session.length,
+            'complete': session.completed_at is not None,
+            'drform': session.drform_id if session.completed_at else None,
+        }, headers=_tus_headers(session))
+
+    def patch(self, request, pk):
+        session = self.get_session(request, pk)
+        if request.content_type.split(';')[0].strip() != resumable.CONTENT_TYPE:
+            return Response({'detail': f"Content-Type must be {resumable.CONTENT_TYPE}."},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            content_length = int(request.META['CONTENT_LENGTH']) if request.META.get('CONTENT_LENGTH') else None
+        except (KeyError, ValueError):
+            return Response({'detail': "Upload-Offset is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Read the raw body: request.data would parse (and buffer) it
+            form = resumable.append(session, offset, request._request, content_length)
+        except resumable.UploadError as exc:
+            return Response({'detail': exc.detail}, status=exc.status_code)
+        headers = _tus_headers(session)
+        if form is not None:
+            headers['Upload-DRForm-Id'] = str(form.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=headers)
+
+    def delete(self, request, pk):
+        resumable.discard(self.get_session(request, pk))
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Tus-Resumable': resumable.TUS_VERSION})
+
+
 class PollingStationListCreateView(generics.ListCreateAPIView):
     queryset = PollingStation.objects.all()
     serializer_class = PollingStationSerializer
@@ -61,37 +199,167 @@ class DRFormVerifyView(generics.GenericAPIView):
     lookup_field = 'pk'
 
     def post(self, request, pk):
-        try:
-            dr_form = DRForm.objects.get(pk=pk)
-            dr_form.verified = True
-            dr_form.verified_by = request.user
-            dr_form.save()
-            return Response({"success": True, "id": dr_form.id,  "verified_by": str(request.user)}, status=status.HTTP_200_OK)
-        except DRForm.DoesNotExist:
+        # Same single-UPDATE path as the batch endpoint
+        outcome = moderation.verify_forms(request.user, ids=[pk])[pk]
+        if outcome == moderation.NOT_FOUND:
             return Response({"error": "Not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"success": True, "id": pk,  "verified_by": str(request.user)}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def verify_drforms(request):
+    """
+    Verify many DR forms in one transaction.
+    Body: {"ids": [1, 2, ...]} or {"filter": {"district": "...", ...}, "limit": 500}.
+    """
+    serializer = DRFormBatchVerifySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    outcomes = moderation.verify_forms(
+        request.user, ids=data.get('ids'), filters=data.get('filter'), limit=data['limit']
+    )
+    counts = {key: 0 for key in (moderation.VERIFIED, moderation.ALREADY_VERIFIED, moderation.NOT_FOUND)}
+    for outcome in outcomes.values():
+        counts[outcome] += 1
+    return Response({
+        **counts,
+        'results': [{'id': pk, 'status': outcome} for pk, outcome in outcomes.items()],
+    })
+
+# -------------------------------
+# Moderation queue (leases, see results.moderation)
+# -------------------------------
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def claim_drforms(request):
+    """
+    Lease the next `limit` pending forms (default 10) to the caller for
+    `moderation.CLAIM_SECONDS`. Calling again renews the forms already held.
+    """
+    try:
+        limit = int(request.data.get('limit', 10))
+    except (TypeError, ValueError):
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, moderation.MAX_CLAIM))
+    pks, expires = moderation.claim_forms(request.user, limit)
+    forms = DRForm.objects.filter(pk__in=pks).select_related(
+        'polling_station', 'uploaded_by', 'verified_by'
+    ).order_by('timestamp', 'id')
+    return Response({
+        'lease_expires_at': expires,
+        'results': DRFormSerializer(forms, many=True, context={'request': request}).data,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def release_drforms(request):
+    """Give claimed forms back to the queue. Body: {"ids": [...]}."""
+    ids = request.data.get('ids')
+    # bool is an int subclass; true would otherwise release form 1
+    if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return Response({'error': 'ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'released': moderation.release_forms(request.user, ids)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def moderation_stats(request):
+    return Response(moderation.queue_stats())
+
+
+class ConflictPagination(KeysetPagination):
+    timestamp_field = 'conflict_since'
+
+
+def conflict_groups():
+    return StationFormGroup.objects.select_related('station').prefetch_related(
+        Prefetch('station__drform_set', queryset=DRForm.objects.select_related('uploaded_by').order_by('id'))
+    )
+
+
+class StationConflictListView(generics.ListAPIView):
+    """Stations whose forms disagree (totals or scans), newest conflicts first; ?resolved=true|false."""
+    permission_classes = [IsAdminUser]
+    serializer_class = StationConflictSerializer
+    pagination_class = ConflictPagination
+
+    def get_queryset(self):
+        queryset = conflict_groups().filter(conflict_since__isnull=False)
+        resolved = self.request.query_params.get('resolved')
+        if resolved in ('true', 'false'):
+            queryset = queryset.filter(pinned=resolved == 'true')
+        return queryset
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def resolve_conflict(request, station_id):
+    """Pin the form counted for a station: {"canonical": <form id>}."""
+    serializer = ConflictResolveSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    form = get_object_or_404(
+        DRForm, pk=serializer.validated_data['canonical'], polling_station__station_id=station_id
+    )
+    conflicts.pin(form)
+    group = conflict_groups().get(station_id=form.polling_station_id)
+    return Response(StationConflictSerializer(group, context={'request': request}).data)
+
 
 class SmallPagination(PageNumberPagination):
     page_size = 20  # or any small number for testing
 
 
+class PublicFeedPagination(KeysetPagination):
+    # ?cursor=... (default) or the old ?page=N mode
+    page_size = 20
+    page_mode_class = SmallPagination
+
+
+def feed_sources(forms):
+    # Forms are rendered with their station and the verifier/uploader's name
+    return [(forms, 'updated_at'), (PollingStation.objects.all(), 'updated_at'), (User.objects.all(), 'updated_at')]
+
+
+def verified_forms(request, *args, **kwargs):
+    return feed_sources(DRForm.objects.filter(verified=True))
+
+
+def listed_forms(request, *args, **kwargs):
+    verified = request.query_params.get("verified", "true")
+    return feed_sources(DRForm.objects.filter(verified=(verified.lower() == "true")))
+
+
+@method_decorator(public_cache(verified_forms), name='get')
 class PublicFeedView(generics.ListAPIView):
     serializer_class = DRFormPublicSerializer
     permission_classes = (AllowAny,)
-    # Serve the full public feed (no pagination) so frontend can fetch all posts
-    pagination_class = SmallPagination
+    pagination_class = PublicFeedPagination
 
     def get_queryset(self):
         # Only show verified forms to public
-        return DRForm.objects.filter(verified=True).order_by('-id')
+        return DRForm.objects.filter(verified=True).select_related('polling_station', 'verified_by').order_by('-timestamp', '-id')
 
 class PendingListView(generics.ListAPIView):
-    queryset = DRForm.objects.filter(Q(verified=False) | Q(verified__isnull=True)).order_by('-timestamp')
+    # verified is NOT NULL; a plain equality lets the planner use drform_pending_idx
+    queryset = DRForm.objects.filter(verified=False).select_related(
+        'polling_station', 'uploaded_by', 'verified_by'
+    ).order_by('-timestamp', '-id')
     serializer_class = DRFormSerializer
-    pagination_class = None  
+    pagination_class = BoundedPagination
+
+
+class VerifiedFeedPagination(KeysetPagination):
+    page_mode_class = PageNumberPagination
+
 
 class VerifiedListView(generics.ListAPIView):
-    queryset = DRForm.objects.filter(verified=True)
+    queryset = DRForm.objects.filter(verified=True).select_related(
+        'polling_station', 'uploaded_by', 'verified_by'
+    ).order_by('-timestamp', '-id')
     serializer_class = DRFormSerializer
+    pagination_class = VerifiedFeedPagination
 
     
 class SafePaginator(PageNumberPagination):
@@ -117,18 +385,28 @@ class DRFormPagination(PageNumberPagination):
     max_page_size = 20
 
 
+class DRFormFeedPagination(KeysetPagination):
+    page_size = 5
+    max_page_size = 20
+    page_mode_class = DRFormPagination
+
+
+@method_decorator(public_cache(listed_forms), name='get')
 class DRFormListView(generics.ListAPIView):
     """
-    Public feed view that supports infinite scroll via pagination.
+    Public feed view that supports infinite scroll via cursor pagination
+    (follow `next`); `?page=N` still selects the old page-number mode.
     Returns only verified DR forms, ordered by most recent.
     """
     serializer_class = DRFormSerializer
     permission_classes = (AllowAny,)
-    pagination_class = DRFormPagination
+    pagination_class = DRFormFeedPagination
 
     def get_queryset(self):
         verified = self.request.query_params.get("verified", "true")
-        queryset = DRForm.objects.filter(verified=(verified.lower() == "true")).order_by("-timestamp")
+        queryset = DRForm.objects.filter(verified=(verified.lower() == "true")).select_related(
+            "polling_station", "uploaded_by", "verified_by"
+        ).order_by("-timestamp", "-id")
         return queryset
     
 class UserListView(generics.ListAPIView):
@@ -152,7 +430,7 @@ def current_user(request):
     return Response(serializer.data)
 
 class DRFormListCreateView(generics.ListCreateAPIView):
-    queryset = DRForm.objects.all()
+    queryset = DRForm.objects.select_related('polling_station', 'uploaded_by', 'verified_by')
     serializer_class = DRFormSerializer
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
 
@@ -163,13 +441,15 @@ class AgentCreateView(generics.CreateAPIView):
 
 @api_view(['GET'])
 def reports_list(request):
+    # Reports have no status of their own; filter on the reported form's state
+    reports = Report.objects.select_related(
+        'reported_by', 'dr_form__polling_station', 'dr_form__uploaded_by', 'dr_form__verified_by'
+    ).order_by('-created_at')
     status = request.GET.get('status')
     if status == 'verified':
-        reports = Report.objects.filter(status='verified')
+        reports = reports.filter(dr_form__verified=True)
     elif status == 'pending':
-        reports = Report.objects.filter(status='pending')
-    else:
-        reports = Report.objects.all()
+        reports = reports.filter(dr_form__verified=False)
 
     serializer = ReportSerializer(reports, many=True)
     return Response(serializer.data)
@@ -184,16 +464,18 @@ def register_agent(request):
 
 @api_view(["GET"])
 def list_agents(request):
-    agents = Agent.objects.all()
+    paginator = BoundedPagination()
+    agents = paginator.paginate_queryset(Agent.objects.order_by('id'), request)
     serializer = AgentSerializer(agents, many=True)
-    return Response(serializer.data)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET', 'POST'])
 def polling_stations(request):
     if request.method == 'GET':
-        stations = PollingStation.objects.all()
+        paginator = BoundedPagination()
+        stations = paginator.paginate_queryset(PollingStation.objects.order_by('station_id'), request)
         serializer = PollingStationSerializer(stations, many=True)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     elif request.method == 'POST':
         serializer = PollingStationSerializer(data=request.data)
@@ -221,15 +503,19 @@ def create_agent(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    # ✅ Create or get PollingStation automatically
-    station, created = PollingStation.objects.get_or_create(
-        name=data['polling_station'],
-        defaults={
-            'station_id': f"PS-{Agent.objects.count() + 1}",
-            'district': data['district'],
-            'constituency': data['constituency']
-        }
-    )
+    # ✅ Find the PollingStation by (normalized) name, or create it
+    try:
+        station = directory.resolve(data['polling_station'], fuzzy=False)
+    except directory.AmbiguousStation:
+        return Response({"error": "Several polling stations have this name; use the station_id."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if station is None:
+        station = PollingStation.objects.create(
+            name=data['polling_station'].strip(),
+            station_id=f"PS-{Agent.objects.count() + 1}",
+            district=data['district'],
+            constituency=data['constituency'],
+        )
 
     # ✅ Create a new user account for the agent
     if User.objects.filter(username=data['email']).exists():
@@ -264,7 +550,35 @@ def create_agent(request):
         }
     }, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def bulk_create_agents(request):
+    """
+    Provision many agents at once from an uploaded CSV/NDJSON `file` or a
+    JSON body `{"agents": [...]}` (same fields as create_agent).
+    Good rows are committed; bad rows are reported with their line number.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        records = read_records(stream, detect_format(upload.name))
+    elif isinstance(request.data.get('agents'), list):
+        records = enumerate(request.data['agents'], start=1)
+    else:
+        return Response(
+            {"error": "Upload a CSV as 'file' or send a JSON list as 'agents'."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    created, rejected = provision_agents(records, workers=settings.PROVISIONING_WORKERS)
+    return Response({
+        "message": f"✅ {len(created)} agents created, {len(rejected)} rejected.",
+        "created": created,
+        "rejected": rejected,
+    }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET', 'POST'])
+@public_cache(lambda request: [(NupNews.objects.all(), 'updated_at')])
 def nup_news(request):
     if request.method == 'GET':
         news = NupNews.objects.all().order_by('-created_at')
@@ -278,22 +592,123 @@ def nup_news(request):
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
+async def live_results(request):
+    """
+    Server-Sent Events stream of tally changes (`event: tally`) and newly
+    verified DR forms (`event: drform`). Serve under ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held for the life of the stream: send the
+        # current totals once and let EventSource reconnect (retry: 3s).
+        body = b"retry: 3000\n\n" + await sync_to_async(current_tally_event)()
+        response = HttpResponse(body, content_type="text/event-stream")
+    else:
+        response = StreamingHttpResponse(hub.stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 @api_view(['GET'])
+@public_cache(lambda request: [(PartyTally.objects.all(), 'updated_at')])
 def results_summary(request):
     """
     Returns total votes for NUP and NRM across all DR forms.
+    Served from the incrementally maintained tallies (see results.tallies).
     """
-    nup_total = 0
-    nrm_total = 0
-
-    forms = DRForm.objects.all()
-    for form in forms:
-        totals = form.totals or {}
-        nup_total += int(totals.get("NUP", 0))
-        nrm_total += int(totals.get("NRM", 0))
-
-    data = [
-        {"party": "NUP", "votes": nup_total},
-        {"party": "NRM", "votes": nrm_total}
-    ]
+    return Response(tallies.summary())
+
+
+# -------------------------------
+# Regional rollups (served from RegionTally, never from DRForm)
+# -------------------------------
+def _rollup_response(level, name):
+    data = rollup(level, name)
+    if data is None:
+        return Response({"error": "No verified results for this area yet."}, status=status.HTTP_404_NOT_FOUND)
     return Response(data)
+
+
+@api_view(['GET'])
+def national_rollup(request):
+    return _rollup_response(RegionTally.NATIONAL, '')
+
+
+@api_view(['GET'])
+def district_rollup(request, name):
+    return _rollup_response(RegionTally.DISTRICT, name)
+
+
+@api_view(['GET'])
+def constituency_rollup(request, name):
+    return _rollup_response(RegionTally.CONSTITUENCY, name)
+
+
+@api_view(['GET'])
+def station_rollup(request, station_id):
+    return _rollup_response(RegionTally.STATION, station_id)
+
+
+@api_view(['GET'])
+def results_tree(request):
+    """
+    National -> district -> constituency tree of verified totals.
+    Pass ?stations=true to include polling stations as leaves.
+    """
+    rows = RegionTally.objects.all()
+    if request.query_params.get("stations", "false").lower() != "true":
+        rows = rows.exclude(level=RegionTally.STATION)
+
+    nodes = {}
+    for row in rows:
+        node = RegionTallySerializer(row).data
+        if row.level != RegionTally.STATION:
+            node["children"] = []
+        nodes[(row.level, row.name)] = node
+
+    parent_level = {child: parent for parent, child in ROLLUP_CHILD_LEVEL.items()}
+    for (level, name), node in nodes.items():
+        if level == RegionTally.NATIONAL:
+            continue
+        parent = nodes.get((parent_level[level], node["parent"]))
+        if parent is not None:
+            parent["children"].append(node)
+
+    root = nodes.get((RegionTally.NATIONAL, ''))
+    if root is None:
+        return Response({"level": RegionTally.NATIONAL, "name": "", "totals": {}, "forms_reported": 0,
+                         "stations_reporting": 0, "updated_at": None, "children": []})
+    return Response(root)
+
+
+# -------------------------------
+# Bulk export (plain Django view: DRF would read ?format= as a renderer)
+# -------------------------------
+@require_GET
+def export_results(request):
+    """
+    Every verified DR form as CSV (default) or NDJSON (?format=ndjson),
+    streamed with flat memory; gzipped for clients that accept it.
+    ?since=<X-Export-Until of the previous pull> for incremental pulls.
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in export.CONTENT_TYPES:
+        return JsonResponse({"detail": f"format must be one of: {', '.join(export.CONTENT_TYPES)}."}, status=400)
+    since = None
+    if request.GET.get("since"):
+        try:
+            since = export.parse_since(request.GET["since"])
+        except ValueError as exc:
+            return JsonResponse({"detail": str(exc)}, status=400)
+
+    until = export.export_until()
+    compress = "gzip" in request.headers.get("Accept-Encoding", "")
+    response = StreamingHttpResponse(
+        export.stream(fmt, since, until, compress=compress), content_type=export.CONTENT_TYPES[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="verified-results.{fmt}"'
+    response["X-Export-Until"] = until.isoformat()
+    response["Cache-Control"] = "no-store"
+    response["Vary"] = "Accept-Encoding"
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    return response
@@ -0,0 +1,89 @@
+"""
+Typed per-party votes: ``Result`` rows mirroring ``DRForm.totals``.
+
+The JSON totals stay the source of truth for now; every save that changes
+a form's totals (or station) rewrites its rows in the same transaction
+(results.signals), and ``manage.py backfill_results`` converts forms saved
+before that. With the rows in place, full recounts are ``SUM … GROUP BY``
+in the database instead of parsing every form's JSON in Python.
+
+Rows hold exactly ``tallies.parse_totals``, the votes the tallies count:
+whole, non-negative numbers (too large ones and too long party names are
+left out of both).
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from . import tallies
+from .models import DRForm, Result, StationFormGroup
+
+
+def parse(totals):
+    """``{party: votes}`` as stored in Result rows."""
+    return tallies.parse_totals(totals)
+
+
+def rows_for(form_id, station_id, totals):
+    return [
+        Result(dr_form_id=form_id, polling_station_id=station_id, party=party, votes=votes)
+        for party, votes in parse(totals).items()
+    ]
+
+
+def write(form, created=False):
+    """Replace the rows of ``form`` (dual write, called from post_save)."""
+    with transaction.atomic():
+        if not created:
+            Result.objects.filter(dr_form=form).delete()
+        Result.objects.bulk_create(rows_for(form.pk, form.polling_station_id, form.totals))
+
+
+def backfill(batch_size=2000, dry_run=False, on_progress=None):
+    """
+    Walk every form in id order and (re)write the rows of those whose rows
+    are missing or differ from their totals. Safe to re-run and to run
+    while forms are being uploaded. Returns ``(forms checked, forms written)``.
+    """
+    checked = written = 0
+    last = 0
+    while True:
+        batch = list(
+            DRForm.objects.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', 'polling_station_id', 'totals')[:batch_size]
+        )
+        if not batch:
+            break
+        last = batch[-1][0]
+        stored = {}
+        for form_id, station_id, party, votes in Result.objects.filter(
+            dr_form_id__in=[pk for pk, _, _ in batch]
+        ).values_list('dr_form_id', 'polling_station_id', 'party', 'votes'):
+            stored.setdefault(form_id, (station_id, {}))[1][party] = votes
+
+        stale = [
+            (pk, station_id, totals) for pk, station_id, totals in batch
+            if stored.get(pk, (station_id, {})) != (station_id, parse(totals))
+        ]
+        checked += len(batch)
+        written += len(stale)
+        if stale and not dry_run:
+            with transaction.atomic():
+                Result.objects.filter(dr_form_id__in=[pk for pk, _, _ in stale]).delete()
+                Result.objects.bulk_create(
+                    [row for pk, station_id, totals in stale for row in rows_for(pk, station_id, totals)],
+                    batch_size=1000, ignore_conflicts=True,
+                )
+        if on_progress:
+            on_progress(checked, written)
+    return checked, written
+
+
+def canonical_rows():
+    """Result rows of the form each station counts (see results.conflicts)."""
+    return Result.objects.filter(dr_form_id__in=StationFormGroup.objects.values('canonical_id'))
+
+
+def party_totals(rows=None):
+    """``{party: votes}`` summed in SQL, over the canonical forms by default."""
+    rows = canonical_rows() if rows is None else rows
+    return dict(rows.order_by().values_list('party').annotate(total=Sum('votes')).values_list('party', 'total'))